@@ -0,0 +1,14 @@
+"""
+The FastAPI app with fake chat models, for serving under gunicorn in benchmarks.
+
+The fakes are configured by BENCHMARK_ARGS, a JSON object of `benchmarks.run` arguments.
+"""
+import argparse
+import json
+import os
+
+from benchmarks.run import install_fake_models
+
+install_fake_models(argparse.Namespace(**json.loads(os.environ["BENCHMARK_ARGS"])))
+
+from main import app
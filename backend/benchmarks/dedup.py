@@ -0,0 +1,141 @@
+"""
+Benchmark of near-duplicate source detection on a synthetic corpus of syndicated articles.
+
+Run from the backend directory:
+
+    python -m benchmarks.dedup --articles 200 --copies 3 --edit-rate 0.05
+
+Each original article gets up to `--copies` republished copies with their own byline and footer,
+a paragraph dropped or added at random, and `--edit-rate` of their words changed. Copies should be
+collapsed into their original and distinct articles kept apart.
+"""
+import argparse
+import json
+import time
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.ranking import make_page, make_vocabulary
+from benchmarks.run import percentiles
+from dedup import NEAR_DUPLICATE_THRESHOLD, collapse_near_duplicates, minhash
+
+
+
+def make_copy(page: str, outlet: int, edit_rate: float, vocabulary: np.ndarray, rng: np.random.Generator) -> str:
+    """
+    Republishes a page the way another outlet might: new byline and footer, a paragraph dropped or
+    added, and a share of words edited.
+    """
+    paragraphs = page.split("\n\n")
+    if len(paragraphs) > 2 and rng.random() < 0.5:
+        del paragraphs[rng.integers(len(paragraphs))]
+    else:
+        paragraphs.insert(rng.integers(len(paragraphs) + 1), " ".join(rng.choice(vocabulary, 60)) + ".")
+    words = "\n\n".join(paragraphs).split(" ")
+    for i in np.flatnonzero(rng.random(len(words)) < edit_rate):
+        words[i] = str(rng.choice(vocabulary))
+    return f"By Outlet {outlet} staff and wire reports\n\n{' '.join(words)}\n\nShare this story. Copyright Outlet {outlet}."
+
+
+
+def make_corpus(articles: int, copies: int, page_chars: int, edit_rate: float, seed: int) -> tuple[list[dict], dict[str, str]]:
+    """
+    Returns one search response holding every article and copy, and each source's original URL.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = make_vocabulary(20000, rng)
+    results, originals = [], {}
+    for article in range(articles):
+        page = make_page(page_chars, vocabulary, rng)
+        url = f"https://wire.example.com/{article}"
+        results.append({"title": f"Story {article}", "url": url, "content": page[:300], "score": float(rng.uniform(0.5, 0.95)), "raw_content": page})
+        originals[url] = url
+        for outlet in range(rng.integers(0, copies + 1)):
+            copy_url = f"https://outlet{outlet}.example.com/{article}"
+            copy = make_copy(page, outlet, edit_rate, vocabulary, rng)
+            results.append({"title": f"Story {article}", "url": copy_url, "content": copy[:300], "score": float(rng.uniform(0.3, 0.95)), "raw_content": copy})
+            originals[copy_url] = url
+    order = rng.permutation(len(results))
+    return [{"query": "benchmark", "results": [results[i] for i in order]}], originals
+
+
+
+def run(articles: int, copies: int, page_chars: int, edit_rate: float, threshold: float, trials: int, seed: int) -> dict:
+    responses, originals = make_corpus(articles, copies, page_chars, edit_rate, seed)
+    sources = responses[0]["results"]
+
+    per_source = []
+    for source in sources:
+        start = time.perf_counter()
+        minhash(f"{source['content']}\n\n{source['raw_content']}")
+        per_source.append(time.perf_counter() - start)
+
+    times = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        collapsed, stats = collapse_near_duplicates(responses, threshold)
+        times.append(time.perf_counter() - start)
+
+    # A kept source should stand for exactly one story, and every copy of it should be folded in
+    kept = collapsed[0]["results"]
+    story_sizes: dict[str, int] = {}
+    for url, original in originals.items():
+        story_sizes[original] = story_sizes.get(original, 0) + 1
+    correct = wrong = 0
+    for source in kept:
+        group = [source["url"], *source.get("alternate_urls", [])]
+        stories = {originals[url] for url in group}
+        if len(stories) == 1 and story_sizes[stories.pop()] == len(group):
+            correct += 1
+        else:
+            wrong += 1
+    collapsed_copies = sum(
+        originals[url] == originals[source["url"]] for source in kept for url in source.get("alternate_urls", [])
+    )
+    false_merges = sum(len(source.get("alternate_urls", [])) for source in kept) - collapsed_copies
+    input_chars = sum(len(source["raw_content"]) for source in sources)
+    return {
+        "sources": len(sources),
+        "stories": articles,
+        "copies": len(sources) - articles,
+        "page_chars": page_chars,
+        "edit_rate": edit_rate,
+        "threshold": threshold,
+        "per_source_ms": percentiles([seconds * 1000 for seconds in per_source]),
+        "collapse_seconds": percentiles(times),
+        "copies_collapsed": collapsed_copies,
+        "false_merges": false_merges,
+        "recall": round(collapsed_copies / max(len(sources) - articles, 1), 4),
+        "stories_exact": round(correct / max(correct + wrong, 1), 4),
+        "raw_chars_kept": round(sum(len(source["raw_content"]) for source in kept) / input_chars, 4),
+        **stats,
+    }
+
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=200, help="Distinct stories")
+    parser.add_argument("--copies", type=int, default=3, help="Most republished copies per story")
+    parser.add_argument("--page-chars", type=int, default=10000, help="Raw content size of each article")
+    parser.add_argument("--edit-rate", type=float, nargs="+", default=[0.0, 0.05, 0.15], help="Share of words each copy changes")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD, help="NEAR_DUPLICATE_THRESHOLD")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = [
+        run(args.articles, args.copies, args.page_chars, edit_rate, args.threshold, args.trials, args.seed)
+        for edit_rate in args.edit_rate
+    ]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
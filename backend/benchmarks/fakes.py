@@ -0,0 +1,493 @@
+import asyncio
+import contextlib
+import hashlib
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, ClassVar, Iterator, Optional
+
+from aiohttp import web
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+# OpenAI caches prompt prefixes of at least 1024 tokens, in 128-token increments (~4 characters per token)
+CACHE_MIN_CHARS = 1024 * 4
+CACHE_STEP_CHARS = 128 * 4
+
+WORDS = "officials said the agency would review the report after the vote on tuesday while analysts expect markets to react".split()
+
+
+
+class FakeLLMError(Exception):
+    """
+    Raised by the fake chat model to simulate a provider error.
+    """
+
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model stand-in with fixed latency, token throughput and error rate. A `slow_rate` share
+    of calls take `slow_latency` seconds longer to start, like a provider's tail latency.
+
+    Text responses look like a written section (heading, paragraphs, numbered sources).
+    Structured output returns schema instances sized by `num_sections` and `num_queries`, after
+    the time it would take to generate their JSON, about four characters per token. It's generated
+    as a call with a `response_format` schema, so its usage is recorded like any other call, and
+    streaming such a call streams the JSON.
+    Usage reports cached input tokens the way OpenAI's prompt caching would, from prompt prefixes
+    seen before by any fake model in the process.
+    """
+
+    _prefixes: ClassVar[set[bytes]] = set()
+    _capacity: ClassVar[dict[int, asyncio.Semaphore]] = {}
+
+    model_name: str = "fake"
+    latency: float = 0.5 # Seconds before the first token
+    tokens_per_second: float = 100.0 # Streaming throughput, one word per token
+    response_words: int = 150
+    error_rate: float = 0.0
+    slow_rate: float = 0.0 # Fraction of calls that are slow
+    slow_latency: float = 0.0 # Extra seconds before a slow call's first token
+    prefill_tokens_per_second: float = 0.0 # Uncached prompt tokens read per second before the first token (0 to ignore prompt size)
+    num_sections: int = 3 # Researched sections in a planned report
+    num_queries: int = 2
+    unique_queries: bool = True # Make every generated query unique so search caches miss
+    min_topic_coverage: float = 1.0 # Written sections use a random share, at least this, of their topic's words
+    grader_fail_rate: float = 0.0 # Fraction of section grades that fail
+    capacity: int = 0 # Calls the fake provider serves at once, shared by all fake models; the rest wait (0 for no limit)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @contextlib.asynccontextmanager
+    async def _provider_slot(self) -> AsyncIterator[None]:
+        if not self.capacity:
+            yield
+            return
+        semaphore = self._capacity.setdefault(self.capacity, asyncio.Semaphore(self.capacity))
+        async with semaphore:
+            yield
+
+    def _latency(self, usage: Optional[dict] = None) -> float:
+        latency = self.latency
+        if self.slow_rate and random.random() < self.slow_rate:
+            latency += self.slow_latency
+        if self.prefill_tokens_per_second and usage is not None:
+            uncached = usage["input_tokens"] - usage["input_token_details"]["cache_read"]
+            latency += uncached / self.prefill_tokens_per_second
+        return latency
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeLLMError(f"Simulated {self.model_name} error")
+
+    def _text(self, messages: list[BaseMessage], response_format: Any = None) -> str:
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            return self._structured(response_format, messages).model_dump_json()
+        prompt = "\n".join(str(message.content) for message in messages)
+        topic = re.search(r"<SECTION TOPIC>\s*(.*?)\s*</SECTION TOPIC>", prompt, re.DOTALL)
+        topic_words = sorted(set(topic.group(1).lower().split())) if topic else []
+        covered = random.sample(topic_words, round(len(topic_words) * random.uniform(self.min_topic_coverage, 1.0)))
+        vocabulary = [word for word in WORDS if word not in topic_words] + covered or WORDS
+        words = covered[:self.response_words] + [random.choice(vocabulary) for _ in range(self.response_words - len(covered))]
+        random.shuffle(words)
+        # Sentences of 15 words, for code that splits sections into sentences
+        for i in range(14, len(words), 15):
+            words[i] += "."
+        num_sources = (len(words) + 39) // 40
+        for i in range(num_sources):
+            words[i * 40] += f" [{i + 1}]"
+        # Cites the sources in the prompt, highest-scoring first
+        urls = re.findall(r"^URL: (\S+)", prompt, re.MULTILINE)
+        sources = "\n".join(
+            f"- [{i + 1}] Source {i + 1} ({urls[i] if i < len(urls) else f'https://example.com/{i + 1}'})"
+            for i in range(num_sources)
+        )
+        return f"## Section\n{' '.join(words)}\n\n### Sources\n{sources}"
+
+    def _cached_chars(self, prompt: str) -> int:
+        """
+        Returns the length of the longest previously seen cacheable prefix of the prompt, and caches its prefixes.
+        """
+        cached = 0
+        digest = hashlib.sha1()
+        digest.update(prompt[:CACHE_MIN_CHARS].encode())
+        for end in range(CACHE_MIN_CHARS, len(prompt) + 1, CACHE_STEP_CHARS):
+            if end > CACHE_MIN_CHARS:
+                digest.update(prompt[end - CACHE_STEP_CHARS:end].encode())
+            prefix = digest.digest()
+            if prefix in self._prefixes:
+                cached = end
+            self._prefixes.add(prefix)
+        return cached
+
+    @staticmethod
+    def _output_tokens(text: str, structured: bool) -> int:
+        # Words for prose, ~4 characters per token for JSON
+        return len(text) // 4 if structured else len(text.split())
+
+    def _usage(self, messages: list[BaseMessage], text: str, structured: bool = False) -> dict:
+        prompt = "\n".join(str(message.content) for message in messages)
+        input_tokens = len(prompt) // 4
+        cached_tokens = self._cached_chars(prompt) // 4
+        output_tokens = self._output_tokens(text, structured)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached_tokens},
+        }
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages)
+        time.sleep(self.latency + len(text.split()) / self.tokens_per_second)
+        self._maybe_fail()
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages, kwargs.get("response_format"))
+        structured = kwargs.get("response_format") is not None
+        usage = self._usage(messages, text, structured)
+        async with self._provider_slot():
+            await asyncio.sleep(self._latency(usage) + self._output_tokens(text, structured) / self.tokens_per_second)
+        self._maybe_fail()
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        raise NotImplementedError("FakeChatModel only streams asynchronously")
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._text(messages, kwargs.get("response_format"))
+        usage = self._usage(messages, text, kwargs.get("response_format") is not None)
+        async with self._provider_slot():
+            await asyncio.sleep(self._latency(usage))
+            self._maybe_fail()
+            if kwargs.get("response_format") is not None:
+                tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+            else:
+                tokens = text.split(" ")
+            # Paced against a deadline so per-token sleep overshoot doesn't add up
+            start = time.monotonic()
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(max(0.0, start + (i + 1) / self.tokens_per_second - time.monotonic()))
+                content = token if i == len(tokens) - 1 or kwargs.get("response_format") is not None else token + " "
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=content))
+                if run_manager is not None:
+                    await run_manager.on_llm_new_token(content, chunk=chunk)
+                yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def _structured(self, schema: type[BaseModel], messages: list[BaseMessage] = ()) -> BaseModel:
+        # Imported here so the fakes don't depend on the backend modules at import time
+        from state import Feedback, ReportSearchQueries, SearchQueries, SearchQuery, Section, SectionSearchQueries, Sections
+
+        if schema is Sections:
+            sections = [Section(name="Introduction", description="Overview of the topic", research=False, content="")]
+            sections += [
+                Section(
+                    name=f"Sub-topic {i + 1}",
+                    description=f"Key developments in sub-topic {i + 1}: " + " ".join(random.choice(WORDS) for _ in range(40)),
+                    research=True,
+                    content=""
+                )
+                for i in range(self.num_sections)
+            ]
+            sections.append(Section(name="Conclusion", description="Key takeaways", research=False, content=""))
+            return Sections(sections=sections)
+        suffix = lambda: f" {random.getrandbits(32):08x}" if self.unique_queries else ""
+        if schema is SearchQueries:
+            return SearchQueries(queries=[SearchQuery(search_query=f"news query {i + 1}{suffix()}") for i in range(self.num_queries)])
+        if schema is ReportSearchQueries:
+            prompt = "\n".join(str(message.content) for message in messages)
+            return ReportSearchQueries(sections=[
+                SectionSearchQueries(
+                    section=name,
+                    queries=[SearchQuery(search_query=f"news query {i + 1}{suffix()}") for i in range(self.num_queries)]
+                )
+                for name in re.findall(r"^SECTION NAME: (.+)$", prompt, re.MULTILINE)
+            ])
+        if schema is Feedback:
+            if self.grader_fail_rate and random.random() < self.grader_fail_rate:
+                return Feedback(grade="fail", follow_up_queries=[SearchQuery(search_query=f"follow-up query {i + 1}{suffix()}") for i in range(self.num_queries)])
+            return Feedback(grade="pass", follow_up_queries=[])
+        raise ValueError(f"FakeChatModel has no structured output for {schema.__name__}")
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        parse = RunnableLambda(lambda message: schema.model_validate_json(message.content), name=f"{self.model_name}-structured")
+        return self.bind(response_format=schema) | parse
+
+
+
+class FakeTavilyServer:
+    """
+    Local HTTP stand-in for the Tavily Search API.
+
+    Parameters:
+        latency: Seconds each search takes
+        error_rate: Fraction of searches answered with 429
+        raw_content_chars: Size of each result's raw_content
+        slow_rate: Fraction of searches that are slow
+        slow_latency: Extra seconds a slow search takes
+        change_rate: If set, each query gets the same results every time it's searched, except this
+            fraction of searches, whose results change. Otherwise every search's results are new.
+        duplicate_rate: Fraction of results that are another outlet's copy of an earlier result in
+            the same response, with its own byline and footer
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.3,
+        error_rate: float = 0.0,
+        raw_content_chars: int = 10000,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        change_rate: Optional[float] = None,
+        duplicate_rate: float = 0.0
+    ):
+        self.latency = latency
+        self.change_rate = change_rate
+        self.duplicate_rate = duplicate_rate
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.raw_content_chars = raw_content_chars
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def _results(self, query: str, max_results: int) -> list[dict]:
+        # Raw content is split into paragraphs of ~480 chars, like a scraped article
+        # Changed results keep their URLs but get new content
+        changed = self.change_rate is None or random.random() < self.change_rate
+        version = random.random() if changed else 0
+        results = []
+        for i in range(max_results):
+            digest = hashlib.sha1(f"{query}|{i}".encode()).hexdigest()[:12]
+            rng = random.Random(f"{query}|{i}|{version}")
+            if i and rng.random() < self.duplicate_rate:
+                original = results[rng.randrange(i)]
+                results.append({
+                    "title": original["title"],
+                    "url": f"https://outlet{i}.example.com/{digest}",
+                    "content": original["content"],
+                    "score": round(original["score"] * rng.uniform(0.8, 1.0), 3),
+                    "raw_content": f"By outlet {i} staff and wire reports\n\n{original['raw_content']}\n\nShare this story.",
+                })
+                continue
+            paragraphs = [
+                " ".join(rng.choice(WORDS) for _ in range(80))
+                for _ in range(self.raw_content_chars // 480 + 1)
+            ]
+            results.append({
+                "title": f"Article {digest}",
+                "url": f"https://news.example.com/{digest}",
+                "content": " ".join(rng.choice(WORDS) for _ in range(60)),
+                "score": round(rng.uniform(0.3, 0.95), 3),
+                "raw_content": "\n\n".join(paragraphs)[:self.raw_content_chars],
+            })
+        return results
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        data = await request.json()
+        await asyncio.sleep(self.latency + (self.slow_latency if self.slow_rate and random.random() < self.slow_rate else 0.0))
+        if self.error_rate and random.random() < self.error_rate:
+            return web.json_response({"detail": {"error": "Too many requests."}}, status=429, headers={"Retry-After": "0.05"})
+        return web.json_response({
+            "query": data["query"],
+            "results": self._results(data["query"], data.get("max_results", 5)),
+            "response_time": self.latency,
+        })
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/search", self._search)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+
+class FakeRedisServer:
+    """
+    Local stand-in for Redis, speaking enough of RESP2 for `RedisSharedState`: strings with
+    expiry, the lease scripts (run in Python), and streams with blocking reads.
+    """
+
+    def __init__(self):
+        from shared import REFRESH_SCRIPT, RELEASE_SCRIPT
+
+        self._values: dict[bytes, bytes] = {}
+        self._streams: dict[bytes, list[tuple[tuple[int, int], list[bytes]]]] = defaultdict(list)
+        self._expires: dict[bytes, float] = {}
+        self._appended = asyncio.Condition()
+        self._scripts = {
+            hashlib.sha1(REFRESH_SCRIPT.encode()).hexdigest(): self._refresh,
+            hashlib.sha1(RELEASE_SCRIPT.encode()).hexdigest(): self._release,
+        }
+        self._server: Optional[asyncio.Server] = None
+        self.commands = 0
+        self.url = ""
+
+    def _expire(self, key: bytes) -> None:
+        if key in self._expires and self._expires[key] <= time.monotonic():
+            del self._expires[key]
+            self._values.pop(key, None)
+            self._streams.pop(key, None)
+
+    def _refresh(self, keys: list[bytes], args: list[bytes]) -> int:
+        self._expire(keys[0])
+        if self._values.get(keys[0]) != args[0]:
+            return 0
+        self._expires[keys[0]] = time.monotonic() + int(args[1]) / 1000
+        return 1
+
+    def _release(self, keys: list[bytes], args: list[bytes]) -> int:
+        self._expire(keys[0])
+        if self._values.get(keys[0]) != args[0]:
+            return 0
+        del self._values[keys[0]]
+        self._expires.pop(keys[0], None)
+        return 1
+
+    @staticmethod
+    def _stream_id(raw: bytes) -> tuple[int, int]:
+        ms, _, seq = raw.decode().partition("-")
+        return int(ms), int(seq or 0)
+
+    async def _execute(self, command: list[bytes]) -> Any:
+        name, args = command[0].upper(), command[1:]
+        if name == b"PING":
+            return "PONG"
+        if name in (b"CLIENT", b"SELECT"):
+            return "OK"
+        if name == b"GET":
+            self._expire(args[0])
+            return self._values.get(args[0])
+        if name == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            self._expire(key)
+            if b"NX" in options and key in self._values:
+                return None
+            self._values[key] = value
+            self._expires.pop(key, None)
+            for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+                if unit in options:
+                    self._expires[key] = time.monotonic() + int(args[2 + options.index(unit) + 1]) / scale
+            return "OK"
+        if name == b"DEL":
+            return sum(self._values.pop(key, None) is not None or self._streams.pop(key, None) is not None for key in args)
+        if name == b"PEXPIRE":
+            self._expires[args[0]] = time.monotonic() + int(args[1]) / 1000
+            return 1
+        if name == b"SCRIPT" and args[0].upper() == b"LOAD":
+            return hashlib.sha1(args[1]).hexdigest().encode()
+        if name in (b"EVALSHA", b"EVAL"):
+            sha = args[0].decode() if name == b"EVALSHA" else hashlib.sha1(args[0]).hexdigest()
+            if sha not in self._scripts:
+                return RuntimeError("NOSCRIPT No matching script.")
+            num_keys = int(args[1])
+            return self._scripts[sha](args[2:2 + num_keys], args[2 + num_keys:])
+        if name == b"XADD":
+            key, rest = args[0], args[1:]
+            maxlen = None
+            if rest[0].upper() == b"MAXLEN":
+                rest = rest[1:]
+                if rest[0] in (b"~", b"="):
+                    rest = rest[1:]
+                maxlen, rest = int(rest[0]), rest[1:]
+            self._expire(key)
+            entries = self._streams[key]
+            now = int(time.time() * 1000)
+            last = entries[-1][0] if entries else (0, 0)
+            entry_id = (now, 0) if now > last[0] else (last[0], last[1] + 1)
+            entries.append((entry_id, rest[1:]))
+            if maxlen is not None and len(entries) > maxlen:
+                del entries[:len(entries) - maxlen]
+            async with self._appended:
+                self._appended.notify_all()
+            return f"{entry_id[0]}-{entry_id[1]}".encode()
+        if name == b"XREAD":
+            options = [a.upper() for a in args]
+            count = int(args[options.index(b"COUNT") + 1]) if b"COUNT" in options else None
+            block = int(args[options.index(b"BLOCK") + 1]) if b"BLOCK" in options else None
+            key, after = args[options.index(b"STREAMS") + 1], self._stream_id(args[options.index(b"STREAMS") + 2])
+            deadline = time.monotonic() + block / 1000 if block else None
+
+            while True:
+                self._expire(key)
+                entries = [(i, fields) for i, fields in self._streams.get(key, []) if i > after][:count]
+                if entries or block is None:
+                    break
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                async with self._appended:
+                    try:
+                        await asyncio.wait_for(self._appended.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            if not entries:
+                return None
+            return [[key, [[f"{i[0]}-{i[1]}".encode(), fields] for i, fields in entries]]]
+        return RuntimeError(f"ERR unknown command '{name.decode()}'")
+
+    @classmethod
+    def _encode(cls, value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, RuntimeError):
+            return f"-{value}\r\n".encode()
+        if isinstance(value, str):
+            return f"+{value}\r\n".encode()
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(cls._encode(item) for item in value)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                command = []
+                for _ in range(int(header[1:])):
+                    size = int((await reader.readline())[1:])
+                    command.append((await reader.readexactly(size + 2))[:-2])
+                self.commands += 1
+                writer.write(self._encode(await self._execute(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.url = f"redis://{host}:{port}/0"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,171 @@
+"""
+Open-loop load test of `/report` admission control against fake OpenAI and Tavily backends.
+
+Run from the backend directory:
+
+    python -m benchmarks.load --rate 2 --duration 30 --llm-capacity 8 --max-concurrency 0 --output unbounded.json
+    python -m benchmarks.load --rate 2 --duration 30 --llm-capacity 8 --max-concurrency 4 --compare unbounded.json
+
+Reports with unique topics arrive at `--rate` per second for `--duration` seconds, whether or not
+earlier ones have finished. `--llm-capacity` limits how many model calls the fake provider serves
+at once, so admitting every report makes them all slower. Requests rejected with 503 are counted
+as shed; latency and queue wait are measured over the reports that were admitted.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from benchmarks.run import compare, configure_environment, git_commit, install_fake_models, percentiles, read_sse, serve_app
+
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=2.0, help="Report requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send requests for")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="REPORT_MAX_CONCURRENCY (0 for no limit)")
+    parser.add_argument("--max-queue", type=int, default=16, help="REPORT_MAX_QUEUE")
+    parser.add_argument("--estimated-seconds", type=float, default=10.0, help="REPORT_ESTIMATED_SECONDS")
+    parser.add_argument("--sections", type=int, default=3, help="Researched sections per report")
+    parser.add_argument("--queries", type=int, default=2, help="Search queries per section")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before a model's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--response-words", type=int, default=150)
+    parser.add_argument("--llm-capacity", type=int, default=8, help="Model calls served at once across all reports (0 for no limit)")
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--raw-content-chars", type=int, default=10000)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Print deltas against an earlier results file")
+    args = parser.parse_args(argv)
+
+    # Settings the shared benchmark helpers expect
+    args.same_topic = False
+    args.llm_error_rate = 0.0
+    args.search_rate = 1000.0
+    args.concurrency = max(args.max_concurrency, 8)
+    return args
+
+
+
+async def request_report(client, topic: str) -> dict:
+    """
+    Reads one report from `/report`, timing its queue wait and total latency.
+    """
+    start = time.perf_counter()
+    queue_wait = 0.0
+    positions = []
+
+    async with client.stream("GET", "/report", params={"topic": topic}) as response:
+        if response.status_code == 503:
+            return {"shed": True, "retry_after": float(response.headers.get("Retry-After", 0))}
+        response.raise_for_status()
+        finished = False
+        async for event, data in read_sse(response):
+            if event == "error":
+                raise RuntimeError(data)
+            if event == "queued":
+                positions.append(json.loads(data)["position"])
+            elif event == "step":
+                if not queue_wait:
+                    queue_wait = time.perf_counter() - start
+                if json.loads(data)["node"] == "compile_report":
+                    finished = True
+
+    if not finished:
+        raise RuntimeError("Stream ended before compile_report")
+    return {
+        "shed": False,
+        "latency": time.perf_counter() - start,
+        "queue_wait": queue_wait if positions else 0.0,
+        "first_position": positions[0] if positions else 0,
+    }
+
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    from benchmarks.fakes import FakeTavilyServer
+
+    search_server = FakeTavilyServer(args.search_latency, 0.0, args.raw_content_chars)
+    os.environ["TAVILY_BASE_URL"] = await search_server.start()
+    install_fake_models(args)
+
+    results, errors = [], []
+
+    async def arrive(client, delay: float, i: int):
+        await asyncio.sleep(delay)
+        try:
+            results.append(await request_report(client, f"load topic {i} {uuid.uuid4().hex[:8]}"))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    server, task, base_url = await serve_app()
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+            arrivals = int(args.rate * args.duration)
+            await asyncio.gather(*(arrive(client, i / args.rate, i) for i in range(arrivals)))
+    finally:
+        server.should_exit = True
+        await task
+    wall_clock = time.perf_counter() - start
+
+    await search_server.stop()
+
+    admitted = [r for r in results if not r["shed"]]
+    shed = [r for r in results if r["shed"]]
+    from main import report_scheduler
+    return {
+        "offered": len(results) + len(errors),
+        "completed": len(admitted),
+        "shed": len(shed),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_clock": round(wall_clock, 4),
+        "goodput_per_minute": round(len(admitted) / wall_clock * 60, 2),
+        "latency": percentiles([r["latency"] for r in admitted]),
+        "queue_wait": percentiles([r["queue_wait"] for r in admitted if r["first_position"]]),
+        "retry_after": percentiles([r["retry_after"] for r in shed]),
+        "scheduler": report_scheduler.stats(),
+    }
+
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        os.environ["REPORT_MAX_CONCURRENCY"] = str(args.max_concurrency)
+        os.environ["REPORT_MAX_QUEUE"] = str(args.max_queue)
+        os.environ["REPORT_ESTIMATED_SECONDS"] = str(args.estimated_seconds)
+        summary = asyncio.run(run(args))
+
+    output = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": summary,
+    }
+    print(json.dumps(output, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('commit')}:")
+        print("\n".join(compare(summary, baseline["results"])))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of passage ranking throughput on large pages.
+
+Run from the backend directory:
+
+    python -m benchmarks.ranking --page-chars 50000 200000 1000000 --sources 10
+
+Each trial ranks one section's search results: `--sources` pages of synthetic text with a
+Zipf-distributed vocabulary, a few passages of which mention the section's query terms.
+"""
+import argparse
+import json
+import time
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.run import percentiles
+from ranking import rank_search_results
+
+QUERY = "central bank interest rate decision inflation outlook"
+
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(3, 11, size)
+    return np.array(["".join(rng.choice(letters, n)) for n in lengths])
+
+
+
+def make_page(chars: int, vocabulary: np.ndarray, rng: np.random.Generator, relevant_fraction: float = 0.05) -> str:
+    """
+    Generates a page of ~`chars` characters in paragraphs of 40-120 words.
+    """
+    ranks = np.arange(1, len(vocabulary) + 1)
+    probabilities = 1 / ranks
+    probabilities /= probabilities.sum()
+    query_words = QUERY.split()
+
+    paragraphs, size = [], 0
+    while size < chars:
+        words = list(rng.choice(vocabulary, rng.integers(40, 120), p=probabilities))
+        if rng.random() < relevant_fraction:
+            for word in rng.choice(query_words, 6):
+                words.insert(rng.integers(len(words)), word)
+        paragraph = " ".join(words) + "."
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+
+def run(page_chars: int, sources: int, trials: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    vocabulary = make_vocabulary(20000, rng)
+    responses = [{
+        "query": QUERY,
+        "results": [
+            {"title": f"Page {i}", "url": f"https://example.com/{i}", "content": "", "score": 0.5, "raw_content": make_page(page_chars, vocabulary, rng)}
+            for i in range(sources)
+        ]
+    }]
+
+    times = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        ranked, stats = rank_search_results(responses, QUERY)
+        times.append(time.perf_counter() - start)
+
+    input_chars = page_chars * sources
+    output_chars = sum(len(source["raw_content"]) for source in ranked[0]["results"])
+    median = float(np.median(times))
+    return {
+        "page_chars": page_chars,
+        "sources": sources,
+        "seconds": percentiles(times),
+        "mb_per_second": round(input_chars / median / 1e6, 2),
+        "passages_per_second": round(stats["passages"] / median),
+        **stats,
+        "chars_kept": round(output_chars / input_chars, 4),
+    }
+
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-chars", type=int, nargs="+", default=[10000, 100000, 1000000], help="Raw content size of each page")
+    parser.add_argument("--sources", type=int, default=10, help="Pages per section")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = [run(chars, args.sources, args.trials, args.seed) for chars in args.page_chars]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""
+Offline benchmark of the report pipeline against fake OpenAI and Tavily backends.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --mode graph --reports 20 --concurrency 5 --output results.json
+    python -m benchmarks.run --mode sse --tokens --compare results.json
+    python -m benchmarks.run --mode sse --deadline 8 --search-slow-rate 0.2 --search-slow-latency 10
+    python -m benchmarks.run --mode sse --refresh 0.3
+
+`graph` mode drives `graph.astream` directly and records per-node latency. `sse` mode serves the
+FastAPI app with uvicorn and reads `/report` as a client would, recording time to first event
+and, with `--tokens`, time to first visible text per section.
+
+With `--deadline`, reports are due that many seconds after they start, and the summary counts the
+parts cut short to meet it. The `--*-slow-*` options make a share of searches and model calls slow.
+
+With `--refresh`, each report is requested again with `refresh=true` after the first pass, with
+that fraction of searches returning changed results, and the summary counts the sections reused.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["graph", "sse"], default="graph")
+    parser.add_argument("--reports", type=int, default=10, help="Reports to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="Reports in flight at once")
+    parser.add_argument("--same-topic", action="store_true", help="Use one topic for every report (exercises caching and dedup)")
+    parser.add_argument("--tokens", action="store_true", help="Stream section tokens (sse mode)")
+    parser.add_argument("--checkpoint", action="store_true", help="Run the graph with the SQLite checkpointer (graph mode)")
+    parser.add_argument("--speculative", action="store_true", help="Research sections while the planner streams the plan")
+    parser.add_argument("--batch-queries", action="store_true", help="Write every section's search queries in one call")
+    parser.add_argument("--sections", type=int, default=3, help="Researched sections per report")
+    parser.add_argument("--queries", type=int, default=2, help="Search queries per section")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before a model's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--response-words", type=int, default=150)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-capacity", type=int, default=0, help="Model calls served at once across all reports (0 for no limit)")
+    parser.add_argument("--llm-prefill-rate", type=float, default=0.0, help="Uncached prompt tokens a model reads per second before its first token (0 to ignore prompt size)")
+    parser.add_argument("--digest-tokens", type=int, default=150, help="SECTION_DIGEST_TOKENS (0 sends full sections to the intro and conclusion writers)")
+    parser.add_argument("--grading", choices=["local", "llm", "off"], default="local", help="SECTION_GRADING")
+    parser.add_argument("--grader-max-calls", type=int, default=2, help="SECTION_GRADER_MAX_CALLS")
+    parser.add_argument("--grader-fail-rate", type=float, default=0.0, help="Fraction of LLM section grades that fail")
+    parser.add_argument("--min-topic-coverage", type=float, default=1.0, help="Least share of its topic's words a written section uses")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="Fraction of model calls that are slow")
+    parser.add_argument("--llm-slow-latency", type=float, default=0.0, help="Extra seconds before a slow model call's first token")
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--search-error-rate", type=float, default=0.0, help="Fraction of searches answered with 429")
+    parser.add_argument("--search-slow-rate", type=float, default=0.0, help="Fraction of searches that are slow")
+    parser.add_argument("--search-duplicate-rate", type=float, default=0.0, help="Fraction of search results that are copies of another result")
+    parser.add_argument("--search-slow-latency", type=float, default=0.0, help="Extra seconds a slow search takes")
+    parser.add_argument("--deadline", type=float, help="Seconds each report is due in")
+    parser.add_argument("--refresh", type=float, help="Refresh every report after the first pass, with this fraction of searches changed (sse mode)")
+    parser.add_argument("--source-store", choices=["memory", "file"], default="memory", help="Keep sources in memory or in memory-mapped files (SOURCE_STORE_DIR)")
+    parser.add_argument("--raw-content-chars", type=int, default=10000)
+    parser.add_argument("--search-rate", type=float, default=1000.0, help="Search client rate limit per second")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Print deltas against an earlier results file")
+    return parser.parse_args(argv)
+
+
+
+def configure_environment(args: argparse.Namespace, workdir: str) -> None:
+    """
+    Points the backend's settings at throwaway files and the benchmark's limits. Must run before the backend is imported.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+    os.environ["TAVILY_RATE_LIMIT"] = str(args.search_rate)
+    os.environ["TAVILY_BURST"] = str(max(int(args.search_rate), 1))
+    os.environ["TAVILY_MAX_CONCURRENCY"] = str(max(args.concurrency * args.sections * args.queries, 8))
+    os.environ["SEARCH_CACHE_PATH"] = ""
+    os.environ["CHECKPOINT_PATH"] = os.path.join(workdir, "checkpoints.sqlite3")
+    os.environ["RUN_LOG_PATH"] = os.path.join(workdir, "runs.sqlite3")
+    os.environ["SHARED_STATE_URL"] = os.path.join(workdir, "shared_state.sqlite3")
+    os.environ["SPECULATIVE_PLANNING"] = str(getattr(args, "speculative", False)).lower()
+    os.environ["BATCH_SECTION_QUERIES"] = str(getattr(args, "batch_queries", False)).lower()
+    os.environ["SECTION_DIGEST_TOKENS"] = str(getattr(args, "digest_tokens", 150))
+    os.environ["SECTION_GRADING"] = getattr(args, "grading", "local")
+    os.environ["SECTION_GRADER_MAX_CALLS"] = str(getattr(args, "grader_max_calls", 2))
+    os.environ.pop("REPORT_CACHE_PATH", None)
+    if getattr(args, "source_store", "memory") == "file":
+        os.environ["SOURCE_STORE_DIR"] = workdir
+    else:
+        os.environ.pop("SOURCE_STORE_DIR", None)
+
+
+
+def install_fake_models(args: argparse.Namespace) -> None:
+    """
+    Makes the model registry build fake chat models instead of calling init_chat_model.
+    """
+    import models
+    from benchmarks.fakes import FakeChatModel
+
+    def fake_init_chat_model(model: str, model_provider: str = "openai", **kwargs) -> FakeChatModel:
+        return FakeChatModel(
+            model_name=model,
+            latency=args.llm_latency,
+            tokens_per_second=args.tokens_per_second,
+            response_words=args.response_words,
+            error_rate=args.llm_error_rate,
+            num_sections=args.sections,
+            num_queries=args.queries,
+            unique_queries=not args.same_topic,
+            capacity=args.llm_capacity,
+            prefill_tokens_per_second=getattr(args, "llm_prefill_rate", 0.0),
+            min_topic_coverage=getattr(args, "min_topic_coverage", 1.0),
+            grader_fail_rate=getattr(args, "grader_fail_rate", 0.0),
+            slow_rate=getattr(args, "llm_slow_rate", 0.0),
+            slow_latency=getattr(args, "llm_slow_latency", 0.0),
+        )
+
+    models.init_chat_model = fake_init_chat_model
+
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        index = q * (len(ordered) - 1)
+        low = int(index)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": round(pick(0.50), 4),
+        "p95": round(pick(0.95), 4),
+        "p99": round(pick(0.99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+
+def topic_for(args: argparse.Namespace, i: int) -> str:
+    return "benchmark topic" if args.same_topic else f"benchmark topic {i} {uuid.uuid4().hex[:8]}"
+
+
+
+async def run_graph_report(
+    report_graph,
+    topic: str,
+    node_times: dict,
+    speculative: bool,
+    deadline: Optional[float] = None,
+    batch_queries: bool = False
+) -> dict:
+    """
+    Runs one report through `graph.astream`, timing every node from the debug stream, and the
+    time from the start of planning to the first section write. The serialized size of every node's
+    input and result is summed as the state a checkpointer would have to write.
+    """
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    from deadline import Deadline
+    from grading import SectionGrading
+    from graph import SectionSpeculation
+    from utils import SearchBroker
+
+    broker = SearchBroker()
+    grading = SectionGrading()
+    config = {"configurable": {
+        "thread_id": str(uuid.uuid4()),
+        "search_broker": broker,
+        "section_speculation": SectionSpeculation() if speculative else None,
+        "batch_section_queries": batch_queries,
+        "section_grading": grading,
+        "deadline": Deadline(deadline) if deadline else None
+    }}
+    degraded = []
+    started = {}
+    start = time.perf_counter()
+    first_event = None
+    plan_started = first_write = None
+    serde = JsonPlusSerializer()
+    state_bytes = 0
+    near_duplicates = 0
+
+    async for namespace, _, event in report_graph.astream({"topic": topic}, config, stream_mode=["debug"], subgraphs=True):
+        now = time.perf_counter()
+        if first_event is None:
+            first_event = now - start
+        payload = event["payload"]
+        if event["type"] in ("task", "task_result"):
+            state_bytes += len(serde.dumps_typed(payload.get("input", payload.get("result")))[1])
+        if event["type"] == "task":
+            started[payload["id"]] = now
+            if payload["name"] == "plan_report" and plan_started is None:
+                plan_started = now
+            elif payload["name"] == "write_section" and first_write is None:
+                first_write = now
+        elif event["type"] == "task_result" and payload["id"] in started:
+            node_times[payload["name"]].append(now - started.pop(payload["id"]))
+            near_duplicates += sum(value.get("near_duplicates", 0) for name, value in payload["result"] if name == "source_tokens")
+            # Subgraph parts reach the top level with their section's result
+            if not namespace:
+                degraded += [part for name, value in payload["result"] if name == "degraded" for part in value]
+
+    return {
+        "latency": time.perf_counter() - start,
+        "first_event": first_event,
+        "plan_to_first_write": first_write - plan_started if first_write is not None and plan_started is not None else None,
+        "searches_saved": broker.stats()["searches_saved"],
+        "degraded": degraded,
+        "grading": grading.stats(),
+        "state_bytes": state_bytes,
+        "near_duplicates": near_duplicates,
+    }
+
+
+
+async def read_sse(response) -> "AsyncIterator[tuple[str, str]]":
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if line == "":
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+
+async def run_sse_report(client, topic: str, tokens: bool, deadline: Optional[float] = None, refresh: bool = False) -> dict:
+    """
+    Reads one report from `/report`, timing the first event and the first visible text of each section.
+    """
+    params = {"topic": topic, "tokens": str(tokens).lower()}
+    if deadline:
+        params["deadline"] = deadline
+    if refresh:
+        params["refresh"] = "true"
+    degraded = []
+    refreshed = None
+    start = time.perf_counter()
+    first_event = None
+    first_text: dict[str, float] = {}
+    wire_bytes = 0
+    searches_saved = None
+    finished = False
+
+    async with client.stream("GET", "/report", params=params) as response:
+        async for event, data in read_sse(response):
+            now = time.perf_counter() - start
+            wire_bytes += len(data)
+            if event == "error":
+                raise RuntimeError(data)
+            if event == "searches":
+                searches_saved = json.loads(data)["searches_saved"]
+            if event == "degraded":
+                degraded = json.loads(data)["parts"]
+            if event == "refresh":
+                refreshed = json.loads(data)
+            if event not in ("step", "token"):
+                continue
+            if first_event is None:
+                first_event = now
+            payload = json.loads(data)
+            if event == "token":
+                first_text.setdefault(payload["section"], now)
+            elif payload["node"] in ("write_section", "write_intro_and_conclusion") and payload["diff"].get("section"):
+                first_text.setdefault(payload["diff"]["section"], now)
+            elif payload["node"] == "compile_report":
+                finished = True
+
+    if not finished:
+        raise RuntimeError("Stream ended before compile_report")
+    return {
+        "latency": time.perf_counter() - start,
+        "searches_saved": searches_saved,
+        "first_event": first_event,
+        "first_text": list(first_text.values()),
+        "bytes": wire_bytes,
+        "degraded": degraded,
+        "refreshed": refreshed,
+    }
+
+
+
+async def serve_app():
+    """
+    Serves the FastAPI app on a free local port. Returns the server and its base URL.
+    """
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from benchmarks.fakes import FakeTavilyServer
+
+    # Refreshed reports need searches that return the same results unless they're meant to change
+    search_server = FakeTavilyServer(
+        args.search_latency, args.search_error_rate, args.raw_content_chars, args.search_slow_rate, args.search_slow_latency,
+        change_rate=0.0 if args.refresh is not None else None,
+        duplicate_rate=args.search_duplicate_rate
+    )
+    os.environ["TAVILY_BASE_URL"] = await search_server.start()
+    install_fake_models(args)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    node_times: dict[str, list[float]] = defaultdict(list)
+    results, errors = [], []
+    topics = [topic_for(args, i) for i in range(args.reports)]
+
+    async def guarded(make_report, into: list = results):
+        async with semaphore:
+            try:
+                into.append(await make_report())
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    if args.mode == "graph":
+        from graph import builder, graph
+
+        async def run_all(report_graph):
+            await asyncio.gather(*(
+                guarded(lambda topic=topic: run_graph_report(report_graph, topic, node_times, args.speculative, args.deadline, args.batch_queries))
+                for topic in topics
+            ))
+
+        if args.checkpoint:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            async with AsyncSqliteSaver.from_conn_string(os.environ["CHECKPOINT_PATH"]) as checkpointer:
+                await run_all(builder.compile(checkpointer=checkpointer))
+        else:
+            await run_all(graph)
+    else:
+        import httpx
+
+        refreshes = []
+        server, task, base_url = await serve_app()
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+                await asyncio.gather(*(
+                    guarded(lambda topic=topic: run_sse_report(client, topic, args.tokens, args.deadline))
+                    for topic in topics
+                ))
+                wall_clock = time.perf_counter() - start
+                if args.refresh is not None:
+                    search_server.change_rate = args.refresh
+                    requests_before = search_server.requests
+                    await asyncio.gather(*(
+                        guarded(lambda topic=topic: run_sse_report(client, topic, args.tokens, args.deadline, refresh=True), refreshes)
+                        for topic in topics
+                    ))
+                    refresh_searches = search_server.requests - requests_before
+        finally:
+            server.should_exit = True
+            await task
+    if args.mode == "graph":
+        wall_clock = time.perf_counter() - start
+
+    await search_server.stop()
+
+    summary = {
+        "reports": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_clock": round(wall_clock, 4),
+        "throughput_per_minute": round(len(results) / wall_clock * 60, 2),
+        "latency": percentiles([r["latency"] for r in results]),
+        "first_event": percentiles([r["first_event"] for r in results if r["first_event"] is not None]),
+        "search_requests": search_server.requests,
+        "searches_saved_per_report": percentiles([r["searches_saved"] for r in results if r["searches_saved"] is not None]),
+        # ru_maxrss is KB on Linux; includes the fake backends and the client
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    from models import model_registry
+    summary["usage_by_node"] = model_registry.usage.stats()
+    if args.deadline:
+        parts = [part for r in results for part in r["degraded"]]
+        summary["degraded"] = {
+            "reports": sum(bool(r["degraded"]) for r in results),
+            "parts": {kind: sum(part["part"] == kind for part in parts) for kind in ("plan", "queries", "sources", "content")},
+        }
+    if args.mode == "graph":
+        summary["grading"] = {name: sum(r["grading"][name] for r in results) for name in results[0]["grading"]} if results else {}
+        summary["state_bytes_per_report"] = percentiles([r["state_bytes"] for r in results])
+        summary["near_duplicates_per_report"] = percentiles([r["near_duplicates"] for r in results])
+        summary["plan_to_first_write"] = percentiles([r["plan_to_first_write"] for r in results if r["plan_to_first_write"] is not None])
+    if node_times:
+        summary["nodes"] = {name: percentiles(times) for name, times in sorted(node_times.items())}
+    if args.mode == "sse":
+        summary["first_text_per_section"] = percentiles([t for r in results for t in r["first_text"]])
+        summary["bytes_per_report"] = percentiles([r["bytes"] for r in results])
+        if args.refresh is not None:
+            counts = [r["refreshed"] for r in refreshes if r["refreshed"] is not None]
+            summary["search_requests"] -= refresh_searches
+            summary["refresh"] = {
+                "reports": len(refreshes),
+                "latency": percentiles([r["latency"] for r in refreshes]),
+                "search_requests": refresh_searches,
+                "sections_reused": sum(c["reused"] for c in counts),
+                "sections_rewritten": sum(c["rewritten"] for c in counts),
+            }
+    return summary
+
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def compare(current: dict, baseline: dict, prefix: str = "") -> list[str]:
+    """
+    Lists numeric differences between two results dicts.
+    """
+    lines = []
+    for key, value in current.items():
+        old = baseline.get(key)
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(old, dict):
+            lines += compare(value, old, f"{name}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            change = f" ({(value - old) / old:+.1%})" if old else ""
+            lines.append(f"{name}: {old} -> {value}{change}")
+    return lines
+
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        summary = asyncio.run(run(args))
+
+    output = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": summary,
+    }
+    print(json.dumps(output, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('commit')}:")
+        print("\n".join(compare(summary, baseline["results"])))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark of `/report` throughput under gunicorn with 1, 4 and 8 workers, per shared state backend.
+
+Run from the backend directory:
+
+    python -m benchmarks.workers --workers 1 4 8 --backends none sqlite redis --reports 48 --topics 12
+
+Each configuration serves the app with fake models (`benchmarks.app`) in a fresh gunicorn, and
+requests `--reports` reports from `--concurrency` clients, cycling through `--topics` topics so
+identical requests land on different workers. The fake Tavily and Redis servers run in this
+process. `none` gives every worker its own state, `sqlite` shares it through a SQLite file and
+`redis` through the Redis stand-in.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from benchmarks.run import configure_environment, git_commit, percentiles, read_sse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backends", nargs="+", choices=["none", "sqlite", "redis"], default=["none", "sqlite", "redis"])
+    parser.add_argument("--reports", type=int, default=48, help="Reports to request per configuration")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--topics", type=int, default=12, help="Distinct topics the requests cycle through")
+    parser.add_argument("--sections", type=int, default=3, help="Researched sections per report")
+    parser.add_argument("--queries", type=int, default=2, help="Search queries per section")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before a model's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--response-words", type=int, default=150)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--raw-content-chars", type=int, default=10000)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    # Settings the shared benchmark helpers expect
+    args.same_topic = False
+    args.llm_error_rate = 0.0
+    args.llm_capacity = 0
+    args.search_rate = 1000.0
+    return args
+
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+
+async def request_report(client, topic: str) -> dict:
+    """
+    Reads one report from `/report`. Returns its latency and the id of the run that produced it,
+    or None if it was replayed from the report store.
+    """
+    start = time.perf_counter()
+    run_id = None
+    finished = False
+    async with client.stream("GET", "/report", params={"topic": topic}) as response:
+        response.raise_for_status()
+        async for event, data in read_sse(response):
+            if event == "error":
+                raise RuntimeError(data)
+            if event == "run":
+                run_id = json.loads(data)["run_id"]
+            elif event == "step" and json.loads(data)["node"] == "compile_report":
+                finished = True
+    if not finished:
+        raise RuntimeError("Stream ended before compile_report")
+    return {"latency": time.perf_counter() - start, "run_id": run_id}
+
+
+
+async def run_configuration(args: argparse.Namespace, backend: str, workers: int, search_server) -> dict:
+    import httpx
+    from benchmarks.fakes import FakeRedisServer
+
+    # A fresh Redis for each configuration, so reports stored by one aren't replayed in the next
+    redis_server = FakeRedisServer()
+    redis_url = await redis_server.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        env = {
+            **os.environ,
+            "TAVILY_BASE_URL": search_server.url,
+            "SHARED_STATE_URL": {"none": "", "sqlite": os.path.join(workdir, "shared_state.sqlite3"), "redis": redis_url}[backend],
+            "REPORT_MAX_CONCURRENCY": "0",
+            "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "metrics"),
+            "BENCHMARK_ARGS": json.dumps({k: v for k, v in vars(args).items() if k not in ("workers", "backends", "output")}),
+        }
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-k", "uvicorn.workers.UvicornWorker", "-w", str(workers),
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "benchmarks.app:app"],
+            cwd=BACKEND_DIR, env=env
+        )
+        results, errors = [], []
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+                while True:
+                    if server.poll() is not None:
+                        raise RuntimeError(f"gunicorn exited with {server.returncode}")
+                    try:
+                        if (await client.get("/")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.1)
+                # Let every worker finish starting up
+                await asyncio.sleep(1)
+
+                searches_before = search_server.requests
+                semaphore = asyncio.Semaphore(args.concurrency)
+
+                async def guarded(i: int):
+                    async with semaphore:
+                        try:
+                            results.append(await request_report(client, f"workers topic {i % args.topics}"))
+                        except Exception as e:
+                            errors.append(f"{type(e).__name__}: {e}")
+
+                start = time.perf_counter()
+                await asyncio.gather(*(guarded(i) for i in range(args.reports)))
+                wall_clock = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+            await redis_server.stop()
+
+    run_ids = {r["run_id"] for r in results if r["run_id"] is not None}
+    return {
+        "backend": backend,
+        "workers": workers,
+        "reports": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_clock": round(wall_clock, 4),
+        "throughput_per_minute": round(len(results) / wall_clock * 60, 2),
+        "latency": percentiles([r["latency"] for r in results]),
+        "graph_runs": len(run_ids),
+        "replayed": sum(r["run_id"] is None for r in results),
+        "search_requests": search_server.requests - searches_before,
+    }
+
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    from benchmarks.fakes import FakeTavilyServer
+
+    search_server = FakeTavilyServer(args.search_latency, 0.0, args.raw_content_chars)
+    await search_server.start()
+
+    results = []
+    try:
+        for backend in args.backends:
+            for workers in args.workers:
+                result = await run_configuration(args, backend, workers, search_server)
+                print(json.dumps({k: result[k] for k in ("backend", "workers", "throughput_per_minute", "graph_runs", "errors")}), file=sys.stderr)
+                results.append(result)
+    finally:
+        await search_server.stop()
+    return results
+
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    output = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    print(json.dumps(output, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import time
+from typing import Optional
+
+from langchain_core.runnables import RunnableConfig
+
+# Fraction of the deadline by which each stage should be done. Time a stage doesn't use carries
+# over to the next, and the last stage leaves a little for compiling and sending the report.
+STAGES = {
+    "plan": 0.4,
+    "research": 0.55,
+    "write": 0.78,
+    "finish": 0.97,
+}
+
+
+
+class Deadline:
+    """
+    A report's latency budget, split into stages that each have to be done by a share of it.
+
+    Parameters:
+        seconds: Seconds from now the report is due
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+
+    def remaining(self, stage: str) -> float:
+        """
+        Seconds left until a stage has to be done.
+        """
+        return max(0.0, self.started_at + self.seconds * STAGES[stage] - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+
+def time_left(config: RunnableConfig, stage: str, share: float = 1.0) -> Optional[float]:
+    """
+    Seconds left for a stage of the run's deadline, or None if the run has no deadline.
+
+    Parameters:
+        config: Run config, with the run's `Deadline` under `deadline` if it has one
+        stage: Stage in STAGES
+        share: Share of the time left to give to the next step of the stage
+    """
+    deadline = config["configurable"].get("deadline")
+    return deadline.remaining(stage) * share if deadline is not None else None
+
+
+
+def degraded(part: str, detail: str, section: Optional[str] = None) -> dict:
+    """
+    Describes part of a report that was cut short to meet its deadline.
+
+    Parameters:
+        part: "plan", "queries", "sources" or "content"
+        detail: What was skipped
+        section: Name of the section, if the part belongs to one
+    """
+    return {"section": section, "part": part, "detail": detail}
@@ -0,0 +1,167 @@
+import os
+from typing import Optional
+
+import numpy as np
+import xxhash
+
+# Estimated Jaccard similarity of two sources' shingles above which they're treated as copies of
+# one story (0 turns near-duplicate detection off)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.5))
+# Words per shingle, and the fewest shingles a source needs to be compared at all
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 20
+# MinHash signature size (a power of 2), split into LSH bands of `ROWS_PER_BAND` values. Sources that
+# agree on every value of at least one band are compared; with 32 bands of 2, nearly every pair over
+# 0.4 similar is, and few under 0.1 are.
+SIGNATURE_SIZE = 64
+ROWS_PER_BAND = 2
+
+_BIN_BITS = np.uint64(64 - SIGNATURE_SIZE.bit_length() + 1)
+_VALUE_MASK = np.uint64((1 << int(_BIN_BITS)) - 1)
+_EMPTY = np.iinfo(np.uint64).max
+_rng = np.random.default_rng(0x5EED)
+# Odd multipliers combining a shingle's word hashes, and the offset added per bin an empty bin borrows across
+_POSITIONS = _rng.integers(1, 2**62, SHINGLE_WORDS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_BORROW_OFFSET = np.uint64(0x9E3779B97F4A7C15)
+
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # SplitMix64 finalizer, so every bit of a shingle hash depends on every word
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    MinHash signature of a text's word shingles, or None if it's too short to compare.
+
+    Uses one-permutation hashing: each shingle is hashed once, the top bits of its hash pick one of
+    the signature's bins, and each bin keeps the smallest hash it gets. Empty bins borrow from the
+    next non-empty bin, so short texts still get comparable signatures. Matching bins estimate the
+    Jaccard similarity of two texts' shingles like a k-permutation MinHash, in one pass.
+    """
+    words = text.lower().split()
+    if len(words) < SHINGLE_WORDS + MIN_SHINGLES - 1:
+        return None
+    # xxh64 rather than hash(), whose seed differs per process, so signatures agree across workers
+    hashes = np.fromiter(map(xxhash.xxh64_intdigest, words), dtype=np.uint64, count=len(words))
+    count = len(words) - SHINGLE_WORDS + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for position in range(SHINGLE_WORDS):
+        shingles += hashes[position:position + count] * _POSITIONS[position]
+    shingles = _mix(shingles)
+
+    signature = np.full(SIGNATURE_SIZE, _EMPTY, dtype=np.uint64)
+    np.minimum.at(signature, (shingles >> _BIN_BITS).astype(np.intp), shingles & _VALUE_MASK)
+
+    filled = np.flatnonzero(signature != _EMPTY)
+    empty = np.flatnonzero(signature == _EMPTY)
+    if len(empty):
+        position = np.searchsorted(filled, empty) % len(filled)
+        distance = (filled[position] - empty) % SIGNATURE_SIZE
+        signature[empty] = signature[filled[position]] + distance.astype(np.uint64) * _BORROW_OFFSET
+    return signature
+
+
+
+class MinHashLSH:
+    """
+    Banded LSH index of MinHash signatures, for finding which indexed item a new one copies.
+
+    Parameters:
+        threshold: Estimated Jaccard similarity a candidate has to reach to count as a copy
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: dict[tuple[int, bytes], list[int]] = {}
+        self._signatures: list[np.ndarray] = []
+
+    def _bands(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        return [
+            (band, signature[start:start + ROWS_PER_BAND].tobytes())
+            for band, start in enumerate(range(0, SIGNATURE_SIZE, ROWS_PER_BAND))
+        ]
+
+    def query(self, signature: np.ndarray) -> Optional[int]:
+        """
+        Returns the most similar indexed item at or above the threshold, or None.
+        """
+        candidates = {item for band in self._bands(signature) for item in self._buckets.get(band, [])}
+        best, best_similarity = None, self.threshold
+        for item in sorted(candidates):
+            similarity = float(np.mean(self._signatures[item] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = item, similarity
+        return best
+
+    def add(self, signature: np.ndarray) -> int:
+        """
+        Indexes a signature and returns its item number.
+        """
+        item = len(self._signatures)
+        self._signatures.append(signature)
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, []).append(item)
+        return item
+
+
+
+def collapse_near_duplicates(search_responses: list[dict], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> tuple[list[dict], dict]:
+    """
+    Collapses sources that are copies of the same story (e.g. a wire story republished by several
+    outlets) into the highest-scoring copy, which lists the others' URLs in `alternate_urls`.
+
+    Sources are compared by MinHash signatures of their content and raw content, taken highest
+    score first, so each copy is matched against the canonical sources kept so far. Responses are
+    copied, not modified, since they may be cached.
+
+    Parameters:
+        search_responses: Tavily search response dicts
+        threshold: Estimated Jaccard similarity above which sources are copies (0 keeps every source)
+
+    Returns:
+        tuple: Search responses without the copies, and a dict of the copies collapsed
+    """
+    if threshold <= 0:
+        return search_responses, {"near_duplicates": 0}
+
+    best: dict[str, dict] = {}
+    for response in search_responses:
+        for source in response["results"]:
+            if source["url"] not in best or source.get("score", 0) > best[source["url"]].get("score", 0):
+                best[source["url"]] = source
+
+    index = MinHashLSH(threshold)
+    canonical_urls: list[str] = []
+    alternates: dict[str, list[str]] = {}
+    copies: set[str] = set()
+    for source in sorted(best.values(), key=lambda source: source.get("score", 0), reverse=True):
+        signature = minhash(f"{source.get('content') or ''}\n\n{source.get('raw_content') or ''}")
+        if signature is None:
+            continue
+        match = index.query(signature)
+        if match is None:
+            index.add(signature)
+            canonical_urls.append(source["url"])
+        else:
+            alternates.setdefault(canonical_urls[match], []).append(source["url"])
+            copies.add(source["url"])
+
+    if not copies:
+        return search_responses, {"near_duplicates": 0}
+    collapsed = [
+        {
+            **response,
+            "results": [
+                {**source, "alternate_urls": alternates[source["url"]]} if source["url"] in alternates else source
+                for source in response["results"]
+                if source["url"] not in copies
+            ]
+        }
+        for response in search_responses
+    ]
+    return collapsed, {"near_duplicates": len(copies)}
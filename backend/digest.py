@@ -0,0 +1,73 @@
+import os
+import re
+
+from ranking import SENTENCE_END, tokenize
+from state import Section
+from utils import count_tokens
+
+# Prompt tokens each finished section's digest can use as intro and conclusion context (0 sends full sections)
+SECTION_DIGEST_TOKENS = int(os.getenv("SECTION_DIGEST_TOKENS", 150))
+
+FIGURE_PATTERN = re.compile(r"\d")
+CITATION_PATTERN = re.compile(r"\[\d+\]")
+
+
+
+def _sentences(content: str) -> list[tuple[str, bool]]:
+    """
+    Splits a section's body into sentences, dropping headings and the sources list.
+
+    Returns:
+        list: Each sentence, and whether it leads its paragraph
+    """
+    body = re.split(r"^#+\s*sources\b.*$", content, maxsplit=1, flags=re.IGNORECASE | re.MULTILINE)[0]
+    sentences = []
+    for paragraph in body.split("\n\n"):
+        lines = [line for line in paragraph.splitlines() if not line.lstrip().startswith("#")]
+        text = " ".join(" ".join(lines).split())
+        for i, sentence in enumerate(SENTENCE_END.split(text) if text else []):
+            sentences.append((sentence, i == 0))
+    return sentences
+
+
+
+def digest_section(section: Section, max_tokens: int = SECTION_DIGEST_TOKENS, model: str = "gpt-4.1") -> str:
+    """
+    Condenses a finished section to its key claims, under a token budget.
+
+    Sentences are scored by whether they carry figures or citations, lead their paragraph, and
+    share terms with the section's description. The best ones that fit the budget are kept in
+    their original order, with their citation ids.
+
+    Parameters:
+        section: Finished section
+        max_tokens: Token budget for the digest
+        model: Model the digest is for, which sets how tokens are counted
+
+    Returns:
+        str: The section's name and key claims
+    """
+    header = f"SECTION: {section.name}\nKEY POINTS:"
+    budget = max_tokens - count_tokens(header, model)
+    focus = set(tokenize(section.description))
+
+    sentences = _sentences(section.content)
+    scored = []
+    for i, (sentence, leads) in enumerate(sentences):
+        terms = set(tokenize(sentence))
+        score = (
+            2.0 * bool(FIGURE_PATTERN.search(CITATION_PATTERN.sub("", sentence)))
+            + 1.0 * bool(CITATION_PATTERN.search(sentence))
+            + 1.0 * leads
+            + (len(terms & focus) / len(focus) if focus else 0.0)
+        )
+        scored.append((score, i))
+
+    kept = []
+    for _, i in sorted(scored, key=lambda item: (-item[0], item[1])):
+        tokens = count_tokens(sentences[i][0], model) + 1
+        if tokens <= budget:
+            kept.append(i)
+            budget -= tokens
+    return "\n".join([header, *(f"- {sentences[i][0]}" for i in sorted(kept))])
+
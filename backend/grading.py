@@ -0,0 +1,153 @@
+import os
+import re
+from typing import Literal, NamedTuple
+
+from metrics import SECTION_GRADES
+from ranking import tokenize
+from state import SearchQuery, Section
+
+# How sections are graded: "local" checks every section offline and sends only borderline ones to
+# the LLM grader, "llm" sends every section to it (both up to SECTION_GRADER_MAX_CALLS a report), and "off" skips grading
+SECTION_GRADING = os.getenv("SECTION_GRADING", "local")
+# Follow-up research rounds per section, and LLM grader calls per report
+SECTION_MAX_FOLLOW_UPS = int(os.getenv("SECTION_MAX_FOLLOW_UPS", 1))
+SECTION_GRADER_MAX_CALLS = int(os.getenv("SECTION_GRADER_MAX_CALLS", 2))
+
+# Word count the section writer prompt asks for
+MIN_WORDS = 100
+MAX_WORDS = 200
+# Shares of the section description's terms the section has to cover to pass, and to not fail
+COVERAGE_PASS = 0.6
+COVERAGE_FAIL = 0.3
+# Highest-scoring sources, of those given to the writer, at least one of which should be cited
+TOP_SOURCES = 2
+
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+SOURCE_LINE_PATTERN = re.compile(r"^\s*[-*]\s*\[(\d+)\].*$", re.MULTILINE)
+SOURCE_URL_PATTERN = re.compile(r"^URL: (\S+)", re.MULTILINE)
+
+
+
+class LocalGrade(NamedTuple):
+    """
+    Offline grade of a written section.
+
+    Attributes:
+        verdict: "pass", "borderline" (worth a second opinion) or "fail"
+        issues: What the checks found
+        follow_up_queries: Queries for the section's missing terms, if it failed
+    """
+    verdict: Literal["pass", "borderline", "fail"]
+    issues: list[str]
+    follow_up_queries: list[SearchQuery]
+
+
+
+def _split_sources(content: str) -> tuple[str, str, str]:
+    """
+    Splits a section into its body, sources heading and sources list.
+    """
+    parts = re.split(r"^(#+\s*sources\b.*)$", content, maxsplit=1, flags=re.IGNORECASE | re.MULTILINE)
+    return (parts[0], parts[1], parts[2]) if len(parts) == 3 else (content, "", "")
+
+
+
+def grade_section(section: Section, source_content_str: str) -> LocalGrade:
+    """
+    Grades a written section without an LLM.
+
+    Checks that the section cites its sources and numbers them 1..n without gaps, stays near the
+    writer prompt's word count, covers the terms of its description, and cites at least one of the
+    highest-scoring sources it was given. Missing citations, a far-off word count or little
+    coverage fail the section; smaller misses make it borderline.
+
+    Parameters:
+        section: Written section
+        source_content_str: Source content the section was written from, highest-scoring source first
+
+    Returns:
+        LocalGrade: Verdict, issues found, and follow-up queries if it failed
+    """
+    body, _, sources = _split_sources(section.content)
+    severe, minor = [], []
+
+    cited = {int(n) for n in CITATION_PATTERN.findall(body)}
+    listed = [int(n) for n in SOURCE_LINE_PATTERN.findall(sources)]
+    if not cited:
+        severe.append("no inline citations")
+    if listed != list(range(1, len(listed) + 1)):
+        minor.append("sources aren't numbered 1..n")
+    if cited - set(listed):
+        minor.append(f"citations without a listed source: {sorted(cited - set(listed))}")
+
+    words = len(re.sub(r"^#.*$", "", body, flags=re.MULTILINE).split())
+    if words < MIN_WORDS // 2 or words > MAX_WORDS * 3 // 2:
+        severe.append(f"{words} words")
+    elif not MIN_WORDS <= words <= MAX_WORDS:
+        minor.append(f"{words} words")
+
+    focus = set(tokenize(section.description))
+    missing = sorted(focus - set(tokenize(body)))
+    coverage = 1 - len(missing) / len(focus) if focus else 1.0
+    if coverage < COVERAGE_FAIL:
+        severe.append(f"covers {coverage:.0%} of the description's terms")
+    elif coverage < COVERAGE_PASS:
+        minor.append(f"covers {coverage:.0%} of the description's terms")
+
+    top_sources = SOURCE_URL_PATTERN.findall(source_content_str)[:TOP_SOURCES]
+    if top_sources and not any(url in sources for url in top_sources):
+        minor.append("cites none of the highest-scoring sources")
+
+    if severe:
+        query = f"{section.name} {' '.join(missing[:8])}" if missing else section.description
+        return LocalGrade("fail", severe + minor, [SearchQuery(search_query=query)])
+    return LocalGrade("borderline" if minor else "pass", minor, [])
+
+
+
+class SectionGrading:
+    """
+    Grading settings and LLM grader budget for one report's sections.
+
+    Parameters:
+        mode: "local", "llm" or "off" (see SECTION_GRADING)
+        max_follow_ups: Follow-up research rounds per section
+        max_llm_calls: LLM grader calls for the whole report, in any mode; sections past it aren't
+            sent to the LLM grader
+    """
+
+    def __init__(self, mode: str = SECTION_GRADING, max_follow_ups: int = SECTION_MAX_FOLLOW_UPS, max_llm_calls: int = SECTION_GRADER_MAX_CALLS):
+        self.mode = mode
+        self.max_follow_ups = max_follow_ups
+        self.max_llm_calls = max_llm_calls
+        self._counters = {
+            "local_pass": 0,
+            "local_borderline": 0,
+            "local_fail": 0,
+            "llm_calls": 0,
+            "llm_pass": 0,
+            "llm_fail": 0,
+            "llm_error": 0,
+            "llm_skipped": 0,
+            "follow_ups": 0,
+        }
+
+    def take_llm_call(self) -> bool:
+        """
+        Uses one of the report's LLM grader calls. Returns False if none are left.
+        """
+        if self._counters["llm_calls"] >= self.max_llm_calls:
+            self._counters["llm_skipped"] += 1
+            return False
+        self._counters["llm_calls"] += 1
+        return True
+
+    def record(self, grader: Literal["local", "llm"], verdict: str) -> None:
+        self._counters[f"{grader}_{verdict}"] += 1
+        SECTION_GRADES.labels(grader, verdict).inc()
+
+    def record_follow_up(self) -> None:
+        self._counters["follow_ups"] += 1
+
+    def stats(self) -> dict:
+        return dict(self._counters)
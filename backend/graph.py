@@ -1,7 +1,8 @@
+import asyncio
+import logging
 from textwrap import dedent
-from typing import Literal
+from typing import Literal, Optional
 
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 
@@ -11,37 +12,339 @@ from langgraph.types import interrupt, Command
 
 # from config import Config
 
+from deadline import degraded, time_left
+from digest import SECTION_DIGEST_TOKENS, digest_section
+from grading import grade_section
+from metrics import observe_node
+from models import ModelSpec, model_registry
+from source_store import source_store
+
 from utils import (
+    SearchBroker,
+    StreamedListParser,
     execute_searches,
     format_sections,
     get_current_utc_datetime,
+    render_sources,
+    search_sources,
 )
 
 from prompts import (
     report_researcher_prompt,
+    report_researcher_inputs,
     report_planner_prompt,
+    report_planner_inputs,
+    batch_section_researcher_prompt,
+    batch_section_researcher_inputs,
     section_researcher_prompt,
+    section_researcher_inputs,
     section_writer_prompt,
     section_writer_inputs,
     section_grader_prompt,
-    introduction_and_conclusion_writer_prompt
+    section_grader_inputs,
+    introduction_and_conclusion_writer_prompt,
+    introduction_and_conclusion_writer_inputs
 )
 
 from state import (
     ReportInputState,
     ReportOutputState,
+    Section,
     Sections,
     ReportState,
     SectionState,
     SectionOutputState,
+    SearchQuery,
     SearchQueries,
+    ReportSearchQueries,
     Feedback
 )
 
+# Models used by the graph's nodes
+QUERY_WRITER = ModelSpec(model="gpt-4.1", schema=SearchQueries)
+# Writes every section's queries in one call
+BATCH_QUERY_WRITER = ModelSpec(model="gpt-4.1", schema=ReportSearchQueries)
+REPORT_PLANNER = ModelSpec(model="o4-mini", schema=Sections)
+# Streams the plan as JSON text, so sections can be researched before the plan is finished
+REPORT_PLANNER_STREAM = ModelSpec(model="o4-mini")
+SECTION_WRITER = ModelSpec(model="gpt-4.1", temperature=0)
+SECTION_GRADER = ModelSpec(model="o4-mini", schema=Feedback)
+
+MODEL_SPECS = [QUERY_WRITER, BATCH_QUERY_WRITER, REPORT_PLANNER, REPORT_PLANNER_STREAM, SECTION_WRITER, SECTION_GRADER]
+
+logger = logging.getLogger(__name__)
+
+
+
+async def write_section_queries(topic: str, section: Section, num_queries: int = 2) -> list[SearchQuery]:
+    """
+    Generates search queries for a section with GPT-4.1.
+    """
+    structured_llm = model_registry.get(QUERY_WRITER)
+
+    # Format system instructions and inputs
+    system_message = section_researcher_prompt.format(
+        num_queries=num_queries
+    )
+    human_message = section_researcher_inputs.format(
+        current_date_and_time=get_current_utc_datetime(),
+        topic=topic,
+        section_topic=section.description
+    )
+
+    queries = await structured_llm.ainvoke([
+        SystemMessage(content=system_message),
+        HumanMessage(content=human_message)
+    ])
+    return queries.queries
+
+
+
+async def write_report_queries(topic: str, sections: list[Section], num_queries: int = 2) -> dict[str, list[SearchQuery]]:
+    """
+    Generates search queries for all of a report's sections in one call to GPT-4.1.
+
+    Returns:
+        dict: Queries by section name, for the sections the model wrote queries for
+    """
+    structured_llm = model_registry.get(BATCH_QUERY_WRITER)
+
+    system_message = batch_section_researcher_prompt.format(
+        num_queries=num_queries
+    )
+    human_message = batch_section_researcher_inputs.format(
+        current_date_and_time=get_current_utc_datetime(),
+        topic=topic,
+        sections="\n\n".join(f"SECTION NAME: {section.name}\nSECTION TOPIC: {section.description}" for section in sections)
+    )
+    report_queries = await structured_llm.ainvoke([
+        SystemMessage(content=system_message),
+        HumanMessage(content=human_message)
+    ])
+    return {entry.section: entry.queries for entry in report_queries.sections if entry.queries}
+
 
 
-# config: RunnableConfig
-async def plan_report(state: ReportState) -> dict:
+async def grade_with_llm(topic: str, section: Section, num_queries: int = 2) -> Feedback:
+    """
+    Grades a written section with o4-mini, which also writes follow-up queries if it fails.
+    """
+    structured_llm = model_registry.get(SECTION_GRADER)
+
+    system_message = section_grader_prompt.format(
+        num_queries=num_queries
+    )
+    human_message = section_grader_inputs.format(
+        current_date_and_time=get_current_utc_datetime(),
+        topic=topic,
+        section_topic=section.description,
+        section_content=section.content
+    )
+    return await structured_llm.ainvoke([
+        SystemMessage(content=system_message),
+        HumanMessage(content=human_message)
+    ])
+
+
+
+async def search_for_section(
+    section: Section,
+    search_queries: list[SearchQuery],
+    use_cache: bool,
+    broker: Optional[SearchBroker],
+    timeout: Optional[float] = None
+) -> tuple[str, dict]:
+    """
+    Searches the web for a section's queries, keeping the page passages most relevant to the section.
+    With `timeout`, searches that take longer are skipped.
+
+    Sources are kept in the source store, and only their URLs and keys are returned, so the
+    section's state stays small. `section_sources` renders them for the section's prompts.
+
+    Returns:
+        tuple: Each packed source's `url` and source store key (`id`), and the tokens used and dropped packing them
+    """
+    queries = [query.search_query for query in search_queries]
+    sources, source_tokens = await search_sources(
+        queries,
+        use_cache=use_cache,
+        model=SECTION_WRITER.model,
+        relevance_query=" ".join([section.description, *queries]),
+        broker=broker,
+        timeout=timeout
+    )
+    return [{"url": source["url"], "id": source_store.put(source)} for source in sources], source_tokens
+
+
+
+async def section_sources(state: SectionState, config: RunnableConfig) -> str:
+    """
+    Renders a section's sources as prompt text, searching for them again if the source store no
+    longer has them (e.g. for a run resumed by another worker).
+    """
+    sources = source_store.get_many([ref["id"] for ref in state["source_refs"]])
+    if sources is None:
+        section = state["section"]
+        queries = [query.search_query for query in state["search_queries"]]
+        sources, _ = await search_sources(
+            queries,
+            model=SECTION_WRITER.model,
+            relevance_query=" ".join([section.description, *queries]),
+            broker=config["configurable"].get("search_broker")
+        )
+    return render_sources(sources)
+
+
+
+class SectionSpeculation:
+    """
+    Research started for a report's sections while the planner is still streaming the plan.
+
+    Each researched section's queries and searches start as soon as its JSON object is complete.
+    The section's nodes use them instead of starting over if the section is unchanged in the final
+    plan, and research for sections the final plan doesn't have is cancelled.
+    """
+
+    def __init__(self):
+        self._queries: dict[tuple[str, str], asyncio.Task] = {}
+        self._searches: dict[tuple[str, str], asyncio.Task] = {}
+        self._counters = {
+            "sections_launched": 0,
+            "queries_used": 0,
+            "searches_used": 0,
+            "sections_discarded": 0,
+        }
+
+    @staticmethod
+    def _key(section: Section) -> tuple[str, str]:
+        return section.name, section.description
+
+    def launch(self, topic: str, section: Section, use_cache: bool, broker: Optional[SearchBroker]) -> None:
+        """
+        Starts generating queries for a researched section, then searching for them.
+        """
+        key = self._key(section)
+        if not section.research or key in self._queries:
+            return
+        queries = asyncio.create_task(write_section_queries(topic, section))
+
+        async def search() -> tuple[list[SearchQuery], str, dict]:
+            search_queries = await queries
+            return search_queries, *await search_for_section(section, search_queries, use_cache, broker)
+
+        self._queries[key] = queries
+        self._searches[key] = asyncio.create_task(search())
+        self._counters["sections_launched"] += 1
+
+    def reconcile(self, sections: list[Section]) -> None:
+        """
+        Cancels research for sections that aren't in the final plan.
+        """
+        planned = {self._key(section) for section in sections if section.research}
+        for key in [key for key in self._queries if key not in planned]:
+            self._queries.pop(key).cancel()
+            self._searches.pop(key).cancel()
+            self._counters["sections_discarded"] += 1
+
+    async def queries(self, section: Section) -> Optional[list[SearchQuery]]:
+        """
+        Returns the queries generated for a section, or None if there are none or generating them failed.
+        """
+        task = self._queries.pop(self._key(section), None)
+        if task is None:
+            return None
+        try:
+            search_queries = await task
+        except Exception:
+            return None
+        self._counters["queries_used"] += 1
+        return search_queries
+
+    async def search(self, section: Section, search_queries: list[SearchQuery]) -> Optional[tuple[str, dict]]:
+        """
+        Returns the search results for a section, or None if there are none for these queries or searching failed.
+        """
+        task = self._searches.pop(self._key(section), None)
+        if task is None:
+            return None
+        try:
+            launched_queries, source_refs, source_tokens = await task
+        except Exception:
+            return None
+        if launched_queries != search_queries:
+            return None
+        self._counters["searches_used"] += 1
+        return source_refs, source_tokens
+
+    def cancel(self) -> None:
+        for task in [*self._queries.values(), *self._searches.values()]:
+            task.cancel()
+        self._queries.clear()
+        self._searches.clear()
+
+    def stats(self) -> dict:
+        return dict(self._counters)
+
+
+
+async def stream_report_plan(messages: list, on_section) -> Sections:
+    """
+    Streams the report plan from o4-mini as JSON, calling `on_section` with each section as soon as it's complete.
+    """
+    llm = model_registry.get(REPORT_PLANNER_STREAM).bind(response_format=Sections)
+    parser = StreamedListParser("sections")
+    async for chunk in llm.astream(messages):
+        for item in parser.feed(chunk.content):
+            on_section(Section.model_validate(item))
+    return Sections.model_validate_json(parser.text)
+
+
+
+def fallback_plan(topic: str) -> Sections:
+    """
+    A plan with one researched section for the whole topic, for reports whose planner runs out of time.
+    """
+    return Sections(sections=[
+        Section(name="Introduction", description=f"Brief overview of {topic}", research=False, content=""),
+        Section(name="Overview", description=topic, research=True, content=""),
+        Section(name="Conclusion", description=f"Key take-aways on {topic}", research=False, content=""),
+    ])
+
+
+
+async def finished_section(section: Section, cut_short: Optional[list[dict]] = None, state: Optional[SectionState] = None) -> dict:
+    """
+    State update for a finished researched section, with its digest for the intro and conclusion writers.
+    With the section's `state`, the queries and source hashes it was written from are kept for refreshing it.
+    """
+    update = {"finished_sections_list": [section]}
+    if SECTION_DIGEST_TOKENS > 0:
+        # Tokenizing the section is CPU-bound, so it runs off the event loop the other sections share
+        digest = await asyncio.to_thread(digest_section, section, model=SECTION_WRITER.model)
+        update["section_digests"] = [{"section": section.name, "digest": digest}]
+    if cut_short:
+        update["degraded"] = cut_short
+    if state is not None:
+        update["section_evidence"] = [{
+            "section": section.name,
+            # Follow-up rounds add to what the section was written from
+            "queries": list(dict.fromkeys(state.get("searched_queries", []))),
+            "sources": state.get("source_hashes", {})
+        }]
+    return update
+
+
+
+def unwritten_section(section: Section, reason: str) -> str:
+    """
+    Content standing in for a section that couldn't be written before the report's deadline.
+    """
+    return f"## {section.name}\n\n_This section was not written: {reason}._"
+
+
+
+@observe_node
+async def plan_report(state: ReportState, config: RunnableConfig) -> dict:
     """
     Plans a report that answers a user's current events-related question
     
@@ -52,12 +355,24 @@ async def plan_report(state: ReportState) -> dict:
     
     Parameters:
         state: Graph state with the user's question
-        config
+        config: Run config (`bypass_search_cache` skips cached search results, `search_broker` shares searches across the report,
+            `section_speculation` streams the plan and starts researching sections as they arrive,
+            `deadline` limits how long planning can take, `refresh_from` is a stored report whose plan is reused)
         
     Returns:
-        dict: Generated sections
+        dict: Generated sections, and whether the plan was cut short by the deadline
     """
     topic = state['topic']
+
+    # A refresh keeps the stored report's plan. Researched sections start blank, as in a new plan, and
+    # the other sections keep their content in case nothing they summarize changed.
+    stored = config["configurable"].get("refresh_from")
+    if stored is not None:
+        sections = [
+            Section(**{**section, "content": "" if section["research"] else section["content"]})
+            for section in stored["sections"]
+        ]
+        return {"sections": sections, "degraded": []}
     # feedback = state.get('feedback', '')
 
     # configurable = Config.from_runnable_config(config)
@@ -77,83 +392,155 @@ async def plan_report(state: ReportState) -> dict:
     """)
 
     num_queries = 2
+    use_cache = not config["configurable"].get("bypass_search_cache", False)
+    broker = config["configurable"].get("search_broker")
 
+    # With a deadline, each step gets a share of the planning time left and the planner the rest
     query = [topic]
-    search_result = await execute_searches(query, depth="advanced")
+    search_result, _ = await execute_searches(
+        query, depth="advanced", use_cache=use_cache, model=QUERY_WRITER.model, broker=broker,
+        timeout=time_left(config, "plan", 1 / 4)
+    )
 
     # Search queries LLM
-    llm = init_chat_model(model="gpt-4.1", model_provider="openai")
-    structured_llm = llm.with_structured_output(SearchQueries)
+    structured_llm = model_registry.get(QUERY_WRITER)
 
+    # Static instructions go in the system message and volatile inputs after them, so the prefix can be cached
     system_message = report_researcher_prompt.format(
-        current_date_and_time=get_current_utc_datetime(),
-        topic=topic,
         report_structure=report_structure,
-        context=search_result,
         num_queries=num_queries
     )
+    human_message = report_researcher_inputs.format(
+        current_date_and_time=get_current_utc_datetime(),
+        topic=topic,
+        context=search_result
+    )
 
     # Generate queries as a SearchQueries object
-    search_queries_object = structured_llm.invoke(
-        [
-            SystemMessage(content=system_message),
-            HumanMessage(content="Generate search queries that will help in planning the sections of the report.")
-        ]
-    )
+    try:
+        search_queries_object = await asyncio.wait_for(
+            structured_llm.ainvoke([
+                SystemMessage(content=system_message),
+                HumanMessage(content=human_message)
+            ]),
+            time_left(config, "plan", 1 / 3)
+        )
+        queries = [query.search_query for query in search_queries_object.queries]
+    except TimeoutError:
+        queries = []
 
-    queries = [query.search_query for query in search_queries_object.queries]
-    search_results = await execute_searches(queries, depth="basic")
+    search_results, _ = await execute_searches(
+        queries, depth="basic", use_cache=use_cache, model=REPORT_PLANNER.model, broker=broker,
+        timeout=time_left(config, "plan", 1 / 3)
+    )
 
     system_message = report_planner_prompt.format(
+        report_structure=report_structure
+    )
+    human_message = report_planner_inputs.format(
         current_date_and_time=get_current_utc_datetime(),
         topic=topic,
-        report_structure=report_structure,
-        context=search_results,
+        context=search_results
     )
-
-    human_message = "Generate the sections of the report. Your response must include a sections field containing a list of sections. Each section must include name, description, research, and content fields."
     
-    # Report planner LLM
-    llm = init_chat_model(model="o4-mini", model_provider="openai")
-    structured_llm = llm.with_structured_output(Sections)
-
-    report_sections = structured_llm.invoke([
+    messages = [
         SystemMessage(content=system_message),
         HumanMessage(content=human_message)
-    ])
+    ]
+
+    speculation = config["configurable"].get("section_speculation")
+    try:
+        if speculation is None:
+            # Report planner LLM
+            structured_llm = model_registry.get(REPORT_PLANNER)
+            report_sections = await asyncio.wait_for(structured_llm.ainvoke(messages), time_left(config, "plan"))
+        else:
+            report_sections = await asyncio.wait_for(
+                stream_report_plan(
+                    messages,
+                    lambda section: speculation.launch(topic, section, use_cache, broker)
+                ),
+                time_left(config, "plan")
+            )
+        cut_short = []
+    except TimeoutError:
+        report_sections = fallback_plan(topic)
+        cut_short = [degraded("plan", "The planner ran out of time, so the report covers the topic in one section")]
+    if speculation is not None:
+        speculation.reconcile(report_sections.sections)
 
     # Get sections
     sections = report_sections.sections
 
     # Updates sections in the report state
-    return {"sections": sections}
+    return {"sections": sections, "degraded": cut_short}
 
 
 
-def initiate_section_writing(state: ReportState) -> Command[Literal["build_section"]]:
+@observe_node
+async def initiate_section_writing(state: ReportState, config: RunnableConfig) -> Command[Literal["build_section"]]:
+    """
+    Starts building each researched section in parallel.
+
+    With `batch_section_queries` in the run config, every section's search queries are written in
+    one call and sent with the section, so its subgraph goes straight to searching. Sections the
+    call has no queries for (or all of them, if it runs past the deadline) write their own.
+
+    With `refresh_from`, sections of the stored report are sent with the queries, content and source
+    hashes they were last written from, so they're searched again and only rewritten if their
+    sources changed.
+    """
+    sections = [section for section in state['sections'] if section.research]
+
+    queries, previous = {}, {}
+    stored = config["configurable"].get("refresh_from")
+    if stored is not None:
+        contents = {section["name"]: section["content"] for section in stored["sections"]}
+        for name, evidence in stored["evidence"].items():
+            queries[name] = [SearchQuery(search_query=query) for query in evidence["queries"]]
+            previous[name] = {"previous_content": contents.get(name, ""), "previous_sources": evidence["sources"]}
+
+    unqueried = [section for section in sections if section.name not in queries]
+    # Speculative runs have already started writing each section's queries
+    if unqueried and config["configurable"].get("batch_section_queries") and config["configurable"].get("section_speculation") is None:
+        try:
+            queries.update(await asyncio.wait_for(write_report_queries(state['topic'], unqueried), time_left(config, "research", 1 / 2)))
+        except TimeoutError:
+            pass
+
     return Command(goto = [
         Send(
             "build_section",
             {
                 "topic": state['topic'],
                 "section": section,
-                "search_iterations": 0
+                "search_iterations": 0,
+                **({"search_queries": queries[section.name]} if section.name in queries else {}),
+                **previous.get(section.name, {})
             }
         )
-        for section in state['sections']
-        if section.research
+        for section in sections
     ])
 
 
 
-# config: RunnableConfig
-def generate_queries(state: SectionState):
+def route_section_research(state: SectionState) -> Literal["generate_queries", "search_web"]:
+    """
+    Skips writing queries for sections that were sent with them.
+    """
+    return "search_web" if state.get("search_queries") else "generate_queries"
+
+
+
+@observe_node
+async def generate_queries(state: SectionState, config: RunnableConfig):
     """
     Generates search queries based on the section topic and description.
     
     Parameters:
         state: Current section state
-        config
+        config: Run config (`section_speculation` may already have queries for the section, `deadline` limits how long
+            generating them can take)
         
     Returns:
         Dict containing the generated search queries
@@ -169,34 +556,35 @@ def generate_queries(state: SectionState):
 
     num_queries = 2
 
-    # Generate queries
-    llm = init_chat_model(model="gpt-4.1", model_provider="openai")
-    structured_llm = llm.with_structured_output(SearchQueries)
+    # Queries get half of the research time left, so searching them gets the rest
+    speculation = config["configurable"].get("section_speculation")
+    try:
+        queries = None
+        if speculation is not None:
+            queries = await asyncio.wait_for(speculation.queries(section), time_left(config, "research", 1 / 2))
+        if queries is None:
+            queries = await asyncio.wait_for(write_section_queries(topic, section, num_queries), time_left(config, "research", 1 / 2))
+    except TimeoutError:
+        # Search for the section's description rather than not at all
+        return {
+            "search_queries": [SearchQuery(search_query=section.description)],
+            "degraded": [degraded("queries", "Search queries ran out of time, so the section's description was searched", section.name)]
+        }
 
-    # Format system instructions
-    system_message = section_researcher_prompt.format(
-        current_date_and_time=get_current_utc_datetime(),
-        topic=topic,
-        section_topic=section.description,
-        num_queries=num_queries
-    )
+    return {"search_queries": queries}
 
-    # Generate queries  
-    queries = structured_llm.invoke([
-        SystemMessage(content=system_message),
-        HumanMessage(content="Generate search queries on the provided topic.")
-    ])
-
-    return {"search_queries": queries.queries}
 
 
-
-async def search_web(state: SectionState):
+@observe_node
+async def search_web(state: SectionState, config: RunnableConfig):
     """
     Executes web searches for the generated queries.
 
     Parameters:
         state: Current section state with search queries
+        config: Run config (`bypass_search_cache` skips cached search results, `search_broker` shares searches across the report,
+            `section_speculation` may already have searched for the section's queries, `deadline` skips searches that
+            don't finish in time)
         
     Returns:
         Dict with search results and updated iteration count
@@ -204,32 +592,55 @@ async def search_web(state: SectionState):
 
     # Get state
     search_queries = state["search_queries"]
+    section = state["section"]
 
-    # Web search
-    queries = [query.search_query for query in search_queries]
-
-    # Search the web with parameters
-    source_content_str = await execute_searches(queries)
-
-    return {
-        "source_content_str": source_content_str,
+    speculation = config["configurable"].get("section_speculation")
+    results = None
+    if speculation is not None:
+        try:
+            results = await asyncio.wait_for(speculation.search(section, search_queries), time_left(config, "research"))
+        except TimeoutError:
+            results = [], {"searches_late": len(search_queries)}
+    if results is None:
+        # Search the web with parameters, keeping the page passages most relevant to the section
+        use_cache = not config["configurable"].get("bypass_search_cache", False)
+        results = await search_for_section(
+            section, search_queries, use_cache, config["configurable"].get("search_broker"), time_left(config, "research")
+        )
+    source_refs, source_tokens = results
+
+    update = {
+        "source_refs": source_refs,
+        "source_tokens": source_tokens,
+        # Source store keys are hashes of the packed sources
+        "searched_queries": [query.search_query for query in search_queries],
+        "source_hashes": {ref["url"]: ref["id"] for ref in source_refs},
         "search_iterations": state["search_iterations"] + 1
     }
+    if source_tokens.get("searches_late"):
+        update["degraded"] = [degraded(
+            "sources",
+            f"{source_tokens['searches_late']} of {len(search_queries)} searches missed the deadline",
+            section.name
+        )]
+    return update
 
 
 
-# config: RunnableConfig
-def write_section(state: SectionState) -> Command[Literal[END, 'search_web']]:
+@observe_node
+async def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, 'search_web']]:
     """
     Writes a section of the report and evaluates if more research is needed.
 
     (1) Writes the section using the search results.
     (2) Evaluates the quality of the section.
     (3) Completes the section if quality passes and does more research if quality fails.
+
+    A section being refreshed whose sources are unchanged keeps its stored content instead.
     
     Args:
         state: Current section state with search results
-        config
+        config: Run config (`deadline` limits how long writing can take, `section_grading` sets how the section is graded)
         
     Returns:
         Command to complete section or do more research
@@ -238,15 +649,25 @@ def write_section(state: SectionState) -> Command[Literal[END, 'search_web']]:
     # Get state 
     topic = state["topic"]
     section = state["section"]
-    source_content_str = state["source_content_str"]
 
-    # Format system message
-    formatted_section_writer_prompt = section_writer_prompt.format(
-        current_date_and_time=get_current_utc_datetime()
-    )
+    source_tokens = state.get("source_tokens", {})
+    if source_tokens.get("searches_late") and not source_tokens.get("sources"):
+        section.content = unwritten_section(section, "its sources didn't arrive before the report's deadline")
+        return Command(update=await finished_section(section, [degraded("content", "No sources arrived in time", section.name)]), goto=END)
+
+    # The same sources would be written up the same way
+    if state.get("previous_content") and state.get("previous_sources") == state["source_hashes"]:
+        section.content = state["previous_content"]
+        return Command(update={**(await finished_section(section, state=state)), "reused_sections": [section.name]}, goto=END)
+
+    source_content_str = await section_sources(state, config)
+
+    # Format system message (static, so it's a cacheable prefix shared by every section)
+    formatted_section_writer_prompt = section_writer_prompt
 
     # Format human message
     formatted_section_writer_inputs = section_writer_inputs.format(
+        current_date_and_time=get_current_utc_datetime(),
         topic=topic,
         section_name=section.name,
         section_topic=section.description,
@@ -254,52 +675,68 @@ def write_section(state: SectionState) -> Command[Literal[END, 'search_web']]:
         section_content=section.content
     )
 
-    llm = init_chat_model(model="gpt-4.1", model_provider="openai", temperature=0)
-    section_content = llm.invoke([
-        SystemMessage(content=formatted_section_writer_prompt),
-        HumanMessage(content=formatted_section_writer_inputs)
-    ])
+    # Section name is tagged so streamed tokens can be attributed to the section
+    llm = model_registry.get(SECTION_WRITER).with_config(metadata={"section": section.name})
+    try:
+        section_content = await asyncio.wait_for(
+            llm.ainvoke([
+                SystemMessage(content=formatted_section_writer_prompt),
+                HumanMessage(content=formatted_section_writer_inputs)
+            ]),
+            time_left(config, "write")
+        )
+    except TimeoutError:
+        section.content = unwritten_section(section, "writing it ran past the report's deadline")
+        return Command(update=await finished_section(section, [degraded("content", "Writing ran out of time", section.name)]), goto=END)
     
     # Write content to the section object
     section.content = section_content.content
 
-    # AGENT FEEDBACK DISABLED TO MINIMIZE API CALLS
-
-    # configurable = Config.from_runnable_config(config)
-
-    # section_grader_message = "Grade the following section of a news-style report. Consider follow-up questions for missing information. If the grade is 'pass', return empty strings for the follow-up queries. If the grade is 'fail', provide specific search queries to gather the missing information."
-    
-    # formatted_section_grader_prompt = section_grader_prompt.format(
-    #     current_date_and_time=get_current_utc_datetime(),
-    #     topic=topic,
-    #     section_topic=section.description,
-    #     section_content=section.content,
-    #     num_queries=configurable.num_follow_up_queries
-    # )
-
-    # structured_llm = init_chat_model(model="o4-mini", model_provider="openai").with_structured_output(Feedback)
-    # feedback = structured_llm.invoke([
-    #     SystemMessage(content=formatted_section_grader_prompt),
-    #     HumanMessage(content=section_grader_message)
-    # ])
-
-    # if feedback.grade == "pass" or state["search_iterations"] >= configurable.max_follow_up_iterations:
-    #     return Command(update={"finished_sections_list": [section]}, goto=END)
-    # else:
-    #     return  Command(update={"search_queries": feedback.follow_up_queries, "section": section}, goto="search_web")
-
-    return Command(update={"finished_sections_list": [section]}, goto=END)
-
-
-
-def write_intro_and_conclusion(state: SectionState):
+    # Runs with a deadline don't have time for follow-up research
+    grading = config["configurable"].get("section_grading")
+    if grading is None or grading.mode == "off" or config["configurable"].get("deadline") is not None \
+            or state["search_iterations"] > grading.max_follow_ups:
+        return Command(update=await finished_section(section, state=state), goto=END)
+
+    # Sections are checked offline first, and only borderline ones get the LLM grader's opinion
+    follow_up_queries = []
+    escalate = grading.mode == "llm"
+    if grading.mode == "local":
+        grade = grade_section(section, source_content_str)
+        grading.record("local", grade.verdict)
+        follow_up_queries = grade.follow_up_queries
+        escalate = grade.verdict == "borderline"
+    if escalate and grading.take_llm_call():
+        try:
+            feedback = await grade_with_llm(topic, section)
+        except Exception as e:
+            # The section is written, so a grader that fails only costs the second opinion
+            logger.warning("Grading %s failed, keeping it as written: %s", section.name, e)
+            grading.record("llm", "error")
+            return Command(update=await finished_section(section, state=state), goto=END)
+        grading.record("llm", feedback.grade)
+        if feedback.grade == "fail":
+            follow_up_queries = [query for query in feedback.follow_up_queries if query.search_query.strip()]
+
+    if follow_up_queries:
+        grading.record_follow_up()
+        return Command(update={"search_queries": follow_up_queries, "section": section}, goto="search_web")
+
+    return Command(update=await finished_section(section, state=state), goto=END)
+
+
+
+@observe_node
+async def write_intro_and_conclusion(state: SectionState, config: RunnableConfig):
     """
     Write the intro and conclusion.
     
     Handles introduction and conclusion sections and summaries that use researched sections as context.
+    A refreshed report whose researched sections were all kept also keeps these sections' content.
     
     Parameters:
         state: Current section state with finished  sections as context
+        config: Run config (`deadline` limits how long writing can take)
 
     Returns:
         Dict containing the newly written section
@@ -307,10 +744,23 @@ def write_intro_and_conclusion(state: SectionState):
 
     topic = state["topic"]
     section = state["section"]
-    finished_sections = state["finished_sections_str"]
+
+    if state.get("previous_content"):
+        section.content = state["previous_content"]
+        return {"finished_sections_list": [section], "reused_sections": [section.name]}
+
+    finished_sections = source_store.get(state["finished_sections_ref"])
+    if finished_sections is None:
+        # Evicted (or stored by another worker): rebuild it from each section's stored part
+        logger.warning("Finished sections %s are no longer stored, rebuilding them for %s", state["finished_sections_ref"], section.name)
+        parts = source_store.get_many([part["ref"] for part in state.get("finished_section_refs", [])])
+        if not parts:
+            raise RuntimeError(f"The finished sections {section.name} is written from are no longer stored")
+        finished_sections = "".join(parts)
     
-    # Format system instructions
-    system_message = introduction_and_conclusion_writer_prompt.format(
+    # Format system instructions and inputs
+    system_message = introduction_and_conclusion_writer_prompt
+    human_message = introduction_and_conclusion_writer_inputs.format(
         current_date_and_time=get_current_utc_datetime(),
         topic=topic,
         section_name=section.name,
@@ -318,12 +768,19 @@ def write_intro_and_conclusion(state: SectionState):
         context=finished_sections
     )
 
-    llm = init_chat_model(model="gpt-4.1", model_provider="openai", temperature=0)
+    llm = model_registry.get(SECTION_WRITER).with_config(metadata={"section": section.name})
     
-    section_content = llm.invoke([
-        SystemMessage(content=system_message),
-        HumanMessage(content="Write a section of a report that answers a user's current events question using the information you were provided.")
-    ])
+    try:
+        section_content = await asyncio.wait_for(
+            llm.ainvoke([
+                SystemMessage(content=system_message),
+                HumanMessage(content=human_message)
+            ]),
+            time_left(config, "finish")
+        )
+    except TimeoutError:
+        section.content = unwritten_section(section, "writing it ran past the report's deadline")
+        return {"finished_sections_list": [section], "degraded": [degraded("content", "Writing ran out of time", section.name)]}
     
     # Write content to the section object
     section.content = section_content.content
@@ -332,21 +789,56 @@ def write_intro_and_conclusion(state: SectionState):
 
 
 
-def format_sections_as_string(state: ReportState) -> dict:
+@observe_node
+async def format_sections_as_string(state: ReportState) -> dict:
     """
     Formats finished sections as a string to be used as context for writing the introduction and conclusion.
+
+    Each section's digest is built as the section finishes, so this only joins them. Without
+    digests (SECTION_DIGEST_TOKENS=0), the full sections are used. The context is kept in the
+    source store, so the writers are sent its key rather than a copy.
     
     Parameters:
         state: Current report state
         
     Returns:
-        Dict with formatted sections as context
+        Dict with the source store keys of the formatted sections, together and by section
     """
-    return {"finished_sections_str": format_sections(state["finished_sections_list"])}
+    digests = {digest["section"]: digest["digest"] for digest in state.get("section_digests", [])}
+    finished = finished_in_plan_order(state)
+    parts = [section_context(section, digests.get(section.name)) for section in finished]
+    return {
+        "finished_sections_ref": source_store.put("".join(parts)),
+        # Each section's part is stored too, so a writer can rebuild the context if it's evicted
+        "finished_section_refs": [
+            {"section": section.name, "ref": source_store.put(part)}
+            for section, part in zip(finished, parts)
+        ]
+    }
 
 
 
-def initiate_intro_and_conclusion_writing(state: ReportState):
+def finished_in_plan_order(state: ReportState) -> list[Section]:
+    """
+    Returns the finished sections in the order the report plans them.
+    """
+    finished = {section.name: section for section in state["finished_sections_list"]}
+    return [finished[section.name] for section in state["sections"] if section.name in finished]
+
+
+
+def section_context(section: Section, digest: Optional[str] = None) -> str:
+    """
+    Formats a finished section as context for the sections that summarize the report: its digest
+    if it has one, otherwise the full section.
+    """
+    if digest is not None:
+        return f"{digest}\n\n{'-' * 80}\n\n"
+    return format_sections([section])
+
+
+
+async def initiate_intro_and_conclusion_writing(state: ReportState):
     """
     Creates parallel tasks to write non-researched sections.
     
@@ -357,13 +849,19 @@ def initiate_intro_and_conclusion_writing(state: ReportState):
         List of Send commands for parallelized section writing
     """
 
+    # In a refresh, sections that summarize the others are only rewritten if one of those was
+    researched = {section.name for section in state["sections"] if section.research}
+    reuse = bool(researched) and researched <= set(state.get("reused_sections", []))
+
     return [
         Send(
             "write_intro_and_conclusion",
             {
                 "topic": state["topic"],
                 "section": section,
-                "finished_sections_str": state["finished_sections_str"]
+                "finished_sections_ref": state["finished_sections_ref"],
+                "finished_section_refs": state.get("finished_section_refs", []),
+                **({"previous_content": section.content} if reuse and section.content else {})
             }
         ) 
         for section in state["sections"] 
@@ -372,9 +870,13 @@ def initiate_intro_and_conclusion_writing(state: ReportState):
 
 
 
-def compile_report(state: ReportState):
+@observe_node
+async def compile_report(state: ReportState):
     """
     Compiles the sections of the report.
+
+    Sections cut short to meet the report's deadline end with a note saying how, and a report
+    whose plan was cut short starts with one.
     
     Parameters:
         state: Current report state
@@ -385,12 +887,23 @@ def compile_report(state: ReportState):
 
     sections = state["sections"]
     finished_sections = {section.name: section.content for section in state["finished_sections_list"]}
+    notes = {}
+    for part in state.get("degraded", []):
+        # Unwritten sections already say so in their content
+        if part["part"] != "content":
+            notes.setdefault(part["section"], []).append(part["detail"])
 
     for section in sections:
         if section.name in finished_sections:
             section.content = finished_sections[section.name]
+        elif not section.content:
+            section.content = unwritten_section(section, "it wasn't finished before the report's deadline")
+        if section.name in notes:
+            section.content += f"\n\n_Partial section: {'; '.join(notes[section.name])}._"
 
     report = "\n\n".join([section.content for section in sections])
+    if None in notes:
+        report = f"_Partial report: {'; '.join(notes[None])}._\n\n{report}"
 
     return {"finished_report": report}
 
@@ -403,7 +916,7 @@ section_builder.add_node("generate_queries", generate_queries)
 section_builder.add_node("search_web", search_web)
 section_builder.add_node("write_section", write_section)
 # Add edges
-section_builder.add_edge(START, "generate_queries")
+section_builder.add_conditional_edges(START, route_section_research, ["generate_queries", "search_web"])
 section_builder.add_edge("generate_queries", "search_web")
 section_builder.add_edge("search_web", "write_section")
 
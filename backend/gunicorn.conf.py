@@ -0,0 +1,24 @@
+import os
+import shutil
+import tempfile
+
+# Workers write Prometheus metrics to files here so /metrics on any worker reports all of them.
+# Must be set before prometheus_client is imported anywhere.
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="cera-metrics-")
+
+# Imported up front, since importing it in a signal handler during shutdown can fail
+from prometheus_client import multiprocess
+
+
+
+def on_starting(server):
+    # Metrics left by a previous run would be counted again
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,27 +1,68 @@
 import os
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
-import json
+import asyncio
+import math
+import time
+from typing import Literal, Optional
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.encoders import jsonable_encoder
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sse_starlette.sse import EventSourceResponse
 import uvicorn
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-from graph import graph
-from state import ReportInputState
-
+# Load .env before importing modules that read their settings at import time
 load_dotenv()
 
+from deadline import Deadline
+from graph import builder, graph, MODEL_SPECS, SectionSpeculation
+from grading import SectionGrading
+from metrics import render as render_metrics, track_report, track_stream
+from models import model_registry
+from report_store import StoredReport, create_report_store
+from runs import RunLog, SingleFlight
+from scheduler import Overloaded, ReportScheduler
+from search import search_client
+from shared import shared_state
+from source_store import source_store
+from sse import TokenBatcher, dumps, step_event, with_ticks
+from state import ReportInputState
+from utils import SearchBroker, normalize_topic, search_cache
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     missing_keys = [k for k in ("OPENAI_API_KEY", "TAVILY_API_KEY") if not os.getenv(k)]
     if missing_keys:
         raise RuntimeError(f"Missing API keys: {', '.join(missing_keys)}")
-    yield
+    model_registry.start(MODEL_SPECS)
+    async with AsyncSqliteSaver.from_conn_string(os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite3")) as checkpointer:
+        # Runs are checkpointed so a reconnecting client can resume them
+        app.state.checkpointer = checkpointer
+        app.state.graph = builder.compile(checkpointer=checkpointer)
+        for run_id in await run_log.prune():
+            await delete_checkpoints(checkpointer, run_id)
+        yield
+    await model_registry.aclose()
+    await search_client.aclose()
+    if shared_state is not None:
+        await shared_state.close()
 
 app = FastAPI(lifespan=lifespan)
+# Finished reports, replayed to later requests for the same topic
+report_store = create_report_store(shared_state)
+# Runs and their step events, for resuming streams
+run_log = RunLog(os.getenv("RUN_LOG_PATH", "runs.sqlite3"))
+# Research sections as the planner streams them instead of waiting for the whole plan
+SPECULATIVE_PLANNING = os.getenv("SPECULATIVE_PLANNING", "false").lower() == "true"
+# Write every section's search queries in one call after planning instead of one call per section
+BATCH_SECTION_QUERIES = os.getenv("BATCH_SECTION_QUERIES", "false").lower() == "true"
+# Limits graph runs in this worker; requests beyond the queue are shed with 503
+report_scheduler = ReportScheduler(
+    max_running=int(os.getenv("REPORT_MAX_CONCURRENCY", 4)),
+    max_queued=int(os.getenv("REPORT_MAX_QUEUE", 16)),
+    estimated_run_seconds=float(os.getenv("REPORT_ESTIMATED_SECONDS", 60))
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,36 +78,284 @@ app.add_middleware(
 def root():
     return {"status": "OK"}
 
+@app.get("/stats", status_code=200)
+def stats():
+    return {
+        "models": model_registry.stats(),
+        "search": search_client.stats(),
+        "search_cache": search_cache.stats(),
+        "search_coalescing": SearchBroker.totals(),
+        "report_runs": report_runs.stats(),
+        "report_scheduler": report_scheduler.stats(),
+        "report_store": report_store.stats(),
+        "source_store": source_store.stats(),
+        "shared_state": shared_state.stats() if shared_state is not None else None
+    }
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics for every worker: node durations, token usage, searches, open streams and runs in flight.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+async def delete_checkpoints(checkpointer: AsyncSqliteSaver, run_id: str) -> None:
+    """
+    Deletes a run's checkpoints once they're no longer needed (this AsyncSqliteSaver has no adelete_thread).
+    """
+    await checkpointer.setup()
+    async with checkpointer.lock:
+        await checkpointer.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (run_id,))
+        await checkpointer.conn.execute("DELETE FROM writes WHERE thread_id = ?", (run_id,))
+        await checkpointer.conn.commit()
+
+async def report_events(run_id: str, params: dict, resume: bool = False, deadline: Optional[Deadline] = None):
+    """
+    Runs the graph and yields an SSE event for each node update.
+
+    Step events carry only the fields the client needs, or the node's full state diff with `verbose`.
+    With `tokens`, section text is also streamed as `token` events tagged with the section name, and
+    a `token_reset` event starts each rewrite of a section after follow-up research.
+
+    With `resume`, the run continues from its last checkpoint instead of starting over.
+
+    With a `deadline`, parts that can't be done in time are cut short, and a final `degraded`
+    event lists them.
+
+    With `refresh`, the topic's stored report is updated rather than rewritten, and a final
+    `refresh` event counts the sections reused and rewritten.
+
+    A final `searches` event counts the searches the report's sections shared. Reports that weren't
+    cut short are stored, with their sections and sources, for replay and refresh.
+    """
+    report_graph = getattr(app.state, "graph", graph)
+    key = normalize_topic(params["topic"])
+    tokens, verbose = params["tokens"], params["verbose"]
+
+    input_state = None if resume else ReportInputState(topic=params["topic"])
+    stored = await report_store.get(key, max_age=report_store.retain) if params.get("refresh") else None
+    if stored is not None and not (stored.get("sections") and stored.get("evidence")):
+        stored = None
+    broker = SearchBroker()
+    speculation = SectionSpeculation() if SPECULATIVE_PLANNING else None
+    config = {"configurable": {
+        "thread_id": run_id,
+        # A refresh has to see what the sources say now
+        "bypass_search_cache": params["fresh"] or stored is not None,
+        "refresh_from": stored,
+        "search_broker": broker,
+        "section_speculation": speculation,
+        "batch_section_queries": BATCH_SECTION_QUERIES,
+        "section_grading": SectionGrading(),
+        "deadline": deadline
+    }}
+
+    start = time.monotonic()
+    events = []
+    finished_report = None
+    degraded = []
+    sections, contents, evidence, reused = [], {}, {}, []
+    batcher = TokenBatcher()
+
+    stream_mode = ["updates", "messages"] if tokens else ["updates"]
+
+    if resume:
+        # Sections finished before the run stopped may never have been streamed
+        snapshot = await report_graph.aget_state(config)
+        yield step_event("resume", {"finished_sections_list": snapshot.values.get("finished_sections_list", [])}, verbose)
+
+    try:
+        # https://langchain-ai.github.io/langgraph/how-tos/streaming-subgraphs/
+        stream = report_graph.astream(input_state, config, stream_mode=stream_mode, subgraphs=True)
+        # Ticks while the graph is quiet so tokens buffered before a stall are still sent on time
+        async for item in with_ticks(stream, batcher.max_delay):
+            for event in batcher.due():
+                yield event
+            if item is None:
+                continue
+
+            namespace, mode, chunk = item
+            if mode == "messages":
+                message, metadata = chunk
+                # Only the section writers tag their calls with a section
+                if "section" in metadata:
+                    for event in batcher.add(metadata["section"], message.content, metadata.get("langgraph_checkpoint_ns")):
+                        yield event
+                continue
+
+            for event in batcher.flush():
+                yield event
+
+            node, diff = next(iter(chunk.items()))
+            # Subgraph parts reach the top level with their section's update
+            if not namespace and diff:
+                degraded.extend(diff.get("degraded", []))
+                sections = diff.get("sections", sections)
+                contents.update((section.name, section.content) for section in diff.get("finished_sections_list", []))
+                evidence.update((entry["section"], {"queries": entry["queries"], "sources": entry["sources"]}) for entry in diff.get("section_evidence", []))
+                reused.extend(diff.get("reused_sections", []))
+            event = step_event(node, diff, verbose)
+            events.append((time.monotonic() - start, event))
+            if node == "compile_report":
+                finished_report = diff["finished_report"]
+            yield event
+    finally:
+        # Research started for sections the run never got to
+        if speculation is not None:
+            speculation.cancel()
+
+    for event in batcher.flush():
+        yield event
+
+    yield {
+        "event": "searches",
+        "data": dumps(broker.stats())
+    }
+
+    if deadline is not None:
+        yield {
+            "event": "degraded",
+            "data": dumps({"deadline": deadline.seconds, "elapsed": round(deadline.elapsed(), 3), "parts": degraded})
+        }
+
+    if stored is not None and finished_report is not None:
+        yield {
+            "event": "refresh",
+            "data": dumps({
+                "stored_at": stored["stored_at"],
+                "reused": len(reused),
+                "rewritten": len(sections) - len(reused),
+                "reused_sections": reused
+            })
+        }
+
+    if finished_report is not None and report_graph.checkpointer is not None:
+        await delete_checkpoints(report_graph.checkpointer, run_id)
+
+    # Verbose and resumed runs aren't stored since their events aren't a full, client-ready replay,
+    # and partial reports so they don't stand in for a full one
+    if finished_report is not None and not verbose and not resume and not degraded:
+        await report_store.put(key, StoredReport(
+            topic=params["topic"],
+            finished_report=finished_report,
+            events=events,
+            stored_at=time.time(),
+            sections=[
+                {"name": section.name, "description": section.description, "research": section.research, "content": contents.get(section.name, "")}
+                for section in sections
+            ],
+            evidence=evidence
+        ))
+
+def report_key(params: dict) -> tuple:
+    return (normalize_topic(params["topic"]), params["fresh"], params["tokens"], params["verbose"], params.get("deadline"), params.get("refresh", False))
+
+def start_report(run_id: str, params: dict, resume: bool = False):
+    # The deadline counts from when the run is started, including time spent queued for a slot
+    deadline = Deadline(params["deadline"]) if params.get("deadline") else None
+    return track_report(report_events(run_id, params, resume, deadline))
+
+# Identical in-flight /report requests share one graph execution, across workers with shared state
+report_runs = SingleFlight(
+    start=start_report,
+    key=report_key,
+    log=run_log,
+    scheduler=report_scheduler,
+    shared=shared_state,
+    lease_seconds=float(os.getenv("RUN_LEASE_SECONDS", 30))
+)
+
+async def replay_report(report: StoredReport, replay: Literal["events", "report"], speedup: float):
+    """
+    Yields a stored report's events, or just the finished report.
+
+    Events are replayed at their original pace divided by `speedup`, or all at once if `speedup` is 0.
+    """
+    if replay == "report":
+        yield {
+            "event": "step",
+            "data": dumps({"node": "compile_report", "diff": {"finished_report": report["finished_report"]}})
+        }
+        return
+
+    elapsed = 0.0
+    for offset, event in report["events"]:
+        if speedup > 0 and offset > elapsed:
+            await asyncio.sleep((offset - elapsed) / speedup)
+            elapsed = offset
+        yield event
+
+def parse_event_id(event_id: str) -> tuple[str, int]:
+    """
+    Splits an SSE event id of the form `<run_id>:<seq>`.
+    """
+    run_id, _, seq = event_id.rpartition(":")
+    if not run_id or not seq.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return run_id, int(seq)
+
 @app.get("/report")
-async def stream_report(topic: str, request: Request):
+async def stream_report(
+    request: Request,
+    topic: str,
+    fresh: bool = False,
+    tokens: bool = False,
+    verbose: bool = False,
+    replay: Literal["events", "report"] = "events",
+    speedup: float = 0,
+    deadline: Optional[float] = Query(None, gt=0),
+    refresh: bool = False
+):
     """
     SSE endpoint that streams updates as the graph runs.
+
+    A report finished recently for the same normalized topic is replayed instead of rerun:
+    either its events (paced by `speedup`, or instant if 0) or just the finished report,
+    depending on `replay`.
+
+    Otherwise requests for the same normalized topic share one graph run. Clients that join late
+    get the events emitted so far, and the run is cancelled when its last client disconnects.
+
+    Set `fresh` to skip stored reports and cached search results, `tokens` to also stream
+    section text as it's written (a `token_reset` event means a section is being rewritten and its
+    text so far should be dropped), and `verbose` to send each node's full state diff for debugging.
+
+    With `deadline`, the report is due that many seconds after its run starts. Searches and writing
+    that would run past it are skipped, sections are written from the sources that arrived in time,
+    and the report marks what was cut short. A final `degraded` event lists the parts affected.
+
+    Set `refresh` to update the topic's stored report (kept for REPORT_CACHE_RETAIN seconds) rather
+    than replay it: each section is searched again and only rewritten if its sources changed.
+
+    The first event carries the run id and every step event has an SSE id. A client that
+    reconnects with `Last-Event-ID` gets the events after that one, and the run is resumed from
+    its last checkpoint if it stopped.
+
+    New runs wait for a run slot, with `queued` events giving the client's position and estimated
+    wait. If the queue is full, the request is rejected with 503 and `Retry-After`.
     """
 
-    input_state = ReportInputState(topic=topic)
-
-    async def event_generator():
-        try:
-            # https://langchain-ai.github.io/langgraph/how-tos/streaming-subgraphs/
-            async for update in graph.astream(input_state, stream_mode="updates", subgraphs=True):
-                if await request.is_disconnected():
-                    break
-                node, diff = next(iter(update[1].items()))
-                payload = {
-                    "node": node,
-                    "diff": jsonable_encoder(diff)
-                }
-                yield {
-                    "event": "step",
-                    "data": json.dumps(payload)
-                }
-        except Exception as e:
-            yield {
-                "event": "error",
-                "data": {"error": str(e)}
-            }
-
-    return EventSourceResponse(event_generator())
+    try:
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id:
+            events = await report_runs.resume(*parse_event_id(last_event_id))
+            if events is not None:
+                return EventSourceResponse(track_stream(events))
+
+        key = normalize_topic(topic)
+
+        if not fresh and not verbose and not refresh:
+            report = await report_store.get(key)
+            if report is not None:
+                return EventSourceResponse(track_stream(replay_report(report, replay, speedup)))
+
+        params = {"topic": topic, "fresh": fresh, "tokens": tokens, "verbose": verbose, "deadline": deadline, "refresh": refresh}
+        events = await report_runs.subscribe(params)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+    return EventSourceResponse(track_stream(events))
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
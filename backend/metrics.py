@@ -0,0 +1,107 @@
+import functools
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+F = TypeVar("F", bound=Callable[..., Awaitable])
+
+# Set by gunicorn.conf.py so every worker writes its metrics where any worker can collect them
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+NODE_DURATION = Histogram(
+    "cera_node_duration_seconds",
+    "Time spent in each graph node",
+    ["node"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+NODE_ERRORS = Counter("cera_node_errors_total", "Graph node calls that raised", ["node"])
+
+LLM_CALLS = Counter("cera_llm_calls_total", "Chat model calls", ["model"])
+LLM_TOKENS = Counter("cera_llm_tokens_total", "Chat model tokens, by kind (prompt, cached_prompt, completion)", ["model", "kind"])
+
+SECTION_GRADES = Counter("cera_section_grades_total", "Section grades, by grader (local, llm) and verdict (error if the grader failed)", ["grader", "verdict"])
+
+SEARCH_REQUESTS = Counter("cera_search_requests_total", "Tavily Search HTTP requests, by outcome", ["outcome"])
+SEARCH_RESULT_BYTES = Counter("cera_search_result_bytes_total", "Bytes of successful Tavily Search responses")
+SEARCH_CACHE = Counter("cera_search_cache_total", "Search cache lookups, by result (hit, miss)", ["result"])
+SEARCHES_COALESCED = Counter("cera_searches_coalesced_total", "Searches skipped because another section of the report asked for the same query")
+
+# Gauges are summed across live workers
+SSE_STREAMS = Gauge("cera_sse_streams_active", "Open SSE streams", multiprocess_mode="livesum")
+REPORTS_IN_FLIGHT = Gauge("cera_reports_in_flight", "Graph runs in progress", multiprocess_mode="livesum")
+REPORTS = Counter("cera_reports_total", "Graph runs, by outcome (done, error, cancelled)", ["outcome"])
+REPORTS_QUEUED = Gauge("cera_reports_queued", "Graph runs waiting for a run slot", multiprocess_mode="livesum")
+REPORTS_REJECTED = Counter("cera_reports_rejected_total", "Report requests shed because the run queue was full")
+
+
+
+def observe_node(node: F) -> F:
+    """
+    Decorates an async graph node to record its duration and errors under the function's name.
+    """
+    name = node.__name__
+    duration = NODE_DURATION.labels(name)
+    errors = NODE_ERRORS.labels(name)
+
+    @functools.wraps(node)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await node(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+
+async def track_stream(events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """
+    Counts an SSE stream as active while a client is reading it.
+    """
+    SSE_STREAMS.inc()
+    try:
+        async for event in events:
+            yield event
+    finally:
+        SSE_STREAMS.dec()
+        await events.aclose()
+
+
+
+async def track_report(events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """
+    Counts a graph run as in flight while its events are produced, and records how it ended.
+    """
+    REPORTS_IN_FLIGHT.inc()
+    outcome = "cancelled"
+    try:
+        async for event in events:
+            yield event
+        outcome = "done"
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        REPORTS_IN_FLIGHT.dec()
+        REPORTS.labels(outcome).inc()
+        await events.aclose()
+
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Returns the metrics in Prometheus text format, collected across all workers when running under gunicorn.
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
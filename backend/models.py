@@ -0,0 +1,212 @@
+import os
+import weakref
+from collections import defaultdict
+from typing import Any, NamedTuple, Optional
+from uuid import UUID
+
+import httpx
+from langchain.chat_models import init_chat_model
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from metrics import LLM_CALLS, LLM_TOKENS
+
+
+
+class ModelSpec(NamedTuple):
+    """
+    Key for a chat model in the registry.
+    """
+    model: str
+    provider: str = "openai"
+    temperature: Optional[float] = None
+    schema: Optional[type[BaseModel]] = None
+
+
+
+class UsageRecorder(BaseCallbackHandler):
+    """
+    Totals model token usage per graph node, including input tokens served from the provider's prompt cache.
+    Token counts by model are also exported as Prometheus metrics.
+    """
+
+    # Called on the event loop rather than in a thread, since it only updates counters
+    run_inline = True
+
+    def __init__(self):
+        self._runs: dict[UUID, tuple[str, str]] = {}
+        self.usage: dict[str, dict[str, int]] = defaultdict(lambda: {
+            "calls": 0,
+            "input_tokens": 0,
+            "cached_input_tokens": 0,
+            "output_tokens": 0,
+        })
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if node is None and metadata.get("checkpoint_ns"):
+            # Namespaces look like "build_section:<task id>|write_section:<task id>"
+            node = metadata["checkpoint_ns"].split("|")[-1].split(":")[0]
+        self._runs[run_id] = (node or "unknown", metadata.get("ls_model_name") or "unknown")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        node, model = run
+        usage = self.usage[node]
+        usage["calls"] += 1
+        LLM_CALLS.labels(model).inc()
+        for generations in response.generations:
+            for generation in generations:
+                usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage_metadata:
+                    continue
+                input_tokens = usage_metadata.get("input_tokens", 0)
+                output_tokens = usage_metadata.get("output_tokens", 0)
+                cached_tokens = (usage_metadata.get("input_token_details") or {}).get("cache_read", 0)
+                usage["input_tokens"] += input_tokens
+                usage["output_tokens"] += output_tokens
+                usage["cached_input_tokens"] += cached_tokens
+                LLM_TOKENS.labels(model, "prompt").inc(input_tokens)
+                LLM_TOKENS.labels(model, "cached_prompt").inc(cached_tokens)
+                LLM_TOKENS.labels(model, "completion").inc(output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+    def stats(self) -> dict:
+        stats = {}
+        for node, usage in sorted(self.usage.items()):
+            cached = usage["cached_input_tokens"] / usage["input_tokens"] if usage["input_tokens"] else 0.0
+            stats[node] = {**usage, "cached_fraction": round(cached, 4)}
+        return stats
+
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of chat models.
+
+    Every model built by the registry shares a single pooled HTTP/2 client, so keep-alive
+    connections to the provider are reused across sections and reports instead of a new
+    client (and TLS handshake) being created for every node call. Token usage, including input
+    tokens served from the provider's prompt cache, is recorded per graph node.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20, keepalive_expiry: float = 60.0):
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._models: dict[ModelSpec, Runnable] = {}
+        self.usage = UsageRecorder()
+        # Open connections seen so far; closed ones drop out once they're collected
+        self._streams: weakref.WeakSet = weakref.WeakSet()
+        self._counters = {
+            "models_built": 0,
+            "model_reuses": 0,
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+        }
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                limits=self._limits,
+                timeout=httpx.Timeout(600.0, connect=10.0),
+                event_hooks={"response": [self._on_response]}
+            )
+        return self._http_client
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        """
+        Counts requests and whether each one opened a new connection or reused a pooled one.
+        """
+        self._counters["requests"] += 1
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        if stream in self._streams:
+            self._counters["connections_reused"] += 1
+        else:
+            self._streams.add(stream)
+            self._counters["connections_opened"] += 1
+
+    def _build(self, spec: ModelSpec) -> Runnable:
+        kwargs = {}
+        if spec.temperature is not None:
+            kwargs["temperature"] = spec.temperature
+        if spec.provider == "openai":
+            kwargs["http_async_client"] = self.http_client
+            # Streamed responses only carry usage (and cached token counts) when asked for
+            kwargs["stream_usage"] = True
+
+        llm: BaseChatModel = init_chat_model(model=spec.model, model_provider=spec.provider, **kwargs)
+        # Set on the model rather than with `with_config`, which would replace the callbacks a call
+        # inherits from the graph (e.g. the handler streaming tokens) instead of adding to them
+        llm.callbacks = [self.usage]
+        if spec.schema is not None:
+            return llm.with_structured_output(spec.schema)
+        return llm
+
+    def get(self, spec: ModelSpec) -> Runnable:
+        """
+        Returns the model for a spec, building and caching it on first use.
+        """
+        model = self._models.get(spec)
+        if model is None:
+            model = self._models[spec] = self._build(spec)
+            self._counters["models_built"] += 1
+        else:
+            self._counters["model_reuses"] += 1
+        return model
+
+    def start(self, specs: list[ModelSpec]) -> None:
+        """
+        Builds the given models up front so the first report doesn't pay for client setup.
+        """
+        for spec in specs:
+            if spec not in self._models:
+                self._models[spec] = self._build(spec)
+                self._counters["models_built"] += 1
+
+    async def aclose(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._models.clear()
+        self._streams.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the registry's pool size and reuse counters.
+        """
+        pool = getattr(self._http_client, "_transport", None)
+        pool = getattr(pool, "_pool", None)
+        return {
+            "models": len(self._models),
+            "pool_connections": len(pool.connections) if pool is not None else 0,
+            "max_connections": self._limits.max_connections,
+            "max_keepalive_connections": self._limits.max_keepalive_connections,
+            **self._counters,
+            # Every reused connection is a TLS handshake that didn't happen
+            "handshakes_avoided": self._counters["connections_reused"],
+            "usage_by_node": self.usage.stats(),
+        }
+
+
+
+model_registry = ModelRegistry(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20)),
+)
@@ -1,20 +1,11 @@
 report_researcher_prompt = """You're doing research for a news-style report that will answer a user's current events-related question.
 
-CURRENT DATE AND TIME: {current_date_and_time}
-
-<REPORT TOPIC>
-{topic}
-</REPORT TOPIC>
+The current date and time, the REPORT TOPIC, and CONTEXT are provided in the user's message.
 
 <REPORT STRUCTURE>
 {report_structure}
 </REPORT STRUCTURE>
 
-<CONTEXT>
-Web search results from just the user's question:
-{context}
-</CONTEXT>
-
 <TASK>
 Your goal is to generate {num_queries} web search queries that will help find information for planning the report's sections. 
 
@@ -29,24 +20,30 @@ Call the SearchQueries tool.
 
 
 
-report_planner_prompt = """Write a plan for a news-style, all-you-need-to-know report (e.g. something that would be found on cnn.com or nytimes.com) that answers the user's current events-related question. The report should cover all important information while being concise and focused.
-
-CURRENT DATE AND TIME: {current_date_and_time}
+report_researcher_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
 
 <REPORT TOPIC>
 {topic}
 </REPORT TOPIC>
 
+<CONTEXT>
+Web search results from just the user's question:
+{context}
+</CONTEXT>
+
+Generate search queries that will help in planning the sections of the report."""
+
+
+
+report_planner_prompt = """Write a plan for a news-style, all-you-need-to-know report (e.g. something that would be found on cnn.com or nytimes.com) that answers the user's current events-related question. The report should cover all important information while being concise and focused.
+
+The current date and time, the REPORT TOPIC, and CONTEXT are provided in the user's message.
+
 <REPORT STRUCTURE>
 Refer to this general structure. Feel free to alter it as you see fit to better address the user's question.
 {report_structure}
 </REPORT STRUCTURE>
 
-<CONTEXT>
-Context to help plan the sections of the report: 
-{context}
-</CONTEXT>
-
 <TASK>
 Generate a list of sections for the report. Your plan should be concise and focused, with no overlapping sections or unnecessary filler. LONGER DOES NOT EQUAL BETTER. MORE SECTIONS DOES NOT EQUAL BETTER.
 
@@ -76,9 +73,42 @@ Call the Sections tool
 
 
 
+report_planner_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
+
+<REPORT TOPIC>
+{topic}
+</REPORT TOPIC>
+
+<CONTEXT>
+Context to help plan the sections of the report: 
+{context}
+</CONTEXT>
+
+Generate the sections of the report. Your response must include a sections field containing a list of sections. Each section must include name, description, research, and content fields."""
+
+
+
 section_researcher_prompt = """You are an assistant tasked with crafting targeted web search queries that will help gather comprehensive information for writing a section of a news-style report that answers a user's current events-related question.
 
-CURRENT DATE AND TIME: {current_date_and_time}
+The current date and time, the REPORT TOPIC, and the SECTION TOPIC are provided in the user's message.
+
+<TASK>
+Your goal is to generate {num_queries} search queries that will help gather comprehensive information about the section's topic.
+
+The queries should:
+(1) Be related to the section's topic.
+(2) Examine different aspects of the section's topic.
+
+Design the queries to find high-quality, relevant sources.
+</TASK>
+
+<FORMAT>
+Call the SearchQueries tool 
+</FORMAT>"""
+
+
+
+section_researcher_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
 
 <REPORT TOPIC>
 {topic}
@@ -88,25 +118,48 @@ CURRENT DATE AND TIME: {current_date_and_time}
 {section_topic}
 </SECTION TOPIC>
 
+Generate search queries on the provided topic."""
+
+
+
+batch_section_researcher_prompt = """You are an assistant tasked with crafting targeted web search queries that will help gather comprehensive information for writing the sections of a news-style report that answers a user's current events-related question.
+
+The current date and time, the REPORT TOPIC, and the SECTIONS (each with a name and topic) are provided in the user's message.
+
 <TASK>
-Your goal is to generate {num_queries} search queries that will help gather comprehensive information about the section's topic.
+Your goal is to generate {num_queries} search queries for each section that will help gather comprehensive information about the section's topic.
 
-The queries should:
+The queries for a section should:
 (1) Be related to the section's topic.
 (2) Examine different aspects of the section's topic.
+(3) Not repeat the queries of other sections.
 
 Design the queries to find high-quality, relevant sources.
 </TASK>
 
 <FORMAT>
-Call the SearchQueries tool 
+Call the ReportSearchQueries tool with one entry per section, using the section's exact name
 </FORMAT>"""
 
 
 
+batch_section_researcher_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
+
+<REPORT TOPIC>
+{topic}
+</REPORT TOPIC>
+
+<SECTIONS>
+{sections}
+</SECTIONS>
+
+Generate search queries for each of the provided sections."""
+
+
+
 section_writer_prompt = """Write one section of a news-style report that answers a user's current events-related question.
 
-CURRENT DATE AND TIME: {current_date_and_time}
+The current date and time, the report topic, the section, and the source material are provided in the user's message.
 
 <Task>
 1. Review the report topic, section name, and section topic carefully.
@@ -129,6 +182,7 @@ CURRENT DATE AND TIME: {current_date_and_time}
 * End with "### Sources" listing each source with corresponding numbers.
 * Number sources sequentially without gaps (e.g. 1, 2, 3) regardless of which you choose.
 * Source should be formatted as a Markdown list item with "-".
+* A source with "ALSO PUBLISHED AT" is one story republished at several URLs: give it one number and list its other URLs after its URL, e.g. "- [4] Source Title (URL; also at URL, URL)".
 * Example:
   "- [1] Source Title (URL)"
   "- [2] Source Title (URL)"
@@ -144,7 +198,9 @@ CURRENT DATE AND TIME: {current_date_and_time}
 
 
 
-section_writer_inputs = """<REPORT TOPIC>
+section_writer_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
+
+<REPORT TOPIC>
 {topic}
 </REPORT TOPIC>
 
@@ -168,19 +224,7 @@ section_writer_inputs = """<REPORT TOPIC>
 
 section_grader_prompt = """Review a section of a news-style report relative to the user's current events-related question.
 
-CURRENT DATE AND TIME: {current_date_and_time}
-
-<REPORT TOPIC>
-{topic}
-</REPORT TOPIC>
-
-<SECTION TOPIC>
-{section_topic}
-</SECTION TOPIC>
-
-<SECTION CONTENT>
-{section_content}
-</SECTION CONTENT>
+The current date and time, the REPORT TOPIC, the SECTION TOPIC, and the SECTION CONTENT are provided in the user's message.
 
 <TASK>
 Evaluate whether the section content adequately addresses the section topic.
@@ -201,25 +245,27 @@ follow_up_queries: List[SearchQuery] = Field(
 
 
 
-introduction_and_conclusion_writer_prompt = """You are a reporter writing a section of a NEWS-STYLE REPORT about a current event that synthesizes information from the rest of the report. You could be tasked with writing an introduction, a conclusion, or a summary, though only one of these (i.e. just an introduction, just a conclusion, or just a summary). 
-
-CURRENT DATE AND TIME: {current_date_and_time}
+section_grader_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
 
 <REPORT TOPIC>
 {topic}
 </REPORT TOPIC>
 
-<SECTION NAME>
-{section_name}
-</SECTION NAME>
-
-<SECTION TOPIC> 
+<SECTION TOPIC>
 {section_topic}
 </SECTION TOPIC>
 
-<REPORT CONTENT>
-{context}
-</REPORT CONTENT>
+<SECTION CONTENT>
+{section_content}
+</SECTION CONTENT>
+
+Grade the following section of a news-style report. Consider follow-up questions for missing information. If the grade is 'pass', return empty strings for the follow-up queries. If the grade is 'fail', provide specific search queries to gather the missing information."""
+
+
+
+introduction_and_conclusion_writer_prompt = """You are a reporter writing a section of a NEWS-STYLE REPORT about a current event that synthesizes information from the rest of the report. You could be tasked with writing an introduction, a conclusion, or a summary, though only one of these (i.e. just an introduction, just a conclusion, or just a summary). 
+
+The current date and time, the REPORT TOPIC, the REPORT CONTENT, and the SECTION NAME and SECTION TOPIC you're writing are provided in the user's message.
 
 <TASK>
 Guidelines:
@@ -251,4 +297,27 @@ If you're tasked with writing a conclusion or summary:
 * Do not include or reference word counts.
 * Use Markdown format.
 * NEVER reference the report itself or the section you're writing (i.e. don't be meta).
-</FINAL CHECK>"""
\ No newline at end of file
+</FINAL CHECK>"""
+
+
+
+# Report content comes before the section, so the introduction and conclusion share a prompt prefix
+introduction_and_conclusion_writer_inputs = """CURRENT DATE AND TIME: {current_date_and_time}
+
+<REPORT TOPIC>
+{topic}
+</REPORT TOPIC>
+
+<REPORT CONTENT>
+{context}
+</REPORT CONTENT>
+
+<SECTION NAME>
+{section_name}
+</SECTION NAME>
+
+<SECTION TOPIC> 
+{section_topic}
+</SECTION TOPIC>
+
+Write a section of a report that answers a user's current events question using the information you were provided."""
\ No newline at end of file
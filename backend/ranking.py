@@ -0,0 +1,196 @@
+import os
+import re
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have he her his how i if in into is it its of on or
+our she so than that the their them then there these they this to was we were what when where which
+who will with would you your
+""".split())
+
+# Top passages kept per source, and the passage size raw pages are split into
+PASSAGES_PER_SOURCE = int(os.getenv("RANKING_PASSAGES_PER_SOURCE", 6))
+PASSAGE_CHARS = int(os.getenv("RANKING_PASSAGE_CHARS", 800))
+# Passages with fewer words than this are treated as page chrome (menus, share links, captions)
+MIN_PASSAGE_WORDS = 12
+
+
+
+def _stem(token: str) -> str:
+    # Plural folding only, so "voters" matches "voter" without a stemmer dependency
+    if len(token) <= 3 or not token.endswith("s") or token.endswith(("ss", "us", "is")):
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return token[:-2]
+    return token[:-1]
+
+
+
+def tokenize(text: str, keep_stopwords: bool = False) -> list[str]:
+    return [_stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if keep_stopwords or token not in STOPWORDS]
+
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> list[str]:
+    """
+    Splits a page into passages of up to `max_chars` characters.
+
+    Paragraphs are merged until a passage is full, and paragraphs longer than a passage are split
+    on sentence boundaries. Short fragments that look like page chrome are dropped.
+    """
+    passages = []
+    current = ""
+
+    def flush():
+        nonlocal current
+        if len(current.split()) >= MIN_PASSAGE_WORDS:
+            passages.append(current)
+        current = ""
+
+    for paragraph in text.split("\n\n"):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= max_chars else SENTENCE_END.split(paragraph)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 1 > max_chars:
+                flush()
+            current = f"{current} {piece}" if current else piece
+            if len(current) >= max_chars:
+                flush()
+        # Paragraph breaks end a passage once it's at least half full
+        if len(current) >= max_chars // 2:
+            flush()
+    flush()
+    return passages
+
+
+
+class BM25:
+    """
+    Okapi BM25 over a sparse passage-by-term count matrix.
+
+    Parameters:
+        passages: Passages to index
+        k1: Term frequency saturation
+        b: Passage length normalization
+    """
+
+    def __init__(self, passages: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: dict[str, int] = {}
+
+        # Raw tokens map straight to term columns (-1 for stopwords), so each distinct token is stemmed once
+        columns: dict[str, int] = {}
+
+        def column(token: str) -> int:
+            if token in STOPWORDS:
+                columns[token] = -1
+            else:
+                columns[token] = self.vocabulary.setdefault(_stem(token), len(self.vocabulary))
+            return columns[token]
+
+        passage_columns = [
+            [columns[token] if token in columns else column(token) for token in TOKEN_PATTERN.findall(passage.lower())]
+            for passage in passages
+        ]
+        lengths = np.fromiter(map(len, passage_columns), dtype=np.int64, count=len(passages))
+        cols = np.fromiter(chain.from_iterable(passage_columns), dtype=np.int64, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(passages)), lengths)
+        kept = cols >= 0
+
+        # Duplicate (row, col) entries are summed into term counts
+        self.counts = sparse.csr_matrix(
+            (np.ones(int(kept.sum()), dtype=np.float32), (rows[kept], cols[kept])),
+            shape=(len(passages), len(self.vocabulary))
+        )
+        self.counts.sum_duplicates()
+
+        num_passages = max(len(passages), 1)
+        self.lengths = np.asarray(self.counts.sum(axis=1)).ravel()
+        document_frequency = np.bincount(self.counts.indices, minlength=len(self.vocabulary))
+        self.idf = np.log1p((num_passages - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+        # Saturated, length-normalized term weights, computed once for every query
+        average_length = self.lengths.mean() if len(passages) else 0.0
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / max(average_length, 1e-9))
+        row_norm = np.repeat(norm, np.diff(self.counts.indptr)).astype(np.float32)
+        weights = self.counts.copy()
+        weights.data = weights.data * (self.k1 + 1) / (weights.data + row_norm)
+        self.weights = weights.tocsc()
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Returns the BM25 score of every passage for a query.
+        """
+        terms = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not terms:
+            return np.zeros(self.weights.shape[0], dtype=np.float32)
+        columns = np.fromiter(terms, dtype=np.int64)
+        return self.weights[:, columns] @ self.idf[columns]
+
+
+
+def rank_search_results(
+    search_responses: list[dict],
+    query: str,
+    passages_per_source: int = PASSAGES_PER_SOURCE,
+    passage_chars: int = PASSAGE_CHARS
+) -> tuple[list[dict], dict]:
+    """
+    Replaces each source's raw content with its passages most relevant to `query`.
+
+    Passages from every source are scored in one BM25 index, so term rarity is judged against
+    everything the section's searches returned. Each source keeps its top `passages_per_source`
+    passages, in page order. Responses are copied, not modified, since they may be cached.
+
+    Parameters:
+        search_responses: Tavily search response dicts
+        query: Text to rank passages against (section description and search queries)
+        passages_per_source: Passages to keep per source
+        passage_chars: Maximum characters per passage
+
+    Returns:
+        tuple: Search responses with ranked raw content, and a dict of passage counts
+    """
+    sources: dict[str, list[str]] = {}
+    for response in search_responses:
+        for source in response["results"]:
+            if source.get("raw_content") and source["url"] not in sources:
+                sources[source["url"]] = split_passages(source["raw_content"], passage_chars)
+
+    passages = [passage for source_passages in sources.values() for passage in source_passages]
+    scores = BM25(passages).score(query) if passages else np.zeros(0, dtype=np.float32)
+
+    ranked: dict[str, str] = {}
+    start = 0
+    for url, source_passages in sources.items():
+        source_scores = scores[start:start + len(source_passages)]
+        keep = np.sort(np.argsort(-source_scores, kind="stable")[:passages_per_source])
+        ranked[url] = "\n\n".join(source_passages[i] for i in keep)
+        start += len(source_passages)
+
+    ranked_responses = [
+        {
+            **response,
+            "results": [
+                {**source, "raw_content": ranked[source["url"]]} if source["url"] in ranked else source
+                for source in response["results"]
+            ]
+        }
+        for response in search_responses
+    ]
+    stats = {
+        "passages": len(passages),
+        "passages_kept": sum(min(len(p), passages_per_source) for p in sources.values()),
+    }
+    return ranked_responses, stats
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import NotRequired, Optional, TypedDict
+
+from shared import SharedState
+
+
+
+class StoredReport(TypedDict):
+    topic: str # Report topic as first requested
+    finished_report: str # Finished report
+    events: list[tuple[float, dict]] # SSE events with their offset in seconds from the start of the run
+    stored_at: float # Unix time the report was stored
+    sections: NotRequired[list[dict]] # Planned sections with their content, for refreshing the report
+    evidence: NotRequired[dict[str, dict]] # Each researched section's last queries and source hashes, by section name
+
+
+
+class ReportStore(ABC):
+    """
+    Store of finished reports keyed by normalized topic.
+
+    Reports older than `ttl` seconds are treated as missing, but are kept for `retain` seconds as
+    the starting point for refreshing them. Stores are bounded by the encoded size of their reports
+    and evict the least recently used report first.
+
+    Parameters:
+        ttl: Seconds a report stays fresh
+        max_bytes: Maximum total encoded size of stored reports
+        retain: Seconds a report can still be refreshed
+    """
+
+    def __init__(self, ttl: float = 600, max_bytes: int = 64 * 1024 * 1024, retain: float = 86400):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.retain = max(retain, ttl)
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def encode(report: StoredReport) -> bytes:
+        return zlib.compress(json.dumps(report).encode())
+
+    @staticmethod
+    def decode(blob: bytes) -> StoredReport:
+        return json.loads(zlib.decompress(blob))
+
+    async def get(self, key: str, max_age: Optional[float] = None) -> Optional[StoredReport]:
+        """
+        Returns the report stored for a key if it's under `max_age` seconds old (default `ttl`).
+        """
+        report = await self._get(key)
+        if report is not None and time.time() - report["stored_at"] < (self.ttl if max_age is None else max_age):
+            self._counters["hits"] += 1
+            return report
+        self._counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, report: StoredReport) -> None:
+        await self._put(key, self.encode(report))
+        self._counters["stores"] += 1
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[StoredReport]:
+        ...
+
+    @abstractmethod
+    async def _put(self, key: str, blob: bytes) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "retain": self.retain,
+            "max_bytes": self.max_bytes,
+            **self._counters,
+        }
+
+
+
+class MemoryReportStore(ReportStore):
+    """
+    Report store held in process memory.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+
+    async def _get(self, key: str) -> Optional[StoredReport]:
+        blob = self._blobs.get(key)
+        if blob is None:
+            return None
+        self._blobs.move_to_end(key)
+        return self.decode(blob)
+
+    async def _put(self, key: str, blob: bytes) -> None:
+        if key in self._blobs:
+            self._bytes -= len(self._blobs.pop(key))
+        self._blobs[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            _, evicted = self._blobs.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        return {**super().stats(), "reports": len(self._blobs), "bytes": self._bytes}
+
+
+
+class DiskReportStore(ReportStore):
+    """
+    Report store in a SQLite file, shared by every worker on the machine.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, used_at REAL, size INTEGER, value BLOB)")
+        return self._db
+
+    def _read(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT value FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE reports SET used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row is not None else None
+
+    def _write(self, key: str, blob: bytes) -> int:
+        evicted = 0
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)", (key, time.time(), len(blob), blob))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+            for old_key, size in db.execute("SELECT key, size FROM reports WHERE key != ? ORDER BY used_at", (key,)).fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM reports WHERE key = ?", (old_key,))
+                total -= size
+                evicted += 1
+        return evicted
+
+    async def _get(self, key: str) -> Optional[StoredReport]:
+        blob = await asyncio.to_thread(self._read, key)
+        return self.decode(blob) if blob is not None else None
+
+    async def _put(self, key: str, blob: bytes) -> None:
+        self._counters["evictions"] += await asyncio.to_thread(self._write, key, blob)
+
+    def stats(self) -> dict:
+        with self._lock:
+            reports, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        return {**super().stats(), "reports": reports, "bytes": size}
+
+
+
+class SharedReportStore(ReportStore):
+    """
+    Report store in the workers' shared state. Reports are dropped when they expire, and the
+    oldest are dropped past `max_bytes` unless the backend bounds its own size (e.g. Redis `maxmemory`).
+    """
+
+    def __init__(self, shared: SharedState, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = shared
+
+    async def _get(self, key: str) -> Optional[StoredReport]:
+        blob = await self.shared.get(f"report:{key}")
+        return self.decode(blob) if blob is not None else None
+
+    async def _put(self, key: str, blob: bytes) -> None:
+        await self.shared.set(f"report:{key}", blob, self.retain)
+        self._counters["evictions"] += await self.shared.trim("report:", self.max_bytes)
+
+
+
+def create_report_store(shared: Optional[SharedState] = None) -> ReportStore:
+    """
+    Creates the report store configured by the environment: disk-backed if REPORT_CACHE_PATH is
+    set, otherwise in the workers' shared state if there is one, otherwise in memory.
+    """
+    kwargs = {
+        "ttl": float(os.getenv("REPORT_CACHE_TTL", 600)),
+        "max_bytes": int(os.getenv("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        "retain": float(os.getenv("REPORT_CACHE_RETAIN", 86400)),
+    }
+    path = os.getenv("REPORT_CACHE_PATH")
+    if path:
+        return DiskReportStore(path, **kwargs)
+    if shared is not None:
+        return SharedReportStore(shared, **kwargs)
+    return MemoryReportStore(**kwargs)
@@ -0,0 +1,516 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Callable, Hashable, NamedTuple, Optional
+
+from scheduler import Overloaded, ReportScheduler, Slot
+from shared import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Seconds a run's events stay on its shared channel after the last one
+CHANNEL_TTL = 15 * 60
+
+
+
+class RunRecord(NamedTuple):
+    params: dict # Request parameters the run was started with
+    status: str # "running", "paused" or "done"
+    owner: int # PID of the worker that last ran the run
+    events: list[tuple[int, dict]] # Step events emitted so far, by sequence number
+
+
+
+class RunLog:
+    """
+    SQLite log of report runs and the step events they emitted.
+
+    Together with the graph's checkpointer, it lets a client that reconnects with `Last-Event-ID`
+    get the events it missed and resume a paused run without re-running completed nodes.
+
+    Parameters:
+        path: SQLite file path
+        retention: Seconds a run is kept after it starts
+    """
+
+    def __init__(self, path: str, retention: float = 24 * 60 * 60):
+        self.path = path
+        self.retention = retention
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, params TEXT, status TEXT, owner INTEGER, created_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS run_events (run_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (run_id, seq))")
+        return self._db
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    async def start(self, run_id: str, params: dict) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, 'running', ?, ?)",
+            (run_id, json.dumps(params), os.getpid(), time.time())
+        )
+
+    async def claim(self, run_id: str, record: RunRecord) -> bool:
+        """
+        Takes over a paused or orphaned run. Returns False if another worker got to it first.
+        """
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE runs SET status = 'running', owner = ? WHERE run_id = ? AND status = ? AND owner = ? RETURNING run_id",
+            (os.getpid(), run_id, record.status, record.owner)
+        )
+        return bool(rows)
+
+    async def set_status(self, run_id: str, status: str) -> None:
+        await asyncio.to_thread(self._execute, "UPDATE runs SET status = ? WHERE run_id = ?", (status, run_id))
+
+    async def append(self, run_id: str, seq: int, event: dict) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO run_events VALUES (?, ?, ?)",
+            (run_id, seq, json.dumps(event))
+        )
+
+    async def load(self, run_id: str, after: int = -1) -> Optional[RunRecord]:
+        """
+        Returns a run and its step events with sequence numbers above `after`, or None if unknown.
+        """
+        def read():
+            run = self._execute("SELECT params, status, owner FROM runs WHERE run_id = ?", (run_id,))
+            if not run:
+                return None
+            events = self._execute("SELECT seq, event FROM run_events WHERE run_id = ? AND seq > ? ORDER BY seq", (run_id, after))
+            params, status, owner = run[0]
+            return RunRecord(json.loads(params), status, owner, [(seq, json.loads(event)) for seq, event in events])
+        return await asyncio.to_thread(read)
+
+    async def prune(self) -> list[str]:
+        """
+        Deletes runs past the retention window and returns their ids.
+        """
+        def delete():
+            cutoff = time.time() - self.retention
+            run_ids = [row[0] for row in self._execute("SELECT run_id FROM runs WHERE created_at < ?", (cutoff,))]
+            for run_id in run_ids:
+                self._execute("DELETE FROM run_events WHERE run_id = ?", (run_id,))
+                self._execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            return run_ids
+        return await asyncio.to_thread(delete)
+
+
+
+def _run_event(run_id: str) -> dict:
+    return {
+        "event": "run",
+        "data": json.dumps({"run_id": run_id})
+    }
+
+
+
+def _lease_name(key: Hashable) -> str:
+    return "run-lease:" + hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+
+def _channel_name(run_id: str) -> str:
+    return f"run-events:{run_id}"
+
+
+
+def _watch_name(run_id: str) -> str:
+    return f"run-watched:{run_id}"
+
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+
+class ReportRun:
+    """
+    One graph execution whose SSE events are shared by every subscribed client.
+
+    Events are kept in order so clients that join late get a replay of everything emitted so far.
+    Step events get an SSE id of `<run_id>:<seq>` and are written to the run log, so clients can
+    resume from the last one they saw. With shared state, events are also published on the run's
+    channel for subscribers in other workers, followed by an `end` message.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        key: Hashable,
+        stream: AsyncIterator[dict],
+        on_done: Callable[["ReportRun"], None],
+        log: Optional[RunLog] = None,
+        events: Optional[list[tuple[int, dict]]] = None,
+        params: Optional[dict] = None,
+        shared: Optional[SharedState] = None
+    ):
+        self.run_id = run_id
+        self.key = key
+        self.events: list[tuple[int, dict]] = list(events or [])
+        self.seq = self.events[-1][0] if self.events else -1
+        self.subscribers: set[tuple[asyncio.Queue, int]] = set()
+        self.done = False
+        self._on_done = on_done
+        self._log = log
+        self._shared = shared
+        self.task = asyncio.create_task(self._run(stream, params))
+
+    def _publish(self, event: dict) -> None:
+        if event["event"] == "step":
+            if "id" in event:
+                # Relayed from the worker running the graph, which numbered it
+                self.seq = int(event["id"].rsplit(":", 1)[1])
+            else:
+                self.seq += 1
+                event = {**event, "id": f"{self.run_id}:{self.seq}"}
+        self.events.append((self.seq, event))
+        for queue, _ in self.subscribers:
+            queue.put_nowait((self.seq, event))
+
+    async def _broadcast(self, event: dict) -> None:
+        if self._shared is not None:
+            await self._shared.publish(_channel_name(self.run_id), json.dumps(event).encode(), CHANNEL_TTL)
+
+    async def _run(self, stream: AsyncIterator[dict], params: Optional[dict]) -> None:
+        status = "paused"
+        try:
+            # New runs are logged here rather than before launch, so identical requests can't both start one
+            if self._log is not None and params is not None:
+                await self._log.start(self.run_id, params)
+            async for event in stream:
+                self._publish(event)
+                if self._log is not None and event["event"] == "step":
+                    await self._log.append(self.run_id, self.seq, self.events[-1][1])
+                await self._broadcast(self.events[-1][1])
+            status = "done"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Failed runs stay paused so a reconnecting client can retry from the last checkpoint
+            self._publish({
+                "event": "error",
+                "data": json.dumps({"error": str(e)})
+            })
+            await self._broadcast(self.events[-1][1])
+        finally:
+            # The stream may be suspended at a yield if cancelled between events
+            await stream.aclose()
+            if self._shared is not None:
+                await asyncio.shield(self._broadcast({"event": "end", "data": status}))
+            self.done = True
+            for queue, _ in self.subscribers:
+                queue.put_nowait(None)
+            self._on_done(self)
+            if self._log is not None:
+                await asyncio.shield(self._log.set_status(self.run_id, status))
+
+    def subscribe(self, unsubscribe: Callable[["ReportRun", tuple], None], after: int = -1) -> AsyncIterator[dict]:
+        """
+        Yields every event after step `after`, then new events as they're emitted, until the run ends.
+        """
+        subscriber = (asyncio.Queue(), after)
+        # Snapshot and register together so no event is missed or repeated
+        replay = [event for seq, event in self.events if seq > after or (seq == after and event["event"] != "step")]
+        live = not self.done
+        if live:
+            self.subscribers.add(subscriber)
+        return self._iterate(replay, subscriber if live else None, unsubscribe)
+
+    async def _iterate(self, replay: list[dict], subscriber: Optional[tuple], unsubscribe: Callable) -> AsyncIterator[dict]:
+        try:
+            yield _run_event(self.run_id)
+            for event in replay:
+                yield event
+            while subscriber is not None:
+                item = await subscriber[0].get()
+                if item is None:
+                    break
+                yield item[1]
+        finally:
+            if subscriber is not None:
+                unsubscribe(self, subscriber)
+
+
+
+class SingleFlight:
+    """
+    Runs at most one graph execution per key and fans its events out to every subscriber.
+
+    The execution is cancelled only when its last subscriber disconnects. With a run log, a
+    cancelled or failed run can later be resumed by id. With a scheduler, starting or resuming
+    a run needs a run slot, and raises `Overloaded` if none is available or queued.
+
+    With shared state, runs are single-flight across workers too. The worker that takes a key's
+    lease runs the graph and publishes its events; other workers relay them to their own clients,
+    and keep the run going while they do.
+
+    Parameters:
+        start: Returns the event stream for a run, given its id, request parameters and whether it's resuming
+        key: Maps request parameters to the key identifying identical requests
+        log: Run log for resuming runs, if any
+        scheduler: Admission control for new and resumed runs, if any
+        shared: State shared with other workers, if any
+        lease_seconds: Seconds a worker's lease on a run lasts without being refreshed
+    """
+
+    def __init__(
+        self,
+        start: Callable[[str, dict, bool], AsyncIterator[dict]],
+        key: Callable[[dict], Hashable],
+        log: Optional[RunLog] = None,
+        scheduler: Optional[ReportScheduler] = None,
+        shared: Optional[SharedState] = None,
+        lease_seconds: float = 30.0,
+        poll_interval: float = 0.5
+    ):
+        self._start = start
+        self._key = key
+        self.log = log
+        self.scheduler = scheduler
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._runs: dict[Hashable, ReportRun] = {}
+        self._runs_by_id: dict[str, ReportRun] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._counters = {
+            "runs_started": 0,
+            "runs_resumed": 0,
+            "runs_relayed": 0,
+            "subscribers_joined": 0,
+            "runs_cancelled": 0,
+        }
+
+    def _on_done(self, run: ReportRun) -> None:
+        if self._runs.get(run.key) is run:
+            del self._runs[run.key]
+        self._runs_by_id.pop(run.run_id, None)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _cancel(self, run: ReportRun) -> None:
+        run.task.cancel()
+        self._on_done(run)
+        self._counters["runs_cancelled"] += 1
+
+    def _unsubscribe(self, run: ReportRun, subscriber: tuple) -> None:
+        run.subscribers.discard(subscriber)
+        if not run.subscribers and not run.done:
+            if run._shared is not None:
+                self._spawn(self._cancel_unwatched(run))
+            else:
+                self._cancel(run)
+
+    async def _cancel_unwatched(self, run: ReportRun) -> None:
+        """
+        Cancels a run without local subscribers once no other worker is relaying it.
+        """
+        while not run.done and not run.subscribers:
+            if await self.shared.get(_watch_name(run.run_id)) is None:
+                if not run.done and not run.subscribers:
+                    self._cancel(run)
+                return
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def _hold_lease(self, name: str, run_id: str) -> None:
+        """
+        Refreshes a run's lease until cancelled, then releases it.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                if not await self.shared.refresh(name, run_id, self.lease_seconds):
+                    logger.warning(f"Lost the lease on run {run_id}")
+        finally:
+            await self.shared.release(name, run_id)
+
+    async def _relay(self, run_id: str, lease: str) -> AsyncIterator[dict]:
+        """
+        Yields the events another worker publishes for a run, while letting it know they're being watched.
+        """
+        watch = _watch_name(run_id)
+        await self.shared.set(watch, b"1", self.lease_seconds)
+        watched_at = time.monotonic()
+        owner_gone = False
+        async for message in self.shared.subscribe(_channel_name(run_id), idle_timeout=self.lease_seconds / 3):
+            if time.monotonic() - watched_at > self.lease_seconds / 3:
+                await self.shared.set(watch, b"1", self.lease_seconds)
+                watched_at = time.monotonic()
+            if message is None:
+                # The lease is released after the end message, so check twice before giving up on the run
+                if await self.shared.get(lease) == run_id.encode():
+                    owner_gone = False
+                elif owner_gone:
+                    raise RuntimeError("The worker running this report stopped")
+                else:
+                    owner_gone = True
+                continue
+            event = json.loads(message)
+            if event["event"] == "end":
+                return
+            yield event
+
+    def _launch(self, run_id: str, params: dict, resume: bool, events: Optional[list] = None, slot: Optional[Slot] = None) -> ReportRun:
+        key = self._key(params)
+        stream = self._start(run_id, params, resume)
+        if slot is not None:
+            stream = self.scheduler.run(slot, stream)
+        # Resumed runs are already in the log
+        run = ReportRun(run_id, key, stream, self._on_done, self.log, events, None if resume else params, self.shared)
+        if slot is not None:
+            # Also covers runs cancelled before their stream started
+            run.task.add_done_callback(lambda _: self.scheduler.release(slot))
+        # A resumed run doesn't displace a newer run for the same key
+        if key not in self._runs:
+            self._runs[key] = run
+        self._runs_by_id[run_id] = run
+        return run
+
+    async def subscribe(self, params: dict) -> AsyncIterator[dict]:
+        """
+        Subscribes to the run for these request parameters, starting one if none is in flight.
+
+        Parameters:
+            params: Request parameters (mapped to a key by `key`)
+
+        Returns:
+            AsyncIterator of SSE event dicts
+
+        Raises:
+            Overloaded: If a new run is needed and the scheduler can't take it
+        """
+        key = self._key(params)
+        run = self._runs.get(key)
+        if run is not None:
+            self._counters["subscribers_joined"] += 1
+            return run.subscribe(self._unsubscribe)
+
+        run_id = str(uuid.uuid4())
+        if self.shared is not None:
+            lease = _lease_name(key)
+            holder = await self.shared.acquire(lease, run_id, self.lease_seconds)
+            # Another request for the key may have started or joined a run meanwhile
+            run = self._runs.get(key)
+            if run is not None or holder != run_id:
+                if holder == run_id:
+                    await self.shared.release(lease, run_id)
+                if run is None:
+                    run = ReportRun(holder, key, self._relay(holder, lease), self._on_done)
+                    self._runs[key] = run
+                    self._runs_by_id[holder] = run
+                    self._counters["runs_relayed"] += 1
+                else:
+                    self._counters["subscribers_joined"] += 1
+                return run.subscribe(self._unsubscribe)
+
+        try:
+            slot = self.scheduler.admit() if self.scheduler is not None else None
+        except Overloaded:
+            if self.shared is not None:
+                await self.shared.release(lease, run_id)
+            raise
+        run = self._launch(run_id, params, resume=False, slot=slot)
+        if self.shared is not None:
+            keeper = self._spawn(self._hold_lease(lease, run_id))
+            run.task.add_done_callback(lambda _: keeper.cancel())
+        self._counters["runs_started"] += 1
+        return run.subscribe(self._unsubscribe)
+
+    async def resume(self, run_id: str, after: int) -> Optional[AsyncIterator[dict]]:
+        """
+        Subscribes to a run from step `after`, resuming it from its last checkpoint if it isn't running.
+
+        Returns:
+            AsyncIterator of SSE event dicts, or None if the run is unknown
+
+        Raises:
+            Overloaded: If the run needs resuming and the scheduler can't take it
+        """
+        run = self._runs_by_id.get(run_id)
+        if run is not None:
+            self._counters["subscribers_joined"] += 1
+            return run.subscribe(self._unsubscribe, after)
+        if self.log is None:
+            return None
+
+        record = await self.log.load(run_id, after)
+        if record is None:
+            return None
+        if record.status == "done" or (record.status == "running" and _pid_alive(record.owner)):
+            # Finished, or running in another worker on this machine
+            return self._follow(run_id, after)
+        # Admitted before claiming, so a rejected resume leaves the run for another worker
+        slot = self.scheduler.admit() if self.scheduler is not None else None
+        if not await self.log.claim(run_id, record):
+            if slot is not None:
+                self.scheduler.release(slot)
+            return self._follow(run_id, after)
+
+        record = await self.log.load(run_id)
+        run = self._launch(run_id, record.params, resume=True, events=record.events, slot=slot)
+        self._counters["runs_resumed"] += 1
+        return run.subscribe(self._unsubscribe, after)
+
+    async def _follow(self, run_id: str, after: int) -> AsyncIterator[dict]:
+        """
+        Yields a run's logged events after `after`, polling the log until the run finishes.
+        If the run is paused along the way, it's resumed here.
+        """
+        yield _run_event(run_id)
+        while True:
+            record = await self.log.load(run_id, after)
+            for seq, event in record.events:
+                after = seq
+                yield event
+            if record.status == "done":
+                return
+            if record.status == "paused" or not _pid_alive(record.owner):
+                try:
+                    events = await self.resume(run_id, after)
+                except Overloaded as e:
+                    yield {
+                        "event": "error",
+                        "data": json.dumps({"error": str(e), "retry_after": e.retry_after})
+                    }
+                    return
+                if events is not None:
+                    async for event in events:
+                        if event["event"] != "run":
+                            yield event
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs_in_flight": len(self._runs_by_id),
+            "subscribers": sum(len(run.subscribers) for run in self._runs_by_id.values()),
+            **self._counters,
+        }
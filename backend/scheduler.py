@@ -0,0 +1,145 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from metrics import REPORTS_QUEUED, REPORTS_REJECTED
+
+
+
+class Overloaded(Exception):
+    """
+    Raised when a report can't be admitted because the run queue is full.
+    """
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Report queue is full, retry after {retry_after:.0f}s")
+
+
+
+class Slot:
+    """
+    A report's place in the scheduler: waiting in the queue until granted a run slot.
+    """
+    def __init__(self):
+        self.granted = asyncio.Event()
+        self.started_at: Optional[float] = None
+
+
+
+class ReportScheduler:
+    """
+    Admission control for graph runs in a worker.
+
+    At most `max_running` runs execute at once. Up to `max_queued` more wait in a FIFO queue,
+    and their clients get `queued` events with their position and estimated wait. Requests that
+    would overflow the queue are rejected immediately with `Overloaded`, so a traffic spike is
+    shed rather than slowing every report down.
+
+    Waits are estimated from a moving average of recent run durations.
+
+    Parameters:
+        max_running: Runs executing at once (0 for no limit)
+        max_queued: Runs waiting for a slot
+        estimated_run_seconds: Run duration assumed before any run has finished
+    """
+
+    def __init__(self, max_running: int = 4, max_queued: int = 16, estimated_run_seconds: float = 60.0):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.run_seconds = estimated_run_seconds
+        self._running: set[Slot] = set()
+        self._queue: deque[Slot] = deque()
+        self._moved = asyncio.Event()
+        self._counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected": 0,
+        }
+
+    def estimated_wait(self, position: int) -> float:
+        """
+        Seconds until the run at a 1-based queue position should start.
+        """
+        if self.max_running <= 0:
+            return 0.0
+        return math.ceil(position / self.max_running) * self.run_seconds
+
+    def admit(self) -> Slot:
+        """
+        Reserves a run slot or a place in the queue.
+
+        Raises:
+            Overloaded: If every slot is taken and the queue is full
+        """
+        slot = Slot()
+        if self.max_running <= 0 or (len(self._running) < self.max_running and not self._queue):
+            self._grant(slot)
+        elif len(self._queue) < self.max_queued:
+            self._queue.append(slot)
+            self._counters["queued"] += 1
+            REPORTS_QUEUED.inc()
+        else:
+            self._counters["rejected"] += 1
+            REPORTS_REJECTED.inc()
+            raise Overloaded(max(1.0, self.estimated_wait(len(self._queue) + 1)))
+        self._counters["admitted"] += 1
+        return slot
+
+    def _grant(self, slot: Slot) -> None:
+        slot.started_at = time.monotonic()
+        self._running.add(slot)
+        slot.granted.set()
+
+    def release(self, slot: Slot) -> None:
+        """
+        Frees a slot, or removes it from the queue, and starts the next queued runs. Releasing a slot twice is harmless.
+        """
+        if slot in self._running:
+            self._running.discard(slot)
+            # Exponential moving average of run durations
+            self.run_seconds = 0.8 * self.run_seconds + 0.2 * (time.monotonic() - slot.started_at)
+        elif slot in self._queue:
+            self._queue.remove(slot)
+            REPORTS_QUEUED.dec()
+        while self._queue and (self.max_running <= 0 or len(self._running) < self.max_running):
+            self._grant(self._queue.popleft())
+            REPORTS_QUEUED.dec()
+        # Wake waiting runs so they report their new positions
+        self._moved.set()
+        self._moved = asyncio.Event()
+
+    async def run(self, slot: Slot, events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """
+        Yields `queued` events until the slot is granted, then the run's events. The slot is
+        released when the run ends or is cancelled, queued or not.
+        """
+        try:
+            position = None
+            while not slot.granted.is_set():
+                current = self._queue.index(slot) + 1
+                if current != position:
+                    position = current
+                    yield {
+                        "event": "queued",
+                        "data": json.dumps({"position": position, "estimated_wait": round(self.estimated_wait(position), 1)})
+                    }
+                moved = self._moved
+                await moved.wait()
+            async for event in events:
+                yield event
+        finally:
+            self.release(slot)
+            await events.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "running": len(self._running),
+            "queue_length": len(self._queue),
+            "estimated_run_seconds": round(self.run_seconds, 2),
+            **self._counters,
+        }
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import random
+import time
+from typing import Literal, Optional
+
+import httpx
+
+from metrics import SEARCH_REQUESTS, SEARCH_RESULT_BYTES
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+
+def _outcome(status_code: int) -> str:
+    if status_code == 200:
+        return "ok"
+    if status_code == 429:
+        return "rate_limited"
+    return "server_error" if status_code >= 500 else "client_error"
+
+
+
+class SearchError(Exception):
+    """
+    Raised when a search query fails after all retries.
+    """
+    def __init__(self, query: str, message: str):
+        self.query = query
+        super().__init__(f"Search for {query!r} failed: {message}")
+
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by every concurrent search in the process.
+
+    Parameters:
+        rate: Tokens added per second
+        capacity: Maximum number of tokens (i.e. the largest allowed burst)
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """
+        Waits until a token is available and takes it. Waiters are served in order.
+        """
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+
+class SearchClient:
+    """
+    Long-lived Tavily Search client.
+
+    One instance is shared by all reports in a process. Requests go through a single pooled
+    HTTP client, a token bucket limiting the request rate, and a semaphore limiting the
+    number of requests in flight. Rate-limited (429), server (5xx), and network errors are
+    retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://api.tavily.com",
+        max_concurrency: int = 8,
+        rate: float = 5.0,
+        burst: int = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        timeout: float = 180.0
+    ):
+        self._api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._counters = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+        }
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                timeout=self.timeout
+            )
+        return self._http_client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        Returns seconds to wait before the next attempt, honoring Retry-After when the server sends it.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def search(
+        self,
+        query: str,
+        search_depth: Literal['basic', 'advanced'] = 'basic',
+        max_results: int = 5,
+        include_raw_content: bool = False,
+        **kwargs
+    ) -> dict:
+        """
+        Runs one search, retrying transient errors.
+
+        Raises:
+            SearchError: If the search fails after all retries or with a non-retryable error
+        """
+        api_key = self._api_key or os.getenv("TAVILY_API_KEY")
+        data = {
+            "api_key": api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "include_raw_content": include_raw_content,
+            **kwargs
+        }
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with self.semaphore:
+                await self.bucket.acquire()
+                self._counters["requests"] += 1
+                try:
+                    response = await self.http_client.post("/search", json=data)
+                except httpx.TransportError as e:
+                    SEARCH_REQUESTS.labels("transport_error").inc()
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    SEARCH_REQUESTS.labels(_outcome(response.status_code)).inc()
+                    if response.status_code == 200:
+                        SEARCH_RESULT_BYTES.inc(len(response.content))
+                        return response.json()
+                    error = f"HTTP {response.status_code}"
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        break
+
+            if attempt < self.max_retries:
+                self._counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, response))
+
+        self._counters["failures"] += 1
+        raise SearchError(query, error)
+
+    async def search_many(self, queries: list[str], **kwargs) -> tuple[dict[str, dict], list[SearchError]]:
+        """
+        Runs searches concurrently. A failed query is dropped instead of failing the others.
+
+        Returns:
+            tuple: Responses keyed by query for the queries that succeeded, and errors for the ones that didn't
+        """
+        outcomes = await asyncio.gather(
+            *(self.search(query, **kwargs) for query in queries),
+            return_exceptions=True
+        )
+
+        responses, errors = {}, []
+        for query, outcome in zip(queries, outcomes):
+            if isinstance(outcome, SearchError):
+                errors.append(outcome)
+            elif isinstance(outcome, BaseException):
+                errors.append(SearchError(query, f"{type(outcome).__name__}: {outcome}"))
+            else:
+                responses[query] = outcome
+        return responses, errors
+
+    async def aclose(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate": self.bucket.rate,
+            "burst": self.bucket.capacity,
+            **self._counters,
+        }
+
+
+
+search_client = SearchClient(
+    base_url=os.getenv("TAVILY_BASE_URL", "https://api.tavily.com"),
+    max_concurrency=int(os.getenv("TAVILY_MAX_CONCURRENCY", 8)),
+    rate=float(os.getenv("TAVILY_RATE_LIMIT", 5.0)),
+    burst=int(os.getenv("TAVILY_BURST", 10)),
+    max_retries=int(os.getenv("TAVILY_MAX_RETRIES", 3)),
+)
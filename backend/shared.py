@@ -0,0 +1,331 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as redis
+
+# Compare-and-set scripts, so a worker only extends or releases a lease it still holds
+REFRESH_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+
+class SharedState(ABC):
+    """
+    Keys, leases and event channels shared by every worker, so gunicorn workers share caches and
+    in-flight runs rather than each keeping their own.
+
+    Leases are keys that expire unless their owner refreshes them. Channels keep their messages
+    until they expire, so a subscriber that joins late still gets every message from the start.
+
+    Attributes:
+        scope: "machine" if only workers on this machine share the state, "cluster" if any machine can
+    """
+
+    scope = "machine"
+
+    def __init__(self):
+        self._counters = {
+            "gets": 0,
+            "sets": 0,
+            "leases_acquired": 0,
+            "leases_contended": 0,
+            "messages_published": 0,
+        }
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def acquire(self, name: str, owner: str, ttl: float) -> str:
+        """
+        Takes the lease `name` for `owner` unless another owner holds it.
+
+        Returns:
+            str: The lease's owner, which is `owner` if it was acquired
+        """
+        ...
+
+    @abstractmethod
+    async def refresh(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Extends a lease held by `owner`. Returns False if it expired or was taken over.
+        """
+        ...
+
+    @abstractmethod
+    async def release(self, name: str, owner: str) -> None:
+        """
+        Gives up a lease if `owner` still holds it.
+        """
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: bytes, ttl: float) -> None:
+        """
+        Appends a message to a channel, which is kept for `ttl` seconds after its last message.
+        """
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, idle_timeout: float) -> AsyncIterator[Optional[bytes]]:
+        """
+        Yields every message on a channel, from the first, as it's published. Yields None after
+        `idle_timeout` seconds without a message, so the caller can check on the publisher.
+        """
+        ...
+
+    async def trim(self, prefix: str, max_bytes: int) -> int:
+        """
+        Drops the oldest keys starting with `prefix` until their values total at most `max_bytes`.
+        Backends that bound their own size (e.g. Redis `maxmemory`) leave this to the backend.
+
+        Returns:
+            int: Number of keys dropped
+        """
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "scope": self.scope,
+            **self._counters,
+        }
+
+
+
+class SqliteSharedState(SharedState):
+    """
+    Shared state in a SQLite file in WAL mode, for the workers on one machine.
+
+    Subscribers poll their channel every `poll_interval` seconds.
+
+    Parameters:
+        path: SQLite file path
+        poll_interval: Seconds between channel polls
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS shared_keys (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS shared_channels (channel TEXT PRIMARY KEY, expires_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS shared_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, value BLOB)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS shared_messages_channel ON shared_messages (channel, id)")
+        return self._db
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _update(self, sql: str, params: tuple = ()) -> int:
+        with self._lock:
+            return self._connect().execute(sql, params).rowcount
+
+    def _get(self, key: str) -> Optional[bytes]:
+        rows = self._execute("SELECT value FROM shared_keys WHERE key = ? AND expires_at > ?", (key, time.time()))
+        return rows[0][0] if rows else None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self._counters["gets"] += 1
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._counters["sets"] += 1
+        await asyncio.to_thread(self._execute, "INSERT OR REPLACE INTO shared_keys VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+
+    async def trim(self, prefix: str, max_bytes: int) -> int:
+        def trim():
+            with self._lock:
+                db = self._connect()
+                # Keys share a TTL per prefix, so the soonest to expire were set first
+                rows = db.execute(
+                    "SELECT key, LENGTH(value) FROM shared_keys WHERE substr(key, 1, ?) = ? ORDER BY expires_at DESC",
+                    (len(prefix), prefix)
+                ).fetchall()
+                kept, dropped = 0, []
+                for i, (key, size) in enumerate(rows):
+                    kept += size
+                    if i and kept > max_bytes:
+                        dropped.append((key,))
+                db.executemany("DELETE FROM shared_keys WHERE key = ?", dropped)
+            return len(dropped)
+
+        return await asyncio.to_thread(trim)
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> str:
+        def acquire():
+            now = time.time()
+            # The upsert only replaces an expired lease, and is atomic across processes
+            self._execute(
+                "INSERT INTO shared_keys VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+                "SET value = excluded.value, expires_at = excluded.expires_at WHERE shared_keys.expires_at <= ?",
+                (name, owner.encode(), now + ttl, now)
+            )
+            return self._get(name)
+
+        holder = (await asyncio.to_thread(acquire) or b"").decode()
+        self._counters["leases_acquired" if holder == owner else "leases_contended"] += 1
+        return holder
+
+    async def refresh(self, name: str, owner: str, ttl: float) -> bool:
+        updated = await asyncio.to_thread(
+            self._update,
+            "UPDATE shared_keys SET expires_at = ? WHERE key = ? AND value = ? AND expires_at > ?",
+            (time.time() + ttl, name, owner.encode(), time.time())
+        )
+        return updated > 0
+
+    async def release(self, name: str, owner: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM shared_keys WHERE key = ? AND value = ?", (name, owner.encode()))
+
+    async def publish(self, channel: str, message: bytes, ttl: float) -> None:
+        def publish():
+            now = time.time()
+            self._execute("INSERT INTO shared_messages (channel, value) VALUES (?, ?)", (channel, message))
+            # A channel lives as long as its last message
+            self._execute("INSERT OR REPLACE INTO shared_channels VALUES (?, ?)", (channel, now + ttl))
+            self._published += 1
+            if self._published % 1000 == 0:
+                self._execute("DELETE FROM shared_messages WHERE channel IN (SELECT channel FROM shared_channels WHERE expires_at < ?)", (now,))
+                self._execute("DELETE FROM shared_channels WHERE expires_at < ?", (now,))
+                self._execute("DELETE FROM shared_keys WHERE expires_at < ?", (now,))
+
+        self._counters["messages_published"] += 1
+        await asyncio.to_thread(publish)
+
+    async def subscribe(self, channel: str, idle_timeout: float) -> AsyncIterator[Optional[bytes]]:
+        last_id = 0
+        idle_since = time.monotonic()
+        while True:
+            rows = await asyncio.to_thread(
+                self._execute,
+                "SELECT id, value FROM shared_messages WHERE channel = ? AND id > ? ORDER BY id",
+                (channel, last_id)
+            )
+            for last_id, value in rows:
+                yield value
+            if rows:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= idle_timeout:
+                idle_since = time.monotonic()
+                yield None
+            await asyncio.sleep(self.poll_interval)
+
+
+
+class RedisSharedState(SharedState):
+    """
+    Shared state in Redis, for workers on any number of machines.
+
+    Channels are Redis streams, so late subscribers can read them from the start.
+
+    Parameters:
+        url: Redis URL, e.g. redis://localhost:6379/0
+        max_messages: Approximate maximum messages kept per channel
+    """
+
+    scope = "cluster"
+
+    def __init__(self, url: str, max_messages: int = 10000):
+        super().__init__()
+        self.url = url
+        self.max_messages = max_messages
+        self._redis = redis.Redis.from_url(url)
+        self._refresh = self._redis.register_script(REFRESH_SCRIPT)
+        self._release = self._redis.register_script(RELEASE_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self._counters["gets"] += 1
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._counters["sets"] += 1
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> str:
+        while True:
+            if await self._redis.set(name, owner, nx=True, px=int(ttl * 1000)):
+                self._counters["leases_acquired"] += 1
+                return owner
+            holder = await self._redis.get(name)
+            # Retry if the lease expired between the two calls
+            if holder is not None:
+                self._counters["leases_contended"] += 1
+                return holder.decode()
+
+    async def refresh(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(await self._refresh(keys=[name], args=[owner, int(ttl * 1000)]))
+
+    async def release(self, name: str, owner: str) -> None:
+        await self._release(keys=[name], args=[owner])
+
+    async def publish(self, channel: str, message: bytes, ttl: float) -> None:
+        self._counters["messages_published"] += 1
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(channel, {"m": message}, maxlen=self.max_messages, approximate=True)
+            pipe.pexpire(channel, int(ttl * 1000))
+            await pipe.execute()
+
+    async def subscribe(self, channel: str, idle_timeout: float) -> AsyncIterator[Optional[bytes]]:
+        last_id = "0"
+        while True:
+            streams = await self._redis.xread({channel: last_id}, count=100, block=int(idle_timeout * 1000))
+            if not streams:
+                yield None
+                continue
+            for last_id, fields in streams[0][1]:
+                yield fields[b"m"]
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+
+def create_shared_state() -> Optional[SharedState]:
+    """
+    Creates the shared state configured by SHARED_STATE_URL: a redis:// URL, a SQLite file path,
+    or empty for none (each worker keeps its own state).
+    """
+    url = os.getenv("SHARED_STATE_URL", "shared_state.sqlite3")
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedState(url)
+    return SqliteSharedState(url.removeprefix("sqlite:///"))
+
+
+
+shared_state = create_shared_state()
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+
+class SourceStore(ABC):
+    """
+    Content-addressed store of search sources and other large prompt inputs.
+
+    Values are stored once, compressed, under the hash of their JSON encoding, so graph state can
+    carry the hash instead of the value and identical values are only kept once. Stores are bounded
+    by the compressed size of their values and drop the oldest first; callers have to handle a
+    value that's gone (e.g. by searching again).
+
+    Parameters:
+        max_bytes: Maximum total compressed size of stored values
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "duplicates": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def key(encoded: bytes) -> str:
+        return hashlib.sha256(encoded).hexdigest()[:32]
+
+    def put(self, value: Any) -> str:
+        """
+        Stores a JSON-serializable value and returns its key.
+        """
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+        key = self.key(encoded)
+        with self._lock:
+            if self._has(key):
+                self._counters["duplicates"] += 1
+            else:
+                self._put(key, zlib.compress(encoded))
+                self._counters["stores"] += 1
+        return key
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the value stored under a key, or None if it's not (or no longer) stored.
+        """
+        with self._lock:
+            blob = self._get(key)
+            self._counters["hits" if blob is not None else "misses"] += 1
+        return json.loads(zlib.decompress(blob)) if blob is not None else None
+
+    def get_many(self, keys: list[str]) -> Optional[list[Any]]:
+        """
+        Returns the values stored under several keys, or None if any of them is missing.
+        """
+        values = []
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                return None
+            values.append(value)
+        return values
+
+    @abstractmethod
+    def _has(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def _put(self, key: str, blob: bytes) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {"max_bytes": self.max_bytes, **self._counters}
+
+
+
+class MemorySourceStore(SourceStore):
+    """
+    Source store held in process memory, evicting the least recently used value first.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+
+    def _has(self, key: str) -> bool:
+        if key in self._blobs:
+            self._blobs.move_to_end(key)
+            return True
+        return False
+
+    def _get(self, key: str) -> Optional[bytes]:
+        blob = self._blobs.get(key)
+        if blob is not None:
+            self._blobs.move_to_end(key)
+        return blob
+
+    def _put(self, key: str, blob: bytes) -> None:
+        self._blobs[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            _, evicted = self._blobs.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        return {**super().stats(), "values": len(self._blobs), "bytes": self._bytes}
+
+
+
+class _Segment:
+    """
+    Append-only file of compressed values, read through a memory map. The file is unlinked as soon
+    as it's created, so it's private to the process and disappears with it.
+    """
+
+    def __init__(self, directory: str):
+        fd, path = tempfile.mkstemp(prefix="sources-", suffix=".bin", dir=directory)
+        os.unlink(path)
+        self.file = os.fdopen(fd, "r+b")
+        self.index: dict[str, tuple[int, int]] = {}
+        self.size = 0
+        self._map: Optional[mmap.mmap] = None
+
+    def append(self, key: str, blob: bytes) -> None:
+        self.file.seek(self.size)
+        self.file.write(blob)
+        self.file.flush()
+        self.index[key] = (self.size, len(blob))
+        self.size += len(blob)
+
+    def read(self, key: str) -> Optional[bytes]:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        # Values appended since the file was last mapped need a bigger map
+        if self._map is None or len(self._map) < offset + length:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self.file.close()
+
+
+
+class FileSourceStore(SourceStore):
+    """
+    Source store in memory-mapped temporary files, so values sit in the page cache rather than
+    the Python heap. Values are appended to the newer of two files; once it holds half of
+    `max_bytes`, the older file is dropped and a new one started.
+
+    Parameters:
+        directory: Directory for the files (the system temp directory if empty)
+    """
+
+    def __init__(self, directory: str = "", **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory or None
+        self._segments = [_Segment(self.directory)]
+
+    def _has(self, key: str) -> bool:
+        return any(key in segment.index for segment in self._segments)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        for segment in reversed(self._segments):
+            blob = segment.read(key)
+            if blob is not None:
+                return blob
+        return None
+
+    def _put(self, key: str, blob: bytes) -> None:
+        if self._segments[-1].size + len(blob) > self.max_bytes // 2 and self._segments[-1].index:
+            if len(self._segments) > 1:
+                evicted = self._segments.pop(0)
+                self._counters["evictions"] += len(evicted.index)
+                evicted.close()
+            self._segments.append(_Segment(self.directory))
+        self._segments[-1].append(key, blob)
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "values": sum(len(segment.index) for segment in self._segments),
+            "bytes": sum(segment.size for segment in self._segments),
+        }
+
+
+
+def create_source_store() -> SourceStore:
+    """
+    Creates the source store configured by the environment: in memory-mapped files if
+    SOURCE_STORE_DIR is set, otherwise in memory.
+    """
+    max_bytes = int(os.getenv("SOURCE_STORE_MAX_BYTES", 64 * 1024 * 1024))
+    directory = os.getenv("SOURCE_STORE_DIR")
+    if directory is not None:
+        return FileSourceStore(directory, max_bytes=max_bytes)
+    return MemorySourceStore(max_bytes=max_bytes)
+
+
+
+source_store = create_source_store()
@@ -0,0 +1,204 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Optional
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from state import Section
+
+
+
+def dumps(data: Any) -> str:
+    """
+    Serializes SSE event data to a JSON string.
+    """
+    return orjson.dumps(data, default=_default).decode()
+
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return jsonable_encoder(obj)
+
+
+
+def _finished_section(diff: dict) -> Optional[Section]:
+    sections = diff.get("finished_sections_list") or []
+    return sections[-1] if sections else None
+
+
+
+def project_update(node: str, diff: Optional[dict]) -> dict:
+    """
+    Projects a node's state diff to the fields its SSE event needs.
+
+    Large internal fields (source content, rendered sections) are dropped, and each finished
+    section is sent once, from the node that wrote it.
+
+    Parameters:
+        node: Name of the node that produced the diff
+        diff: State update returned by the node
+
+    Returns:
+        dict: Fields to send to the client
+    """
+    diff = diff or {}
+
+    if node == "plan_report":
+        return {
+            "sections": [
+                {"name": section.name, "description": section.description, "research": section.research}
+                for section in diff.get("sections", [])
+            ]
+        }
+    if node == "generate_queries":
+        return {"queries": [query.search_query for query in diff.get("search_queries", [])]}
+    if node == "search_web":
+        return {"search_iterations": diff.get("search_iterations"), "source_tokens": diff.get("source_tokens")}
+    # Sections cut short to meet the report's deadline are "partial", and ones a refresh kept are "reused"
+    status = "partial" if diff.get("degraded") else "reused" if diff.get("reused_sections") else "complete"
+    if node in ("write_section", "write_intro_and_conclusion"):
+        section = _finished_section(diff)
+        if section is None:
+            return {}
+        return {"section": section.name, "status": status, "content": section.content}
+    if node == "build_section":
+        section = _finished_section(diff)
+        return {"section": section.name, "status": status} if section is not None else {}
+    if node == "resume":
+        return {"sections": [{"section": section.name, "status": "complete"} for section in diff.get("finished_sections_list", [])]}
+    if node == "compile_report":
+        return {"finished_report": diff.get("finished_report")}
+    return {}
+
+
+
+def step_event(node: str, diff: Optional[dict], verbose: bool = False) -> dict:
+    """
+    Builds the `step` SSE event for a node update, with the full diff if `verbose`.
+    """
+    return {
+        "event": "step",
+        "data": dumps({
+            "node": node,
+            "diff": diff if verbose else project_update(node, diff)
+        })
+    }
+
+
+
+class TokenBatcher:
+    """
+    Coalesces streamed LLM tokens into small per-section batches so each token isn't its own SSE frame.
+
+    A section's batch is flushed once it holds `max_chars` characters or its oldest token is
+    `max_delay` seconds old. A section rewritten after follow-up research streams again from the
+    start, so the new pass begins with a `token_reset` event telling the client to drop the text it has.
+
+    Parameters:
+        max_chars: Characters that trigger a flush
+        max_delay: Seconds after which buffered tokens are flushed
+    """
+
+    def __init__(self, max_chars: int = 200, max_delay: float = 0.1):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._buffers: dict[str, list[str]] = {}
+        self._sizes: dict[str, int] = {}
+        self._started: dict[str, float] = {}
+        self._writers: dict[str, str] = {}
+
+    def add(self, section: str, text: str, writer: Optional[str] = None) -> list[dict]:
+        """
+        Buffers a token and returns any token events that are due.
+
+        Parameters:
+            section: Name of the section the token belongs to
+            text: Token text
+            writer: Identifies the call writing the section (e.g. its LangGraph task), so a new pass can be told apart
+        """
+        if not text:
+            return []
+        events = []
+        if writer is not None and self._writers.setdefault(section, writer) != writer:
+            self._writers[section] = writer
+            if section in self._buffers:
+                del self._buffers[section], self._sizes[section], self._started[section]
+            events.append({"event": "token_reset", "data": dumps({"section": section})})
+        if section not in self._buffers:
+            self._buffers[section] = []
+            self._sizes[section] = 0
+            self._started[section] = time.monotonic()
+        self._buffers[section].append(text)
+        self._sizes[section] += len(text)
+
+        if self._sizes[section] >= self.max_chars or time.monotonic() - self._started[section] >= self.max_delay:
+            events.append(self._flush(section))
+        return events
+
+    def due(self) -> list[dict]:
+        """
+        Returns token events for sections whose oldest buffered token is `max_delay` seconds old.
+
+        Called while the stream is idle, so a writer that stalls mid-section doesn't hold back what it already sent.
+        """
+        now = time.monotonic()
+        return [self._flush(section) for section, started in list(self._started.items()) if now - started >= self.max_delay]
+
+    def flush(self) -> list[dict]:
+        """
+        Returns token events for everything still buffered.
+        """
+        return [self._flush(section) for section in list(self._buffers)]
+
+    def _flush(self, section: str) -> dict:
+        text = "".join(self._buffers.pop(section))
+        del self._sizes[section], self._started[section]
+        return {
+            "event": "token",
+            "data": dumps({"section": section, "text": text})
+        }
+
+
+
+async def with_ticks(stream: AsyncIterator, interval: float) -> AsyncIterator:
+    """
+    Yields the items of `stream`, and `None` each time `interval` seconds pass without one.
+
+    The stream is consumed in its own task so waiting for an item never cancels it midway.
+    The task is cancelled if the caller stops iterating early.
+
+    Parameters:
+        stream: Async iterator to consume
+        interval: Seconds without an item after which `None` is yielded
+    """
+    queue = asyncio.Queue(maxsize=1)
+    end = object()
+
+    async def pump():
+        try:
+            async for item in stream:
+                await queue.put((item, None))
+            await queue.put((end, None))
+        except Exception as e:
+            await queue.put((end, e))
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), interval)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -31,6 +31,19 @@ class SearchQueries(BaseModel):
         description="List of search queries."
     )
 
+class SectionSearchQueries(BaseModel):
+    section: str = Field(
+        description="Name of the section the queries are for."
+    )
+    queries: list[SearchQuery] = Field(
+        description="List of search queries."
+    )
+
+class ReportSearchQueries(BaseModel):
+    sections: list[SectionSearchQueries] = Field(
+        description="Search queries for each section of the report."
+    )
+
 class Feedback(BaseModel):
     grade: Literal['pass', 'fail'] = Field(
         description="Evaluation indicating whether the response is satisfactory (pass) or needs revision (fail)."
@@ -51,17 +64,36 @@ class ReportState(TypedDict):
     # feedback: str
     sections: list[Section] # List of report sections
     finished_sections_list: Annotated[list[Section], operator.add] # Send() key
-    finished_sections_str: str # String of finished sections used to write final sections
+    section_digests: Annotated[list[dict], operator.add] # Compact digest of each finished section
+    finished_sections_ref: str # Source store key of the finished sections used to write final sections
+    finished_section_refs: list[dict] # Name and source store key of each finished section's part of that context
     finished_report: str # Finished report
+    degraded: Annotated[list[dict], operator.add] # Parts of the report cut short to meet its deadline
+    section_evidence: Annotated[list[dict], operator.add] # Each researched section's last queries and source hashes
+    reused_sections: Annotated[list[str], operator.add] # Sections a refresh kept from the stored report
 
 class SectionState(TypedDict):
     topic: str # Report topic
     section: Section # Report section
     search_queries: list[SearchQuery] # List of search queries
     search_iterations: int # Number of search iterations that have been done
-    source_content_str: str # String of formatted source content from web search
+    source_refs: list[dict] # URL and source store key of each source from web search, best first
+    source_tokens: dict # Tokens used and dropped packing source content into the prompt, and passages ranked
+    searched_queries: Annotated[list[str], operator.add] # Queries searched in every research round
+    source_hashes: Annotated[dict, operator.or_] # Hash of each source's packed content, by URL, from every research round
+    previous_content: str # Section's content in the stored report being refreshed
+    previous_sources: dict # Source hashes the stored section was written from
     finished_sections_list: list[Section] # Final key duplicated in outer state for Send()
-    finished_sections_str: str # String of finished sections used to write final sections
+    section_digests: list[dict] # Final key duplicated in outer state
+    finished_sections_ref: str # Source store key of the finished sections used to write final sections
+    finished_section_refs: list[dict] # Name and source store key of each finished section's part of that context
+    degraded: Annotated[list[dict], operator.add] # Parts of the section cut short to meet the report's deadline
+    section_evidence: list[dict] # Final key duplicated in outer state
+    reused_sections: list[str] # Final key duplicated in outer state
 
 class SectionOutputState(TypedDict):
-    finished_sections_list: list[Section] # Final key duplicated in outer state for Send()
\ No newline at end of file
+    finished_sections_list: list[Section] # Final key duplicated in outer state for Send()
+    section_digests: list[dict] # Final key duplicated in outer state
+    degraded: list[dict] # Final key duplicated in outer state
+    section_evidence: list[dict] # Final key duplicated in outer state
+    reused_sections: list[str] # Final key duplicated in outer state
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# The backend's clients read these at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+
+# Keep the stores tests open out of the working tree
+_workdir = tempfile.mkdtemp(prefix="cera-tests-")
+os.environ.setdefault("SEARCH_CACHE_PATH", "")
+os.environ.setdefault("CHECKPOINT_PATH", os.path.join(_workdir, "checkpoints.sqlite3"))
+os.environ.setdefault("RUN_LOG_PATH", os.path.join(_workdir, "runs.sqlite3"))
+os.environ.setdefault("SHARED_STATE_URL", os.path.join(_workdir, "shared_state.sqlite3"))
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from dedup import collapse_near_duplicates
+
+TEXT = " ".join(f"word{i % 37} story{i % 11}" for i in range(200))
+
+
+
+def test_minhash_is_the_same_in_every_process():
+    script = f"from dedup import minhash; print(minhash({TEXT!r}).tobytes().hex())"
+    signatures = {
+        subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        for seed in ("1", "2")
+    }
+    assert len(signatures) == 1
+
+
+
+def test_copies_collapse_into_the_highest_scoring_source():
+    responses = [{"query": "q", "results": [
+        {"url": "https://a.example.com", "content": TEXT, "score": 0.5},
+        {"url": "https://b.example.com", "content": f"By Outlet B staff. {TEXT}", "score": 0.9},
+    ]}]
+
+    collapsed, stats = collapse_near_duplicates(responses)
+
+    assert stats == {"near_duplicates": 1}
+    assert [source["url"] for source in collapsed[0]["results"]] == ["https://b.example.com"]
+    assert collapsed[0]["results"][0]["alternate_urls"] == ["https://a.example.com"]
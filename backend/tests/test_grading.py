@@ -0,0 +1,10 @@
+from grading import SectionGrading
+
+
+
+def test_llm_grader_calls_are_capped_in_every_mode():
+    for mode in ("local", "llm"):
+        grading = SectionGrading(mode=mode, max_llm_calls=2)
+
+        assert [grading.take_llm_call() for _ in range(3)] == [True, True, False]
+        assert grading.stats()["llm_skipped"] == 1
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+import uuid
+from typing import Optional
+
+from langchain_core.messages import AIMessage
+
+import graph
+import models
+import search
+from benchmarks.fakes import FakeChatModel, FakeTavilyServer
+from deadline import Deadline
+from grading import SectionGrading
+from state import Section
+
+
+
+class RecordingModel:
+    """
+    Chat model stand-in that records the messages it's sent.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        return AIMessage(content="## Introduction\n\nWritten.")
+
+
+
+def test_intro_and_conclusion_are_sent_store_keys_not_sections():
+    supply = Section(name="Supply", description="Where cells come from", research=True, content="## Supply\n\nMost cells come from phones.")
+    intro = Section(name="Introduction", description="Overview of the report", research=False, content="")
+    conclusion = Section(name="Conclusion", description="Summary of the report", research=False, content="")
+    state = {"topic": "Battery recycling", "sections": [intro, supply, conclusion], "finished_sections_list": [supply], "section_digests": []}
+    state.update(asyncio.run(graph.format_sections_as_string(state)))
+
+    sends = asyncio.run(graph.initiate_intro_and_conclusion_writing(state))
+
+    assert [send.arg["section"].name for send in sends] == ["Introduction", "Conclusion"]
+    for send in sends:
+        assert "Most cells come from phones." not in repr(send.arg)
+        assert send.arg["finished_section_refs"] == [{"section": "Supply", "ref": state["finished_section_refs"][0]["ref"]}]
+
+
+
+def test_intro_rebuilds_finished_sections_the_store_no_longer_has(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(graph.model_registry, "get", lambda spec: model)
+    supply = Section(name="Supply", description="Where cells come from", research=True, content="## Supply\n\nMost cells come from phones.")
+    state = {
+        "topic": "Battery recycling",
+        "section": Section(name="Introduction", description="Overview of the report", research=False, content=""),
+        "finished_sections_ref": "evicted",
+        "finished_section_refs": [{"section": "Supply", "ref": graph.source_store.put(graph.section_context(supply))}],
+    }
+
+    result = asyncio.run(graph.write_intro_and_conclusion(state, {"configurable": {}}))
+
+    assert "Most cells come from phones." in model.calls[0][-1].content
+    assert result["finished_sections_list"][0].content == "## Introduction\n\nWritten."
+
+
+
+def test_section_digests_are_made_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def digest(section, model):
+        threads.append(threading.current_thread())
+        return "Supply: most cells come from phones."
+
+    monkeypatch.setattr(graph, "SECTION_DIGEST_TOKENS", 150)
+    monkeypatch.setattr(graph, "digest_section", digest)
+    supply = Section(name="Supply", description="Where cells come from", research=True, content="## Supply\n\nMost cells come from phones.")
+
+    update = asyncio.run(graph.finished_section(supply))
+
+    assert update["section_digests"] == [{"section": "Supply", "digest": "Supply: most cells come from phones."}]
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+
+
+
+def run_report(
+    monkeypatch,
+    search_server: FakeTavilyServer,
+    llm_latency: float = 0.2,
+    sections: int = 3,
+    deadline: Optional[float] = None,
+    grading: Optional[SectionGrading] = None,
+    **llm_kwargs
+) -> tuple[dict, dict]:
+    """
+    Runs a report through the graph against fake models and a fake Tavily server.
+
+    Returns:
+        tuple: The final report state, and the (start, end) times of each node run by name
+    """
+    monkeypatch.setattr(models, "init_chat_model", lambda model, model_provider="openai", **kwargs: FakeChatModel(
+        model_name=model, latency=llm_latency, tokens_per_second=1000, response_words=40, num_sections=sections, **llm_kwargs
+    ))
+    monkeypatch.setattr(graph.model_registry, "_models", {})
+    for name in ("_http_client", "_semaphore"):
+        monkeypatch.setattr(search.search_client, name, None)
+    monkeypatch.setattr(search.search_client.bucket, "rate", 0)
+
+    async def run():
+        monkeypatch.setattr(search.search_client, "base_url", await search_server.start())
+        config = {"configurable": {
+            "thread_id": str(uuid.uuid4()),
+            "deadline": Deadline(deadline) if deadline is not None else None,
+            "section_grading": grading
+        }}
+        state, started, times = {}, {}, {}
+        try:
+            async for namespace, mode, event in graph.graph.astream({"topic": f"test topic {uuid.uuid4().hex[:8]}"}, config, stream_mode=["debug", "values"], subgraphs=True):
+                if mode == "values":
+                    state = event if not namespace else state
+                elif event["type"] == "task":
+                    started[event["payload"]["id"]] = time.monotonic()
+                elif event["type"] == "task_result":
+                    times.setdefault(event["payload"]["name"], []).append((started.pop(event["payload"]["id"]), time.monotonic()))
+        finally:
+            await search.search_client.aclose()
+            await search_server.stop()
+        return state, times
+
+    return asyncio.run(run())
+
+
+
+def test_sections_are_written_at_the_same_time(monkeypatch):
+    state, times = run_report(monkeypatch, FakeTavilyServer(latency=0.05, raw_content_chars=2000), sections=4)
+
+    writes = times["write_section"]
+    assert len(writes) == 4
+    # Every section's writing overlaps every other's
+    assert max(start for start, _ in writes) < min(end for _, end in writes)
+    assert state["finished_report"]
+
+
+
+def test_sources_that_miss_the_deadline_leave_a_partial_report(monkeypatch):
+    slow_search = FakeTavilyServer(latency=0.0, slow_rate=1.0, slow_latency=4, raw_content_chars=2000)
+
+    state, times = run_report(monkeypatch, slow_search, llm_latency=0.05, deadline=2)
+
+    started = min(start for runs in times.values() for start, _ in runs)
+    assert times["compile_report"][0][1] - started < 2
+    assert {part["part"] for part in state["degraded"]} >= {"sources"}
+    assert "_Partial section:" in state["finished_report"]
+
+
+
+def test_section_evidence_keeps_every_research_round(monkeypatch):
+    grading = SectionGrading(mode="llm", max_follow_ups=1, max_llm_calls=10)
+
+    state, times = run_report(monkeypatch, FakeTavilyServer(latency=0.0, raw_content_chars=2000), llm_latency=0.01, grading=grading, grader_fail_rate=1.0)
+
+    assert grading.stats()["follow_ups"] == 3
+    assert len(times["search_web"]) == 6
+    for evidence in state["section_evidence"]:
+        # Two queries from the first round, and the grader's follow-ups
+        assert len(evidence["queries"]) > 2
+        assert len(evidence["sources"]) > 2
+
+
+
+def test_a_failing_grader_keeps_the_written_sections(monkeypatch):
+    async def grade_with_llm(topic, section, num_queries=2):
+        raise TimeoutError("grader timed out")
+
+    monkeypatch.setattr(graph, "grade_with_llm", grade_with_llm)
+    grading = SectionGrading(mode="llm", max_llm_calls=10)
+
+    state, times = run_report(monkeypatch, FakeTavilyServer(latency=0.0, raw_content_chars=2000), llm_latency=0.01, grading=grading)
+
+    assert grading.stats()["llm_error"] == 3
+    assert len(times["search_web"]) == 3
+    # Three researched sections, the introduction and the conclusion
+    assert len(state["finished_sections_list"]) == 5
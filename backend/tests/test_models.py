@@ -0,0 +1,65 @@
+import asyncio
+import gc
+from typing import TypedDict
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langgraph.graph import END, START, StateGraph
+
+import models
+from benchmarks.fakes import FakeChatModel
+from models import ModelRegistry, ModelSpec
+
+
+
+class Stream:
+    """
+    Stands in for the network stream httpcore reports for a response's connection.
+    """
+
+
+
+def test_connection_reuse_is_counted_per_open_connection():
+    registry = ModelRegistry()
+    stream = Stream()
+
+    def response(network_stream):
+        return httpx.Response(200, extensions={"network_stream": network_stream})
+
+    async def respond():
+        await registry._on_response(response(stream))
+        await registry._on_response(response(stream))
+        await registry._on_response(response(Stream()))
+
+    asyncio.run(respond())
+    gc.collect()
+
+    assert registry.stats()["connections_opened"] == 2
+    assert registry.stats()["connections_reused"] == 1
+    # Closed connections aren't kept around
+    assert len(registry._streams) == 1
+
+
+
+def test_registry_models_stream_tokens_and_record_usage(monkeypatch):
+    monkeypatch.setattr(models, "init_chat_model", lambda model, model_provider="openai", **kwargs: FakeChatModel(
+        model_name=model, latency=0.0, tokens_per_second=1000, response_words=10
+    ))
+    registry = ModelRegistry()
+
+    async def write(state: dict) -> dict:
+        response = await registry.get(ModelSpec("gpt-4.1")).ainvoke([HumanMessage(content="Write the section")])
+        return {"text": response.content}
+
+    builder = StateGraph(TypedDict("State", {"text": str}))
+    builder.add_node("write", write)
+    builder.add_edge(START, "write")
+    builder.add_edge("write", END)
+
+    async def stream():
+        return [mode async for mode, _ in builder.compile().astream({"text": ""}, stream_mode=["messages", "updates"])]
+
+    modes = asyncio.run(stream())
+
+    assert modes.count("messages") > 1
+    assert registry.usage.stats()["write"]["calls"] == 1
@@ -0,0 +1,32 @@
+import utils
+from utils import pack_search_results
+
+
+
+def make_responses(sources: int, paragraphs: int) -> list[dict]:
+    return [{"query": "q", "results": [
+        {
+            "title": f"Source {i}",
+            "url": f"https://news.example.com/{i}",
+            "content": "Summary of the story.",
+            "score": 1 - i / sources,
+            "raw_content": "\n\n".join(f"Paragraph {j} of source {i}. " * 20 for j in range(paragraphs)),
+        }
+        for i in range(sources)
+    ]}]
+
+
+
+def test_packing_stays_within_budget_and_stops_tokenizing_once_full(monkeypatch):
+    monkeypatch.setitem(utils.SOURCE_TOKEN_BUDGETS, "gpt-4.1", 2000)
+    calls = []
+    count_tokens = utils.count_tokens
+    monkeypatch.setattr(utils, "count_tokens", lambda text, model="gpt-4.1": calls.append(text) or count_tokens(text, model))
+
+    sources, stats = pack_search_results(make_responses(sources=10, paragraphs=50), "gpt-4.1")
+
+    assert stats["tokens_used"] <= stats["token_budget"]
+    assert stats["tokens_dropped"] > 0
+    assert sum(len(source["raw_content"]) > 0 for source in sources) >= 1
+    # Of 500 paragraphs, only the ones around where the budget filled up are tokenized
+    assert len(calls) < 50
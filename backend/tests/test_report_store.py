@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+import pytest
+
+from report_store import ReportStore, SharedReportStore
+from shared import SharedState, SqliteSharedState
+
+
+
+def test_stores_and_shared_state_backends_must_implement_the_interface():
+    for base in (ReportStore, SharedState):
+        with pytest.raises(TypeError):
+            base()
+
+
+
+def test_sqlite_shared_report_store_stays_under_max_bytes(tmp_path):
+    store = SharedReportStore(SqliteSharedState(str(tmp_path / "shared_state.sqlite3")), max_bytes=4000)
+
+    async def fill():
+        # Random hex barely compresses, so each report takes ~1KB
+        for i in range(5):
+            await store.put(f"topic {i}", {"topic": f"topic {i}", "finished_report": os.urandom(1000).hex(), "events": [], "stored_at": 0.0})
+        return [await store.get(f"topic {i}", max_age=float("inf")) for i in range(5)]
+
+    stored = asyncio.run(fill())
+
+    assert stored[0] is None
+    assert stored[-1] is not None
+    assert store.stats()["evictions"] >= 1
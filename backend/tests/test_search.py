@@ -0,0 +1,84 @@
+import asyncio
+
+from aiohttp import web
+
+import utils
+from benchmarks.fakes import FakeTavilyServer
+from search import SearchClient
+from utils import SearchBroker
+
+
+
+class RateLimitedServer(FakeTavilyServer):
+    """
+    Fake Tavily that answers the first `rejections` searches with 429.
+    """
+
+    def __init__(self, rejections: int, **kwargs):
+        super().__init__(latency=0.0, **kwargs)
+        self.rejections = rejections
+
+    async def _search(self, request: web.Request) -> web.Response:
+        if self.requests < self.rejections:
+            self.requests += 1
+            return web.json_response({"detail": {"error": "Too many requests."}}, status=429, headers={"Retry-After": "0.01"})
+        return await super()._search(request)
+
+
+
+def search_with(server: FakeTavilyServer, queries: list[str], **client_kwargs) -> tuple:
+    async def run():
+        url = await server.start()
+        client = SearchClient(api_key="test", base_url=url, rate=0, **client_kwargs)
+        try:
+            return await client.search_many(queries), client.stats()
+        finally:
+            await client.aclose()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+
+def test_rate_limited_searches_are_retried_until_they_succeed():
+    server = RateLimitedServer(rejections=2)
+
+    (responses, errors), stats = search_with(server, ["battery recycling"], max_retries=3)
+
+    assert errors == []
+    assert responses["battery recycling"]["results"]
+    assert server.requests == 3
+    assert stats["retries"] == 2
+
+
+
+def test_a_search_that_keeps_failing_is_dropped_without_failing_the_others():
+    server = RateLimitedServer(rejections=1)
+
+    (responses, errors), _ = search_with(server, ["first", "second"], max_retries=0, max_concurrency=1)
+
+    assert list(responses) == ["second"]
+    assert [error.query for error in errors] == ["first"]
+
+
+
+def test_broker_retries_a_failed_search_and_only_counts_answered_ones_as_saved(monkeypatch):
+    calls = []
+
+    async def search_keys(keys, depth, max_results, use_cache):
+        calls.append(list(keys))
+        # The first search fails, which `_search_keys` reports by leaving its key out
+        return {} if len(calls) == 1 else {key: {"query": query, "results": []} for key, query in keys.items()}
+
+    monkeypatch.setattr(utils, "_search_keys", search_keys)
+    broker = SearchBroker()
+
+    async def run():
+        return [await broker.search({"k": "battery recycling"}, "basic", 2, True) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+
+    assert first == {}
+    assert second == third == {"k": {"query": "battery recycling", "results": []}}
+    assert len(calls) == 2
+    assert broker.stats() == {"queries": 3, "searches": 2, "searches_saved": 1}
@@ -0,0 +1,18 @@
+from utils import SearchCache, normalize_query
+
+
+
+def test_normalize_query_ignores_case_punctuation_and_plurals():
+    assert normalize_query("  US Tariffs on  China? ") == normalize_query("us tariff on china")
+
+
+
+def test_reordered_subject_and_object_do_not_collide():
+    assert normalize_query("Israel strikes Iran") != normalize_query("Iran strikes Israel")
+    assert normalize_query("US tariffs on China") != normalize_query("China tariffs on US")
+    assert SearchCache.key("Israel strikes Iran", "basic", 2) != SearchCache.key("Iran strikes Israel", "basic", 2)
+
+
+
+def test_repeated_words_are_kept():
+    assert normalize_query("talks talks") != normalize_query("talks")
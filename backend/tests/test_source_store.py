@@ -0,0 +1,27 @@
+import pytest
+
+from source_store import FileSourceStore, MemorySourceStore, SourceStore
+
+
+
+def test_source_store_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        SourceStore()
+
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda tmp_path: MemorySourceStore(max_bytes=1024 * 1024),
+    lambda tmp_path: FileSourceStore(str(tmp_path), max_bytes=1024 * 1024),
+])
+def test_values_are_stored_once_under_their_hash(tmp_path, make_store):
+    store = make_store(tmp_path)
+    source = {"url": "https://news.example.com/1", "content": "Most cells come from phones."}
+
+    key = store.put(source)
+
+    assert store.put(dict(reversed(source.items()))) == key
+    assert store.get(key) == source
+    assert store.get("missing") is None
+    assert store.stats()["stores"] == 1
+    assert store.stats()["duplicates"] == 1
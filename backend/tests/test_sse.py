@@ -0,0 +1,48 @@
+import asyncio
+import json
+import time
+
+from sse import TokenBatcher, with_ticks
+
+
+
+def test_a_rewritten_section_resets_its_streamed_text():
+    batcher = TokenBatcher(max_chars=1000, max_delay=60)
+
+    first = batcher.add("Supply", "First draft ", writer="write_section:1")
+    reset = batcher.add("Supply", "Second draft", writer="write_section:2")
+    flushed = batcher.flush()
+
+    assert first == []
+    assert [event["event"] for event in reset] == ["token_reset"]
+    assert json.loads(reset[0]["data"]) == {"section": "Supply"}
+    # The first draft's buffered text is dropped rather than sent after the reset
+    assert [json.loads(event["data"])["text"] for event in flushed] == ["Second draft"]
+
+
+
+def test_tokens_buffered_before_a_stall_are_flushed_without_a_new_token():
+    batcher = TokenBatcher(max_chars=1000, max_delay=0.05)
+
+    async def stalling_writer():
+        yield "Phones "
+        yield "are "
+        # The model stalls, so no token arrives to trigger the delay flush
+        await asyncio.sleep(0.5)
+        yield "everywhere."
+
+    async def run():
+        sent = []
+        async for token in with_ticks(stalling_writer(), batcher.max_delay):
+            sent.extend((time.monotonic(), json.loads(event["data"])["text"]) for event in batcher.due())
+            if token is not None:
+                sent.extend((time.monotonic(), json.loads(event["data"])["text"]) for event in batcher.add("Supply", token))
+        sent.extend((time.monotonic(), json.loads(event["data"])["text"]) for event in batcher.flush())
+        return sent
+
+    start = time.monotonic()
+    sent = asyncio.run(run())
+
+    assert [text for _, text in sent] == ["Phones are ", "everywhere."]
+    # The first batch went out during the stall, not when the next token finally came
+    assert sent[0][0] - start < 0.3
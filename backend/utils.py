@@ -1,21 +1,65 @@
 import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timezone
+from functools import lru_cache
 from textwrap import dedent
-from typing import Literal
+from typing import Literal, Optional
 
+import tiktoken
 from langsmith import traceable
 
-from tavily import AsyncTavilyClient
-
+from dedup import collapse_near_duplicates
+from metrics import SEARCH_CACHE, SEARCHES_COALESCED
+from ranking import rank_search_results, tokenize
+from search import search_client
+from shared import SharedState, shared_state
 from state import Section
 
+logger = logging.getLogger(__name__)
+
+
+
+# Seconds the date and time in prompts is rounded down to. Prompts only share a cacheable prefix within the same window.
+PROMPT_TIME_GRANULARITY = int(os.getenv("PROMPT_TIME_GRANULARITY", 3600))
+
+
+
+def get_current_utc_datetime(granularity: int = PROMPT_TIME_GRANULARITY) -> str:
+    """
+    Returns the current UTC date and time, rounded down to `granularity` seconds, as a string formatted as YYYY-MM-DD HH:MM:SS.
+    """
+    now = time.time()
+    if granularity > 1:
+        now -= now % granularity
+    return datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    Normalizes a report topic so requests for the same topic share work.
+    """
+    return re.sub(r"\s+", " ", topic).strip().rstrip("?.!").strip().lower()
 
 
-def get_current_utc_datetime() -> str:
+
+def normalize_query(query: str) -> str:
     """
-    Returns the current UTC date and time as a string formatted as YYYY-MM-DD HH:MM:SS.
+    Normalizes a search query so near-identical queries (differing in case, whitespace, punctuation
+    or plurals) are searched once. Word order and repeated words are kept, since "Israel strikes Iran"
+    and "Iran strikes Israel" are different searches.
     """
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    terms = tokenize(query, keep_stopwords=True)
+    return " ".join(terms) if terms else re.sub(r"\s+", " ", query).strip().lower()
 
 
 
@@ -41,16 +85,337 @@ def format_sections(sections: list[Section]) -> str:
 
 
 
+class StreamedListParser:
+    """
+    Parses a streamed JSON object incrementally, returning each item of one of its list fields as
+    soon as the item's closing brace arrives.
+
+    Parameters:
+        field: Name of the top-level list field whose object items are returned
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.text = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key = None
+        self._list_depth = None
+        self._item_start = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        """
+        Adds streamed text and returns the list items completed by it.
+        """
+        self.text += chunk
+        items = []
+        for i in range(self._position, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = self.text[self._string_start:i]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._last_key == self.field:
+                    self._list_depth = self._depth
+                elif char == "{" and self._list_depth is not None and self._depth == self._list_depth + 1:
+                    self._item_start = i
+            elif char in "}]":
+                if char == "}" and self._item_start is not None and self._depth == self._list_depth + 1:
+                    try:
+                        items.append(json.loads(self.text[self._item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                elif char == "]" and self._depth == self._list_depth:
+                    self._list_depth = None
+                self._depth -= 1
+        self._position = len(self.text)
+        return items
+
+
+
+class SearchCache:
+    """
+    Cache of Tavily Search responses keyed on the normalized query, search depth and max results.
+
+    An in-process LRU sits in front of an on-disk SQLite store, so entries survive restarts and
+    are shared by every worker on the machine. Entries expire after `ttl` seconds, which should be
+    short enough for current events to stay fresh. With shared state that spans machines, it's
+    used in place of the SQLite store.
+
+    Parameters:
+        path: SQLite file path, or None for a memory-only cache
+        ttl: Seconds an entry stays fresh
+        memory_items: Maximum entries held in memory
+        disk_items: Maximum entries held on disk
+        shared: State shared with workers on other machines, if any
+    """
+
+    def __init__(self, path: Optional[str], ttl: float = 900, memory_items: int = 512, disk_items: int = 10000, shared: Optional[SharedState] = None):
+        self.path = path
+        self.shared = shared
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def key(query: str, depth: str, max_results: int) -> str:
+        return hashlib.sha256(f"{depth}|{max_results}|{normalize_query(query)}".encode()).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, stored_at REAL, value BLOB)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS search_cache_stored_at ON search_cache (stored_at)")
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[tuple[float, dict]]:
+        with self._db_lock:
+            row = self._connect().execute("SELECT stored_at, value FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(zlib.decompress(row[1]))
+
+    def _disk_set(self, key: str, stored_at: float, value: dict) -> None:
+        blob = zlib.compress(json.dumps(value).encode())
+        with self._db_lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)", (key, stored_at, blob))
+            # Drop expired entries, then the oldest ones past the size bound
+            db.execute("DELETE FROM search_cache WHERE stored_at < ?", (stored_at - self.ttl,))
+            db.execute(
+                "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_items,)
+            )
+
+    async def _shared_get(self, key: str) -> Optional[tuple[float, dict]]:
+        blob = await self.shared.get(f"search:{key}")
+        if blob is None:
+            return None
+        stored_at, value = json.loads(zlib.decompress(blob))
+        return stored_at, value
+
+    async def _shared_set(self, key: str, stored_at: float, value: dict) -> None:
+        await self.shared.set(f"search:{key}", zlib.compress(json.dumps([stored_at, value]).encode()), self.ttl)
+
+    def _memory_set(self, key: str, stored_at: float, value: dict) -> None:
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        """
+        Returns a fresh cached response, or None.
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                SEARCH_CACHE.labels("hit").inc()
+                return entry[1]
+            del self._memory[key]
+            self._counters["expired"] += 1
+
+        if self.shared is not None or self.path:
+            if self.shared is not None:
+                entry = await self._shared_get(key)
+            else:
+                entry = await asyncio.to_thread(self._disk_get, key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory_set(key, *entry)
+                self._counters["disk_hits"] += 1
+                SEARCH_CACHE.labels("hit").inc()
+                return entry[1]
+
+        self._counters["misses"] += 1
+        SEARCH_CACHE.labels("miss").inc()
+        return None
+
+    async def set(self, key: str, value: dict) -> None:
+        stored_at = time.time()
+        self._memory_set(key, stored_at, value)
+        if self.shared is not None:
+            await self._shared_set(key, stored_at, value)
+        elif self.path:
+            await asyncio.to_thread(self._disk_set, key, stored_at, value)
+        self._counters["stores"] += 1
+
+    def stats(self) -> dict:
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            "ttl": self.ttl,
+            "memory_entries": len(self._memory),
+            **self._counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+
+search_cache = SearchCache(
+    path=os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite3") or None,
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", 900)),
+    memory_items=int(os.getenv("SEARCH_CACHE_MEMORY_ITEMS", 512)),
+    disk_items=int(os.getenv("SEARCH_CACHE_DISK_ITEMS", 10000)),
+    # The SQLite store is already shared by workers on a machine
+    shared=shared_state if shared_state is not None and shared_state.scope == "cluster" else None,
+)
+
+
+
 @traceable
-async def tavily_search(search_queries: list[str], depth: Literal['basic', 'advanced']) -> list[dict]:
+async def _search_keys(keys: dict[str, str], depth: Literal['basic', 'advanced'], max_results: int, use_cache: bool) -> dict[str, dict]:
+    """
+    Searches each query once, reading and filling the search cache. Returns responses by cache key.
+    """
+    responses = {}
+    if use_cache:
+        for key in keys:
+            response = await search_cache.get(key)
+            if response is not None:
+                responses[key] = response
+
+    fresh, errors = await search_client.search_many(
+        [query for key, query in keys.items() if key not in responses],
+        search_depth = depth,
+        # topic = "news",
+        max_results = max_results,
+        include_raw_content = True
+    )
+    for key, query in keys.items():
+        if query in fresh:
+            await search_cache.set(key, fresh[query])
+            responses[key] = fresh[query]
+
+    # Failed queries are dropped so one bad query doesn't fail the report
+    for error in errors:
+        logger.warning(str(error))
+
+    return responses
+
+
+
+class SearchBroker:
+    """
+    Coalesces the web searches of one report.
+
+    A report's sections research in parallel and often come up with the same or near-identical
+    queries. Each normalized query is searched once per report: sections asking for a query that
+    is already in flight await the same task, and later sections reuse its response. Each section
+    still gets back only the responses for its own queries.
+    """
+
+    # Totals across every report in the process
+    _totals = {
+        "reports": 0,
+        "queries": 0,
+        "searches": 0,
+        "searches_saved": 0,
+    }
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._counters = {
+            "queries": 0,
+            "searches": 0,
+            "searches_saved": 0,
+        }
+        SearchBroker._totals["reports"] += 1
+
+    def _count(self, name: str, n: int) -> None:
+        self._counters[name] += n
+        SearchBroker._totals[name] += n
+
+    async def search(self, keys: dict[str, str], depth: Literal['basic', 'advanced'], max_results: int, use_cache: bool) -> dict[str, dict]:
+        """
+        Returns responses by cache key, searching only the keys no other section has asked for.
+        """
+        missing = {key: query for key, query in keys.items() if key not in self._tasks}
+        self._count("queries", len(keys))
+        self._count("searches", len(missing))
+
+        # One task per query, so a section only waits on its own queries
+        for key, query in missing.items():
+            self._tasks[key] = asyncio.create_task(_search_keys({key: query}, depth, max_results, use_cache))
+
+        tasks = [self._tasks[key] for key in keys]
+        # Shielded so a cancelled section doesn't cancel searches other sections are waiting on
+        outcomes = await asyncio.shield(asyncio.gather(*tasks, return_exceptions=True))
+
+        responses = {}
+        for key, task, outcome in zip(keys, tasks, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning(f"Search for {keys[key]!r} failed: {outcome}")
+            if isinstance(outcome, BaseException) or key not in outcome:
+                # Failed searches (which `_search_keys` drops) can be retried by a later section
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+                continue
+            responses[key] = outcome[key]
+            # Only a search another section's task actually answered was saved
+            if key not in missing:
+                self._count("searches_saved", 1)
+                SEARCHES_COALESCED.inc()
+        return responses
+
+    def stats(self) -> dict:
+        return dict(self._counters)
+
+    @classmethod
+    def totals(cls) -> dict:
+        return dict(cls._totals)
+
+
+
+async def tavily_search(
+    search_queries: list[str],
+    depth: Literal['basic', 'advanced'],
+    use_cache: bool = True,
+    broker: Optional[SearchBroker] = None
+) -> list[dict]:
     """
     Does parallel web searches using Tavily Search
 
+    Searches share the process-wide search client, so concurrency and rate limits apply
+    across all reports. Queries that fail after retries are logged and left out.
+
     Parameters:
         search_queries (list[str]): List of search queries as strings
+        depth: Tavily search depth
+        use_cache: Whether to read cached responses (fresh responses are always cached)
+        broker: Report's search broker, to share searches with the report's other sections
 
     Returns:
-        list[dict]: List of dict responses from Tavily Search, each with the format:
+        list[dict]: List of dict responses from Tavily Search for the queries that succeeded, each with the format:
             {
                 "query":  str,
                 "results": [
@@ -67,28 +432,73 @@ async def tavily_search(search_queries: list[str], depth: Literal['basic', 'adva
             }
     """
     
-    async_tavily_client = AsyncTavilyClient()
-    search_tasks = []
+    max_results = 2 # results per query
+
+    # Queries that normalize to the same key are only searched once
+    keys = {}
     for query in search_queries:
-            search_tasks.append(
-                async_tavily_client.search(
-                    query = query,
-                    search_depth = depth,
-                    # topic = "news",
-                    max_results = 2, # results per query
-                    include_raw_content = True
-                )
-            )
+        keys.setdefault(SearchCache.key(query, depth, max_results), query)
+
+    if broker is not None:
+        responses = await broker.search(keys, depth, max_results, use_cache)
+    else:
+        responses = await _search_keys(keys, depth, max_results, use_cache)
 
-    search_results = await asyncio.gather(*search_tasks)
+    return [responses[key] for key in keys if key in responses]
 
-    return search_results
 
 
+# Prompt token budget for source content, by the model that reads it
+SOURCE_TOKEN_BUDGETS = {
+    "gpt-4.1": int(os.getenv("SOURCE_TOKEN_BUDGET_GPT_4_1", 12000)),
+    "o4-mini": int(os.getenv("SOURCE_TOKEN_BUDGET_O4_MINI", 12000)),
+}
+DEFAULT_SOURCE_TOKEN_BUDGET = 12000
+# Once less than this is left of the budget, packing stops tokenizing raw content paragraphs
+MIN_PARAGRAPH_TOKENS = 32
 
-def format_search_results(search_responses: list[dict]) -> str:
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
     """
-    Formats a list of search responses into a string.
+    Returns the tiktoken encoding for a model, defaulting to o200k_base (used by gpt-4.1 and o4-mini).
+    Returns None if the encoding can't be loaded (tiktoken downloads it on first use).
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer for {model}, estimating tokens from length: {e}")
+        return None
+
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+
+def pack_search_results(search_responses: list[dict], model: str = "gpt-4.1") -> tuple[list[dict], dict]:
+    """
+    Packs search results into the sources that fit the model's source token budget once rendered
+    by `render_sources`.
+
+    Sources are deduplicated by URL (`search_sources` collapses near-duplicate copies before this)
+    and taken highest score first. Every source's cleaned content goes in first, then raw content
+    fills the remaining budget paragraph by paragraph, so text is only ever cut on a paragraph
+    boundary. Only text that might fit is tokenized; dropped text is counted from its length.
  
     Parameters:
         search_responses: List of search response dicts with the format:
@@ -106,49 +516,200 @@ def format_search_results(search_responses: list[dict]) -> str:
                 ],
                 "response_time": float
             }
+        model: Model the prompt is for, which sets the token budget and tokenizer
             
     Returns:
-        str: Formatted string with deduplicated sources
+        tuple: Deduplicated sources (title, url, content, and the raw content paragraphs that fit), and
+            a dict of the tokens used and (estimated) dropped
     """
+    budget = SOURCE_TOKEN_BUDGETS.get(model, DEFAULT_SOURCE_TOKEN_BUDGET)
 
-    results = []
+    # Deduplicate by URL, keeping the highest-scoring copy
+    unique_sources = {}
     for response in search_responses:
-        results.extend(response['results'])
-    
-    # Deduplicate by URL
-    unique_sources = {source['url']: source for source in results}
+        for source in response['results']:
+            if source['url'] not in unique_sources or source.get('score', 0) > unique_sources[source['url']].get('score', 0):
+                unique_sources[source['url']] = source
+    sources = sorted(unique_sources.values(), key=lambda source: source.get('score', 0), reverse=True)
 
-    formatted_results = "CONTENT FROM SOURCES:\n\n"
+    header = "CONTENT FROM SOURCES:\n\n"
+    used = count_tokens(header, model)
+    dropped = 0
 
-    for source in unique_sources.values():
-        formatted_results += f"{'-' * 80}\n"
-        formatted_results += f"SOURCE TITLE: {source['title']}\n"
-        formatted_results += f"URL: {source['url']}\n"
-        formatted_results += f"CLEANED CONTENT: {source['content']}"
+    # Cleaned content first, for as many sources as fit
+    packed = []
+    for source in sources:
+        block = _source_block(source)
+        # Closing rule and raw content label are counted with the block
+        tokens = count_tokens(block + f"RAW CONTENT: {'-' * 80}\n\n", model)
+        if used + tokens > budget:
+            dropped += tokens + estimate_tokens(source.get('raw_content') or "")
+            continue
+        used += tokens
+        packed.append((source, block, []))
 
-        raw_content = source.get('raw_content', '') or ""
+    # Then raw content paragraphs, highest-scoring sources first. Once a paragraph doesn't fit,
+    # paragraphs at least as long are taken not to either, without tokenizing them.
+    shortest_miss = float("inf")
+    for source, _, paragraphs in packed:
+        raw_content = source.get('raw_content') or ""
+        if budget - used < MIN_PARAGRAPH_TOKENS:
+            dropped += estimate_tokens(raw_content)
+            continue
+        for paragraph in raw_content.split("\n\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if budget - used < MIN_PARAGRAPH_TOKENS or len(paragraph) >= shortest_miss:
+                dropped += estimate_tokens(paragraph)
+                continue
+            tokens = count_tokens(paragraph + "\n\n", model)
+            if used + tokens <= budget:
+                paragraphs.append(paragraph)
+                used += tokens
+            else:
+                dropped += tokens
+                shortest_miss = len(paragraph)
 
-        # Potentially clean raw content with a lightweight model
+    stats = {
+        "tokens_used": used,
+        "tokens_dropped": dropped,
+        "token_budget": budget,
+        "sources": len(packed),
+        "sources_dropped": len(sources) - len(packed),
+    }
+    return [
+        {
+            "title": source["title"],
+            "url": source["url"],
+            "content": source["content"],
+            "raw_content": "\n\n".join(paragraphs),
+            **({"alternate_urls": source["alternate_urls"]} if source.get("alternate_urls") else {})
+        }
+        for source, _, paragraphs in packed
+    ], stats
 
-        if len(raw_content) > 10000:
-            raw_content = raw_content[:10000] + "... [truncated at 10000 chars]"
 
-        formatted_results += f"RAW CONTENT: {raw_content}\n\n"
-        formatted_results += f"{'-'*80}\n\n"
 
+def _source_block(source: dict) -> str:
+    block = (
+        f"{'-' * 80}\n"
+        f"SOURCE TITLE: {source['title']}\n"
+        f"URL: {source['url']}\n"
+    )
+    # Near-duplicate copies collapsed into this source (see `collapse_near_duplicates`)
+    if source.get("alternate_urls"):
+        block += f"ALSO PUBLISHED AT: {', '.join(source['alternate_urls'])}\n"
+    return block + f"CLEANED CONTENT: {source['content']}\n"
+
+
+
+def render_sources(sources: list[dict]) -> str:
+    """
+    Renders packed sources from `pack_search_results` as prompt text.
+    """
+    formatted_results = "CONTENT FROM SOURCES:\n\n"
+    for source in sources:
+        formatted_results += _source_block(source)
+        if source["raw_content"]:
+            formatted_results += "RAW CONTENT: " + source["raw_content"] + "\n\n"
+        formatted_results += f"{'-'*80}\n\n"
     return formatted_results.strip()
 
 
 
-async def execute_searches(query_list: list[str], depth: Literal['basic', 'advanced'] = 'basic') -> str:
+def format_search_results(search_responses: list[dict], model: str = "gpt-4.1") -> tuple[str, dict]:
+    """
+    Packs search results into a prompt string that fits the model's source token budget.
+
+    Returns:
+        tuple: Formatted string with deduplicated sources, and a dict of the tokens used and dropped
+    """
+    sources, stats = pack_search_results(search_responses, model)
+    return render_sources(sources), stats
+
+
+
+async def _tavily_search_within(
+    search_queries: list[str],
+    depth: Literal['basic', 'advanced'],
+    use_cache: bool,
+    broker: Optional[SearchBroker],
+    timeout: float
+) -> tuple[list[dict], int]:
+    """
+    Searches each query separately, keeping the responses that arrive within `timeout` seconds.
+
+    Returns:
+        tuple: Responses that arrived in time, and the number of queries that didn't
+    """
+    tasks = [asyncio.create_task(tavily_search([query], depth, use_cache, broker)) for query in dict.fromkeys(search_queries)]
+    if not tasks:
+        return [], 0
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    # Searches shared through the broker keep going for the sections waiting on them
+    for task in pending:
+        task.cancel()
+    responses = [response for task in tasks if task in done and not task.exception() for response in task.result()]
+    return responses, len(pending)
+
+
+
+async def search_sources(
+    query_list: list[str],
+    depth: Literal['basic', 'advanced'] = 'basic',
+    use_cache: bool = True,
+    model: str = "gpt-4.1",
+    relevance_query: Optional[str] = None,
+    broker: Optional[SearchBroker] = None,
+    timeout: Optional[float] = None
+) -> tuple[list[dict], dict]:
     """
-    Executes web searches for a list of queries
+    Executes web searches for a list of queries and packs the results, for rendering with `render_sources`
     
     Parameters:
         query_list: List of search queries
+        depth: Tavily search depth
+        use_cache: Whether to read cached search responses
+        model: Model the results are for, which sets the token budget
+        relevance_query: If set, raw content is cut down to the passages most relevant to it
+        broker: Report's search broker, to share searches with the report's other sections
+        timeout: If set, searches that take longer are skipped and counted in `searches_late`
         
     Returns:
-        str: Formatted string of search results
+        tuple: Packed sources, and the tokens used and dropped packing them
+    """
+    late = {}
+    if timeout is None:
+        search_results = await tavily_search(query_list, depth, use_cache, broker)
+    else:
+        search_results, searches_late = await _tavily_search_within(query_list, depth, use_cache, broker, timeout)
+        late = {"searches_late": searches_late}
+    # Copies of the same story are collapsed before ranking, so their passages don't crowd out other sources.
+    # These and packing are CPU-bound, so they run off the event loop.
+    search_results, duplicate_stats = await asyncio.to_thread(collapse_near_duplicates, search_results)
+    passage_stats = {}
+    if relevance_query:
+        search_results, passage_stats = await asyncio.to_thread(rank_search_results, search_results, relevance_query)
+    sources, stats = await asyncio.to_thread(pack_search_results, search_results, model)
+    return sources, {**stats, **duplicate_stats, **passage_stats, **late}
+
+
+
+async def execute_searches(
+    query_list: list[str],
+    depth: Literal['basic', 'advanced'] = 'basic',
+    use_cache: bool = True,
+    model: str = "gpt-4.1",
+    relevance_query: Optional[str] = None,
+    broker: Optional[SearchBroker] = None,
+    timeout: Optional[float] = None
+) -> tuple[str, dict]:
+    """
+    Executes web searches for a list of queries (see `search_sources` for the parameters)
+
+    Returns:
+        tuple: Formatted string of search results, and the tokens used and dropped packing them
     """
-    search_results = await tavily_search(query_list, depth)
-    return format_search_results(search_results)
\ No newline at end of file
+    sources, stats = await search_sources(query_list, depth, use_cache, model, relevance_query, broker, timeout)
+    return render_sources(sources), stats
\ No newline at end of file